@@ -13,57 +13,71 @@ for module_name in [
     del sys.modules[module_name]
 del prefix
 
-from .terminus.clipboard import TerminusClipboardHistoryUpdater  # noqa: E402
-from .terminus.commands import (  # noqa: E402
-    TerminusActivateCommand,
-    TerminusCancelBuildCommand,
-    TerminusClearUndoStackCommand,
-    TerminusCloseAllCommand,
-    TerminusCloseCommand,
-    TerminusCopyCommand,
-    TerminusDeleteWordCommand,
-    TerminusExecCommand,
-    TerminusInitializeViewCommand,
-    TerminusKeypressCommand,
-    TerminusMaximizeCommand,
-    TerminusMinimizeCommand,
-    TerminusOpenCommand,
-    TerminusPasteCommand,
-    TerminusPasteFromHistoryCommand,
-    TerminusPasteTextCommand,
-    TerminusRenameTitleCommand,
-    TerminusResetCommand,
-    TerminusSendStringCommand,
-    ToggleTerminusPanelCommand
-)
-from .terminus.event_listeners import (  # noqa: E402
-    TerminusCoreEventListener
-)
-from .terminus.mouse import (  # noqa: E402
-    TerminusClickCommand,
-    TerminusMouseEventListener,
-    TerminusOpenContextUrlCommand,
-    TerminusOpenImageCommand
-)
-from .terminus.query import TerminusQueryContextListener  # noqa: E402
-from .terminus.render import (  # noqa: E402
-    TerminusCleanupCommand,
-    TerminusRenderCommand,
-    TerminusShowCursorCommand
-)
-from .terminus.theme import (  # noqa: E402
-    TerminusGenerateThemeCommand,
-    TerminusSelectThemeCommand,
-    plugin_loaded as theme_plugin_loaded,
-    plugin_unloaded as theme_plugin_unloaded
-)
-from .terminus.utils import set_settings_on_change  # noqa: E402
-from .terminus.view import (  # noqa: E402
-    TerminusInsertCommand,
-    TerminusNukeCommand,
-    TerminusTrimTrailingLinesCommand
+from .terminus.startup import (  # noqa: E402
+    TerminusShowStartupTimingsCommand,
+    timed,
+    timed_imports
 )
 
+# the terminal emulator and the pty modules are imported when the first terminal is started
+with timed("import"), timed_imports():
+    from .terminus.clipboard import TerminusClipboardHistoryUpdater
+    from .terminus.commands import (
+        TerminusActivateCommand,
+        TerminusCancelBuildCommand,
+        TerminusClearUndoStackCommand,
+        TerminusCloseAllCommand,
+        TerminusCloseCommand,
+        TerminusCopyCommand,
+        TerminusDeleteWordCommand,
+        TerminusExecCommand,
+        TerminusInitializeViewCommand,
+        TerminusKeypressCommand,
+        TerminusMaximizeCommand,
+        TerminusMinimizeCommand,
+        TerminusOpenCommand,
+        TerminusPasteCommand,
+        TerminusPasteFromHistoryCommand,
+        TerminusPasteTextCommand,
+        TerminusRenameTitleCommand,
+        TerminusResetCommand,
+        TerminusSendStringCommand,
+        ToggleTerminusPanelCommand
+    )
+    from .terminus.engine import EngineClient
+    from .terminus.event_listeners import (
+        TerminusCoreEventListener,
+        TerminusViewEventListener
+    )
+    from .terminus.memory import TerminusShowMemoryUsageCommand
+    from .terminus.mouse import (
+        TerminusClickCommand,
+        TerminusMouseEventListener,
+        TerminusOpenContextUrlCommand,
+        TerminusOpenImageCommand
+    )
+    from .terminus.pool import ShellPool
+    from .terminus.query import TerminusQueryContextListener
+    from .terminus.render import (
+        RENDER_SETTINGS,
+        TerminusCleanupCommand,
+        TerminusRenderCommand,
+        TerminusShowCursorCommand
+    )
+    from .terminus.terminal import Terminal
+    from .terminus.theme import (
+        TerminusGenerateThemeCommand,
+        TerminusSelectThemeCommand,
+        plugin_loaded as theme_plugin_loaded,
+        plugin_unloaded as theme_plugin_unloaded
+    )
+    from .terminus.utils import set_settings_on_change
+    from .terminus.view import (
+        TerminusInsertCommand,
+        TerminusNukeCommand,
+        TerminusTrimTrailingLinesCommand
+    )
+
 
 __all__ = [
     "TerminusActivateCommand",
@@ -99,7 +113,10 @@ __all__ = [
     "TerminusSelectThemeCommand",
     "TerminusSendStringCommand",
     "TerminusShowCursorCommand",
+    "TerminusShowMemoryUsageCommand",
+    "TerminusShowStartupTimingsCommand",
     "TerminusTrimTrailingLinesCommand",
+    "TerminusViewEventListener",
     "ToggleTerminusPanelCommand"
 ]
 
@@ -108,7 +125,8 @@ logger = logging.getLogger('Terminus')
 
 
 def plugin_loaded():
-    theme_plugin_loaded()
+    with timed("plugin_loaded"):
+        theme_plugin_loaded()
 
     if not logger.hasHandlers():
         ch = logging.StreamHandler(sys.stdout)
@@ -127,10 +145,17 @@ def plugin_loaded():
 
 
 def plugin_unloaded():
-    # close all terminals
+    # close all terminals, except the ones kept running by the engine server
     for w in sublime.windows():
-        w.run_command("terminus_close_all")
+        w.run_command("terminus_close_all", {"keep_persistent": True})
+
+    ShellPool.instance().clear()
+    # the engines don't report the exits of their terminals once they are shut down
+    Terminal.stop_remote_terminals()
+    EngineClient.instance().shutdown()
 
     theme_plugin_unloaded()
     settings = sublime.load_settings("Terminus.sublime-settings")
     set_settings_on_change(settings, "debug", None)
+    set_settings_on_change(settings, ["min_columns", "max_columns"], None)
+    set_settings_on_change(settings, list(RENDER_SETTINGS), None)
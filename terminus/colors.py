@@ -0,0 +1,94 @@
+import pyte
+
+
+RGB256 = {}
+for c in pyte.graphics.FG_BG_256:
+    RGB256[c] = tuple(int(c[i:i+2], 16) for i in (0, 2, 4))
+
+PALETTE = list(RGB256.items())
+
+# the rgb space is divided into a 32x32x32 cube, each cell keeps the palette colors which
+# could be the closest to any color inside the cell, the candidates of a cell are taken
+# from the ones of its enclosing cell in a coarser 8x8x8 cube, all cells are filled lazily
+CELL_BITS = 3
+COARSE_CELL_BITS = 5
+_cube = [None] * (1 << 3 * (8 - CELL_BITS))
+_coarse_cube = [None] * (1 << 3 * (8 - COARSE_CELL_BITS))
+
+
+def _squared_range(lo, hi, v):
+    """
+    Returns the minimum and the maximum of `(x - v)**2` for `lo <= x <= hi`.
+    """
+    if v < lo:
+        dmin = lo - v
+    elif v > hi:
+        dmin = v - hi
+    else:
+        dmin = 0
+    dmax = max(v - lo, hi - v)
+    return dmin * dmin, dmax * dmax
+
+
+def _cell_candidates(r, g, b, bits, palette):
+    """
+    Returns the colors of the palette which could be the closest to a color in the cell
+    of size `2**bits` which contains `(r, g, b)`.
+    """
+    size = 1 << bits
+    r0 = r >> bits << bits
+    g0 = g >> bits << bits
+    b0 = b >> bits << bits
+    r1 = r0 + size - 1
+    g1 = g0 + size - 1
+    b1 = b0 + size - 1
+
+    bounds = []
+    for c, (r2, g2, b2) in palette:
+        # the weights of the red and the blue channels depend on the red mean
+        rmin, rmax = _squared_range(r0, r1, r2)
+        gmin, gmax = _squared_range(g0, g1, g2)
+        bmin, bmax = _squared_range(b0, b1, b2)
+        lower = (2 + (r0 + r2) / 512) * rmin + 4 * gmin + (2 + (510 - r1 - r2) / 512) * bmin
+        upper = (2 + (r1 + r2) / 512) * rmax + 4 * gmax + (2 + (510 - r0 - r2) / 512) * bmax
+        bounds.append((lower, upper))
+
+    limit = min(upper for _, upper in bounds) + 1e-6
+    # keep the palette order so that ties are resolved as a full scan does
+    return tuple(
+        (c, rgb) for (c, rgb), (lower, _) in zip(palette, bounds) if lower <= limit)
+
+
+def _get_candidates(r, g, b):
+    index = (r >> CELL_BITS) << 10 | (g >> CELL_BITS) << 5 | b >> CELL_BITS
+    candidates = _cube[index]
+    if candidates is None:
+        coarse_index = (r >> COARSE_CELL_BITS) << 6 | (g >> COARSE_CELL_BITS) << 3 | \
+            b >> COARSE_CELL_BITS
+        coarse_candidates = _coarse_cube[coarse_index]
+        if coarse_candidates is None:
+            coarse_candidates = _coarse_cube[coarse_index] = _cell_candidates(
+                r, g, b, COARSE_CELL_BITS, PALETTE)
+        candidates = _cube[index] = _cell_candidates(r, g, b, CELL_BITS, coarse_candidates)
+    return candidates
+
+
+# https://en.wikipedia.org/wiki/Color_difference#sRGB
+def get_closest_color(c):
+    r = int(c[0:2], 16)
+    g = int(c[2:4], 16)
+    b = int(c[4:6], 16)
+    candidates = _get_candidates(r, g, b)
+    if len(candidates) == 1:
+        return candidates[0][0]
+
+    dmin = 1000000
+    closest_color = "000000"
+    for c, (r2, g2, b2) in candidates:
+        redmean = (r + r2) / 2
+        d = (2 + redmean / 256) * (r - r2) ** 2 + 4 * \
+            (g - g2)**2 + (2 + (255-redmean) / 256) * (b - b2)**2
+        if d < dmin:
+            dmin = d
+            closest_color = c
+    return closest_color
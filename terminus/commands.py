@@ -9,11 +9,13 @@ import logging
 from .clipboard import g_clipboard_history
 from .const import DEFAULT_PANEL, DEFAULT_TITLE, EXEC_PANEL, CONTINUATION
 from .key import get_key_code
+from .login_env import LoginEnvironment
 from .recency import RecencyManager
 from .terminal import Terminal
 from .utils import available_panel_name
 from .utils import shlex_split
 from .view import get_panel_window, get_panel_name, panel_is_visible, view_is_visible
+from .view import register_panel, unregister_panel
 
 
 KEYS = [
@@ -54,6 +56,7 @@ class TerminusOpenCommand(sublime_plugin.WindowCommand):
             paths=[],
     ):
         config = None
+        login_env = None
 
         st_vars = self.window.extract_variables()
 
@@ -93,7 +96,15 @@ class TerminusOpenCommand(sublime_plugin.WindowCommand):
                 comspec = os.environ.get("COMSPEC", "cmd.exe")
                 cmd_to_run = [comspec, "/c"] + shlex_split(shell_cmd)
             elif sys.platform == "darwin":
-                cmd_to_run = ["/usr/bin/env", "bash", "-l", "-c", shell_cmd]
+                settings = sublime.load_settings("Terminus.sublime-settings")
+                if settings.get("cache_login_environment", False):
+                    login_env = LoginEnvironment.get(
+                        "bash", ttl=settings.get("login_environment_ttl", 3600))
+                if login_env is not None:
+                    # the profile scripts are not sourced again
+                    cmd_to_run = ["/usr/bin/env", "bash", "-c", shell_cmd]
+                else:
+                    cmd_to_run = ["/usr/bin/env", "bash", "-l", "-c", shell_cmd]
             else:
                 cmd_to_run = ["/usr/bin/env", "bash", "-c", shell_cmd]
 
@@ -123,6 +134,9 @@ class TerminusOpenCommand(sublime_plugin.WindowCommand):
         else:
             _env = {}
 
+        if login_env is not None:
+            _env = dict(login_env, **_env)
+
         _env["TERMINUS_SUBLIME"] = "1"  # for backward compatibility
         _env["TERM_PROGRAM"] = "Terminus-Sublime"
 
@@ -210,6 +224,7 @@ class TerminusOpenCommand(sublime_plugin.WindowCommand):
 
             if show_in_panel:
                 view = window.get_output_panel(panel_name)
+                register_panel(window, panel_name, view)
             else:
                 view = window.new_file(syntax="Terminus View.sublime-syntax")
 
@@ -390,6 +405,7 @@ class TerminusCloseCommand(sublime_plugin.TextCommand):
         if panel_name:
             window = get_panel_window(view)
             if window:
+                unregister_panel(view)
                 window.destroy_output_panel(panel_name)
         else:
             view.close()
@@ -397,7 +413,7 @@ class TerminusCloseCommand(sublime_plugin.TextCommand):
 
 class TerminusCloseAllCommand(sublime_plugin.WindowCommand):
 
-    def run(self):
+    def run(self, keep_persistent=False):
         window = self.window
         views = []
         for view in window.views():
@@ -408,6 +424,11 @@ class TerminusCloseAllCommand(sublime_plugin.WindowCommand):
             if view and view.settings().get("terminus_view"):
                 views.append(view)
         for view in views:
+            if keep_persistent and view.settings().get("terminus_view.reactivable"):
+                # the terminal is attached again when the view is reactivated
+                terminal = Terminal.from_id(view.id())
+                if terminal and terminal.persistent:
+                    continue
             view.run_command("terminus_close")
 
 
@@ -473,6 +494,9 @@ class TerminusInitializeViewCommand(sublime_plugin.TextCommand):
 
         view_settings.set("terminus_view", True)
         view_settings.set("terminus_view.args", kwargs)
+        # the view event listeners are otherwise attached when the view is activated
+        if hasattr(sublime_plugin, "check_view_event_listeners"):
+            sublime_plugin.check_view_event_listeners(view)
 
         if "tag" in kwargs:
             view_settings.set("terminus_view.tag", kwargs["tag"])
@@ -539,7 +563,7 @@ class TerminusInitializeViewCommand(sublime_plugin.TextCommand):
 
 class TerminusActivateCommand(sublime_plugin.TextCommand):
 
-    def run(self, _, **kwargs):
+    def run(self, _, engine_tid=None, **kwargs):
         view = self.view
         view.run_command("terminus_initialize_view", kwargs)
         Terminal.cull_terminals()
@@ -555,7 +579,8 @@ class TerminusActivateCommand(sublime_plugin.TextCommand):
             tag=kwargs["tag"],
             auto_close=kwargs["auto_close"],
             cancellable=kwargs["cancellable"],
-            timeit=kwargs["timeit"]
+            timeit=kwargs["timeit"],
+            engine_tid=engine_tid
         )
         recency_manager = RecencyManager.from_view(view)
         if recency_manager:
@@ -592,18 +617,22 @@ class TerminusResetCommand(sublime_plugin.TextCommand):
             return
 
         def run_detach():
-            terminal.detach_view()
+            view.run_command("terminus_render", {"detach": True})
 
             def run_sync():
+                offset = terminal.offset
                 if terminal.show_in_panel:
                     panel_name = terminal.panel_name
                     window = get_panel_window(view)
+                    unregister_panel(view)
                     window.destroy_output_panel(panel_name)  # do not reuse
                     new_view = window.get_output_panel(panel_name)
+                    register_panel(window, panel_name, new_view)
 
                     def run_attach():
                         new_view.run_command("terminus_initialize_view", args)
-                        terminal.attach_view(new_view)
+                        terminal.attach_view(new_view, offset)
+                        new_view.run_command("terminus_render")
                         window.run_command("show_panel", {"panel": "output.{}".format(panel_name)})
                         window.focus_view(new_view)
                 else:
@@ -620,13 +649,15 @@ class TerminusResetCommand(sublime_plugin.TextCommand):
                         window.run_command("set_layout", layout)
                         if has_focus:
                             window.focus_view(new_view)
-                        terminal.attach_view(new_view)
+                        terminal.attach_view(new_view, offset)
+                        new_view.run_command("terminus_render")
 
                 sublime.set_timeout_async(run_attach)
 
             sublime.set_timeout(run_sync)
 
-        sublime.set_timeout_async(run_detach)
+        # the view is detached on the main thread, so no render tick runs in between
+        sublime.set_timeout(run_detach)
 
 
 class TerminusRenameTitleCommand(sublime_plugin.TextCommand):
@@ -677,27 +708,27 @@ class TerminusMaximizeCommand(sublime_plugin.TextCommand):
         terminal = Terminal.from_id(view.id())
 
         def run_detach():
-            all_text = view.substr(sublime.Region(0, view.size()))
-            terminal.detach_view()
+            view.run_command("terminus_render", {"detach": True})
 
             def run_sync():
                 offset = terminal.offset
                 window = get_panel_window(view)
+                unregister_panel(view)
                 window.destroy_output_panel(terminal.panel_name)
                 new_view = window.new_file(syntax="Terminus View.sublime-syntax")
 
                 def run_attach():
                     new_view.run_command("terminus_initialize_view")
-                    new_view.run_command(
-                        "terminus_insert", {"point": 0, "character": all_text})
                     terminal.show_in_panel = False
                     terminal.attach_view(new_view, offset)
+                    new_view.run_command("terminus_render")
 
                 sublime.set_timeout_async(run_attach)
 
             sublime.set_timeout(run_sync)
 
-        sublime.set_timeout_async(run_detach)
+        # the view is detached on the main thread, so no render tick runs in between
+        sublime.set_timeout(run_detach)
 
 
 def dont_close_windows_when_empty(func):
@@ -728,8 +759,7 @@ class TerminusMinimizeCommand(sublime_plugin.TextCommand):
         terminal = Terminal.from_id(view.id())
 
         def run_detach():
-            all_text = view.substr(sublime.Region(0, view.size()))
-            terminal.detach_view()
+            view.run_command("terminus_render", {"detach": True})
 
             @dont_close_windows_when_empty
             def run_sync():
@@ -744,29 +774,30 @@ class TerminusMinimizeCommand(sublime_plugin.TextCommand):
                         panel_name = available_panel_name(window, DEFAULT_PANEL)
 
                 new_view = window.get_output_panel(panel_name)
+                register_panel(window, panel_name, new_view)
 
                 def run_attach():
                     terminal.show_in_panel = True
                     terminal.panel_name = panel_name
                     new_view.run_command("terminus_initialize_view", {"panel_name": panel_name})
-                    new_view.run_command(
-                        "terminus_insert", {"point": 0, "character": all_text})
                     window.run_command("show_panel", {"panel": "output.{}".format(panel_name)})
                     window.focus_view(new_view)
                     terminal.attach_view(new_view, offset)
+                    new_view.run_command("terminus_render")
 
                 sublime.set_timeout_async(run_attach)
 
             sublime.set_timeout(run_sync)
 
-        sublime.set_timeout_async(run_detach)
+        # the view is detached on the main thread, so no render tick runs in between
+        sublime.set_timeout(run_detach)
 
 
 class TerminusKeypressCommand(sublime_plugin.TextCommand):
 
     def run(self, _, **kwargs):
         terminal = Terminal.from_id(self.view.id())
-        if not terminal or not terminal.process.isalive():
+        if not terminal or not terminal.alive:
             return
         # self.view.run_command("terminus_render")
         self.view.run_command("terminus_show_cursor")
@@ -1095,7 +1126,7 @@ class TerminusSendStringCommand(TerminusFindTerminalMixin, sublime_plugin.Window
 
         if not terminal:
             raise Exception("no terminal found")
-        elif not terminal.process.isalive():
+        elif not terminal.alive:
             raise Exception("process is terminated")
 
         if terminal.show_in_panel:
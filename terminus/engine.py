@@ -0,0 +1,874 @@
+import os
+import sys
+import time
+import json
+import uuid
+import base64
+import socket
+import struct
+import logging
+import threading
+import subprocess
+import importlib.util
+from queue import Queue
+from collections import deque
+
+from .reaper import ExitWatcher, Reaper, poll, wait
+from .utils import intermission
+
+logger = logging.getLogger('Terminus')
+
+
+# the length prefix of the messages
+HEADER = struct.Struct(">I")
+
+# the version of the messages, the servers of the other versions are not used
+VERSION = 3
+
+# the commands of the plugin which are run on the terminals of the engine
+TERMINAL_COMMANDS = {"write", "resize", "refresh", "pause", "resume", "kill"}
+
+# the directory which contains the `terminus` package, it is put on the path of the engine
+# processes so that they run `python -m terminus.engine`
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the packages which the engine processes import, they are found where the plugin host finds
+# them
+DEPENDENCIES = ("pyte", "wcwidth", "winpty" if sys.platform.startswith("win") else "ptyprocess")
+
+# the time in seconds after which the terminals without connections are terminated
+DETACHED_TIMEOUT = 24 * 3600
+# the time in seconds after which a server without terminals and connections exits
+SERVER_IDLE_TIMEOUT = 10
+
+
+def write_message(f, message):
+    """
+    Write a message, a tuple of plain data, as JSON. The tuples are read back as lists.
+    """
+    data = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    f.write(HEADER.pack(len(data)) + data)
+    f.flush()
+
+
+def read_message(f):
+    """
+    Return the next message, or None at the end of the stream.
+    """
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    size, = HEADER.unpack(header)
+    data = f.read(size)
+    if len(data) < size:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+def runtime_directory():
+    """
+    Return a directory which only the user can access, for the socket of the server.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if not base:
+        import sublime
+        base = sublime.cache_path()
+    path = os.path.join(base, "Terminus")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if st.st_uid != os.getuid() or not os.path.isdir(path) or os.path.islink(path):
+        raise OSError("{} is not owned by the user".format(path))
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+def server_address():
+    return os.path.join(runtime_directory(), "engine-{}.sock".format(VERSION))
+
+
+def peer_uid(sock):
+    """
+    Return the uid of the process on the other end of a Unix socket, or None if it is not
+    supported by the platform.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]
+
+
+def is_trusted(sock, address):
+    """
+    Whether the server on `sock` is run by the user.
+    """
+    uid = peer_uid(sock)
+    if uid is not None:
+        return uid == os.getuid()
+    return os.stat(address).st_uid == os.getuid()
+
+
+class EngineError(Exception):
+    pass
+
+
+def engine_path():
+    """
+    Return the directories put on the path of the engine processes, the one of the
+    `terminus` package and the ones of its dependencies. The rest of the path of the plugin
+    host, e.g. its standard library, is left out.
+    """
+    path = [PACKAGE_ROOT]
+    for name in DEPENDENCIES:
+        spec = importlib.util.find_spec(name)
+        if not spec:
+            continue
+        if spec.submodule_search_locations:
+            location = list(spec.submodule_search_locations)[0]
+        else:
+            location = spec.origin
+        directory = os.path.dirname(location)
+        if directory not in path:
+            path.append(directory)
+    return path
+
+
+def start_engine(python, *args, **kwargs):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(engine_path()))
+    if sys.platform.startswith("win"):
+        kwargs["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
+    return subprocess.Popen([python, "-m", "terminus.engine"] + list(args), env=env, **kwargs)
+
+
+def check_engine(python):
+    """
+    Raise `EngineError` if `python` cannot run the engine.
+    """
+    try:
+        process = start_engine(
+            python, "--check", stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        output, _ = process.communicate(timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise EngineError("cannot run the engine python {!r}: {}".format(python, e))
+    if process.returncode != 0:
+        lines = output.decode("utf-8", "replace").strip().splitlines()
+        raise EngineError(
+            "the engine python {!r} cannot run the terminals: {}. Set \"engine_python\" to "
+            "a Python 3.8 or later interpreter.".format(python, lines[-1] if lines else ""))
+
+
+def connect_server(python, timeout=5):
+    """
+    Connect to the engine server, the server is started if it is not running.
+    """
+    address = server_address()
+    startt = time.time()
+    started = False
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            if not started:
+                # the server outlives the plugin host
+                start_engine(
+                    python, "--server", address, start_new_session=True,
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL)
+                started = True
+            elif time.time() - startt > timeout:
+                raise
+            time.sleep(0.05)
+            continue
+        if not is_trusted(sock, address):
+            sock.close()
+            raise OSError("the engine server at {} is not run by the user".format(address))
+        return sock
+
+
+def encode_frame(frame):
+    """
+    Encode a frame by plain tuples. The dirty rows are shipped as the text and the style
+    runs of `HistoryLine` instead of the cells.
+    """
+    from .ptty import HistoryLine
+
+    columns = frame.columns
+    dirty = tuple(
+        (y, tuple(HistoryLine.from_buffer_line(buffer_line, columns)))
+        for y, (buffer_line, _, _) in frame.dirty.items())
+    return tuple(frame._replace(
+        history=tuple(map(tuple, frame.history)), dirty=dirty, mode=tuple(frame.mode)))
+
+
+def decode_snapshot(data):
+    """
+    Return the frame which renders a screen snapshot of `encode_screen` from scratch.
+    """
+    from .ptty import TerminalScreen
+    from .snapshot import decode_screen
+
+    screen = TerminalScreen(
+        1, 1, process=None, history=None,
+        clear_callback=lambda: None, reset_callback=lambda: None)
+    decode_screen(base64.b64decode(data), screen)
+    return screen.take_frame(clear_scrollback=True)
+
+
+def _decode_history_line(data):
+    from .ptty import HistoryLine
+
+    text, runs, linefeed = data
+    return HistoryLine(
+        text, tuple((start, length, tuple(style)) for start, length, style in runs), linefeed)
+
+
+def decode_frame(data):
+    from .ptty import Frame
+
+    frame = Frame(*data)
+    dirty = {}
+    for y, line in frame.dirty:
+        line = _decode_history_line(line)
+        # the whole row is rendered as the columns of the cells are not known
+        dirty[y] = (line, line.linefeed, None)
+    return frame._replace(
+        history=tuple(_decode_history_line(line) for line in frame.history),
+        dirty=dirty,
+        cursor=tuple(frame.cursor),
+        mode=frozenset(frame.mode),
+        images=tuple(tuple(image) for image in frame.images))
+
+
+class EngineTerminal:
+    """
+    A terminal run by the engine process. The output of the process is fed to the emulator
+    and the frames are sent to the plugin, like `Terminal._start_rendering` does in the
+    plugin host. A persistent terminal keeps its scrollback, so that the whole terminal
+    can be sent to the connection which attaches it.
+    """
+
+    def __init__(self, engine, tid, persistent=False):
+        # the connection which the frames are sent to, None if it is detached
+        self.engine = engine
+        self.tid = tid
+        self.persistent = persistent
+        self.scrollback = None
+        self.detached_at = None
+        self.exited = False
+        self.lock = threading.Lock()
+        self.data = ""
+        self.done = False
+        # frames are not sent while the terminal is detached from its view
+        self.paused = False
+        self.clear_scrollback = False
+        self.resized = False
+        # the cursor and the title of the last frame
+        self.state = None
+        self.first_output = False
+        self.writes = Queue()
+
+    def start(self, cmd, cwd, env, size, history):
+        from .ptty import TerminalPtyProcess, TerminalScreen, TerminalStream
+
+        size = tuple(size)
+        if self.persistent:
+            self.scrollback = deque(maxlen=history)
+        self.process = TerminalPtyProcess.spawn(cmd, cwd=cwd, env=env, dimensions=size)
+        self.screen = TerminalScreen(
+            size[1], size[0], process=self.process, history=history,
+            clear_callback=self.clear_callback, reset_callback=self.reset_callback)
+        self.stream = TerminalStream(self.screen)
+        self.screen.set_show_image_callback(self.show_image)
+
+        threading.Thread(target=self.reader, daemon=True).start()
+        threading.Thread(target=self.writer, daemon=True).start()
+        threading.Thread(target=self.renderer, daemon=True).start()
+        ExitWatcher.instance().watch(self.process, self.on_exit)
+
+    def reader(self):
+        while True:
+            try:
+                temp = self.process.read(1024)
+            except EOFError:
+                break
+
+            with self.lock:
+                if temp and not self.first_output:
+                    self.first_output = True
+                    self.send("output", self.tid)
+                self.data += temp
+                if self.done:
+                    break
+
+        self.done = True
+
+    def writer(self):
+        # the writes may block, e.g. when the process doesn't read its input
+        while True:
+            string = self.writes.get()
+            if string is None:
+                return
+            try:
+                self.process.write(string)
+            except Exception as e:
+                logger.debug("cannot write to terminal {}: {}".format(self.tid, e))
+
+    def renderer(self):
+        while True:
+            with intermission(period=0.03), self.lock:
+                self.render()
+                if self.done:
+                    break
+
+        with self.lock:
+            self.render()
+        self.writes.put(None)
+        wait(self.process, 0.2)
+        with self.lock:
+            self.exited = True
+            engine = self.engine
+        # the exit is reported when the terminal is attached again otherwise
+        if engine:
+            self.report_exit(engine)
+
+    def report_exit(self, engine):
+        engine.send("exit", self.tid, self.process.exitstatus, self.process.signalstatus)
+        engine.remove(self.tid)
+
+    def send(self, *message):
+        engine = self.engine
+        if engine:
+            engine.send(*message)
+
+    def render(self):
+        if self.data:
+            self.stream.feed(self.data)
+            self.data = ""
+        if self.engine and not self.paused and self.need_frame():
+            self.push_frame()
+
+    def need_frame(self):
+        screen = self.screen
+        cursor = screen.cursor
+        state = (cursor.x, cursor.y, cursor.hidden, screen.title)
+        if screen.dirty or self.clear_scrollback or self.resized or state != self.state:
+            self.state = state
+            self.resized = False
+            return True
+        return False
+
+    def push_frame(self, images=()):
+        frame = self.screen.take_frame(clear_scrollback=self.clear_scrollback, images=images)
+        self.clear_scrollback = False
+        if self.scrollback is not None:
+            if frame.clear_scrollback:
+                self.scrollback.clear()
+            self.scrollback.extend(frame.history)
+        self.send("frame", self.tid, encode_frame(frame))
+
+    def on_exit(self):
+        def finish():
+            self.done = True
+
+        # give the reader a moment to drain the output
+        threading.Timer(0.1, finish).start()
+
+    def clear_callback(self):
+        self.clear_scrollback = True
+
+    def reset_callback(self):
+        self.send("reset", self.tid)
+
+    def show_image(self, data, args, cr=None):
+        if "inline" not in args or not args["inline"]:
+            return
+        cursor = self.screen.cursor
+        self.push_frame(images=[(data, args, cursor.y, cursor.x)])
+        if cr:
+            self.screen.index()
+
+    def write(self, string):
+        self.writes.put(string)
+
+    def resize(self, lines, columns):
+        with self.lock:
+            try:
+                self.process.setwinsize(lines, columns)
+                self.screen.resize(lines, columns)
+            except RuntimeError:
+                pass
+            self.resized = True
+
+    def refresh(self, rows=None):
+        with self.lock:
+            if rows is None:
+                rows = range(self.screen.lines)
+            self.screen.dirty.update(rows)
+
+    def pause(self):
+        with self.lock:
+            self.paused = True
+
+    def resume(self):
+        with self.lock:
+            self.paused = False
+            self.screen.dirty.update(range(self.screen.lines))
+
+    def attach(self, engine, size):
+        """
+        Send the screen and the scrollback to `engine` and the frames afterwards.
+        """
+        from .snapshot import encode_screen
+
+        with self.lock:
+            self.engine = engine
+            self.detached_at = None
+            self.paused = False
+            screen = self.screen
+            size = tuple(size)
+            if size != (screen.lines, screen.columns):
+                try:
+                    self.process.setwinsize(*size)
+                    screen.resize(*size)
+                except RuntimeError:
+                    pass
+            screen.dirty.update(range(screen.lines))
+            # the view is cleared before the scrollback is rendered
+            frame = screen.take_frame(clear_scrollback=True)
+            self.clear_scrollback = False
+            self.scrollback.extend(frame.history)
+            cursor = screen.cursor
+            self.state = (cursor.x, cursor.y, cursor.hidden, screen.title)
+            if screen.alternate_buffer_mode:
+                # the snapshots keep the primary screen only
+                frame = frame._replace(history=tuple(self.scrollback))
+                engine.send("frame", self.tid, encode_frame(frame))
+            else:
+                # the whole screen is shipped in the compact binary format
+                data = encode_screen(screen, history=self.scrollback)
+                engine.send("snapshot", self.tid, base64.b64encode(data).decode("ascii"))
+            if self.first_output:
+                engine.send("output", self.tid)
+            exited = self.exited
+        if exited:
+            self.report_exit(engine)
+
+    def detach(self):
+        with self.lock:
+            self.engine = None
+            self.detached_at = time.time()
+
+    def kill(self):
+        Reaper.instance().terminate(self.process)
+
+
+class Engine:
+    """
+    A connection of the engine process, it runs the terminals requested by the messages
+    from `rfile` and sends their frames to `wfile`. The terminals of a server are shared by
+    its connections and they are kept running when their connections are closed.
+    """
+
+    def __init__(self, rfile, wfile, server=None):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.server = server
+        self.lock = threading.Lock()
+        if server:
+            self.terminals = server.terminals
+            self.terminals_lock = server.lock
+        else:
+            self.terminals = {}
+            self.terminals_lock = threading.Lock()
+
+    def send(self, *message):
+        with self.lock:
+            try:
+                write_message(self.wfile, message)
+            except (OSError, ValueError):
+                pass
+
+    def remove(self, tid):
+        with self.terminals_lock:
+            self.terminals.pop(tid, None)
+
+    def serve(self):
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except OSError:
+                message = None
+            if message is None:
+                break
+            command, tid, args = message[0], message[1], message[2:]
+            if command == "spawn":
+                terminal = EngineTerminal(self, tid, persistent=self.server is not None)
+                with self.terminals_lock:
+                    self.terminals[tid] = terminal
+                try:
+                    terminal.start(*args)
+                except Exception as e:
+                    self.remove(tid)
+                    self.send("error", tid, str(e))
+                    self.send("exit", tid, None, None)
+                continue
+            with self.terminals_lock:
+                terminal = self.terminals.get(tid)
+            if command == "attach":
+                self.send("attached", tid, terminal is not None)
+                if terminal:
+                    terminal.attach(self, *args)
+            elif terminal and command in TERMINAL_COMMANDS:
+                getattr(terminal, command)(*args)
+
+        with self.terminals_lock:
+            terminals = [t for t in self.terminals.values() if t.engine is self]
+        if self.server:
+            for terminal in terminals:
+                terminal.detach()
+            return
+
+        # the plugin host is gone, terminate the processes before exiting
+        for terminal in terminals:
+            terminal.kill()
+        deadline = time.time() + 3
+        while time.time() < deadline and any(poll(t.process) for t in terminals):
+            time.sleep(0.05)
+
+
+class EngineServer:
+    """
+    The engine server listens to a Unix socket and keeps the terminals running while no
+    plugin host is connected, e.g. during plugin reloads and editor restarts.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.lock = threading.Lock()
+        self.terminals = {}
+        self.connections = 0
+
+    def serve(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.address)
+            # another server is running
+            sock.close()
+            return
+        except OSError:
+            pass
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        umask = os.umask(0o077)
+        try:
+            sock.bind(self.address)
+        finally:
+            os.umask(umask)
+        sock.listen()
+        sock.settimeout(1)
+
+        idle_since = time.time()
+        try:
+            while True:
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    pass
+                else:
+                    uid = peer_uid(conn)
+                    if uid is not None and uid != os.getuid():
+                        conn.close()
+                        continue
+                    conn.settimeout(None)
+                    with self.lock:
+                        self.connections += 1
+                    threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+                now = time.time()
+                with self.lock:
+                    terminals = list(self.terminals.values())
+                    busy = terminals or self.connections
+                for terminal in terminals:
+                    if terminal.detached_at and now - terminal.detached_at > DETACHED_TIMEOUT:
+                        if terminal.exited:
+                            with self.lock:
+                                self.terminals.pop(terminal.tid, None)
+                        else:
+                            terminal.kill()
+                if busy:
+                    idle_since = now
+                elif now - idle_since > SERVER_IDLE_TIMEOUT:
+                    break
+        finally:
+            sock.close()
+            os.unlink(self.address)
+
+    def handle(self, conn):
+        try:
+            Engine(conn.makefile("rb"), conn.makefile("wb"), server=self).serve()
+        finally:
+            conn.close()
+            with self.lock:
+                self.connections -= 1
+
+
+class RemoteProcess:
+    """
+    The stand-in of the process of a terminal run by an engine process.
+    """
+
+    def __init__(self, engine, tid, size):
+        self.engine = engine
+        self.tid = tid
+        self.size = size
+        # whether the terminal is kept running by the server when the plugin is unloaded
+        self.persistent = engine.persistent
+        self.exitstatus = None
+        self.signalstatus = None
+        self.terminated = False
+        # the terminal modes of the last frame
+        self.mode = frozenset()
+
+    def isalive(self):
+        return not self.terminated
+
+    def write(self, string):
+        self.engine.send("write", self.tid, string)
+
+    def setwinsize(self, rows, cols):
+        self.size = (rows, cols)
+        self.engine.send("resize", self.tid, rows, cols)
+
+    def refresh(self, rows=None):
+        self.engine.send("refresh", self.tid, rows)
+
+    def pause(self):
+        self.engine.send("pause", self.tid)
+
+    def resume(self):
+        self.engine.send("resume", self.tid)
+
+    def terminate(self, force=False):
+        self.engine.send("kill", self.tid)
+
+
+class EngineProcess:
+    """
+    An engine process and the terminals it runs, seen from the plugin host. If `server` is
+    set, it is a connection to the engine server instead of a child process.
+    """
+
+    def __init__(self, python, server=False):
+        self.persistent = server
+        if server:
+            self.socket = connect_server(python)
+            self.rfile = self.socket.makefile("rb")
+            self.wfile = self.socket.makefile("wb")
+            self.name = "server"
+        else:
+            self.socket = None
+            popen = start_engine(python, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.rfile = popen.stdout
+            self.wfile = popen.stdin
+            self.name = "process {}".format(popen.pid)
+        self.lock = threading.Lock()
+        # tid -> (terminal, process)
+        self.terminals = {}
+        # tid -> [event, attached] of the terminals being attached
+        self._attaching = {}
+        self.closed = False
+        threading.Thread(target=self.dispatch, daemon=True).start()
+
+    def send(self, *message):
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                write_message(self.wfile, message)
+            except (OSError, ValueError) as e:
+                logger.debug("cannot send to the engine {}: {}".format(self.name, e))
+
+    def spawn(self, terminal, tid, cmd, cwd, env, size, history):
+        process = RemoteProcess(self, tid, size)
+        with self.lock:
+            self.terminals[tid] = (terminal, process)
+        self.send("spawn", tid, cmd, cwd, env, size, history)
+        return process
+
+    def attach(self, terminal, tid, size, timeout=2):
+        """
+        Attach a terminal which is run by the server, return None if there is no such
+        terminal.
+        """
+        process = RemoteProcess(self, tid, size)
+        event = threading.Event()
+        with self.lock:
+            self.terminals[tid] = (terminal, process)
+            self._attaching[tid] = [event, False]
+        self.send("attach", tid, size)
+        event.wait(timeout)
+        with self.lock:
+            _, attached = self._attaching.pop(tid)
+            if not attached:
+                self.terminals.pop(tid, None)
+        return process if attached else None
+
+    def dispatch(self):
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except Exception as e:
+                logger.error("engine {} fails: {}".format(self.name, e))
+                message = None
+            if message is None:
+                break
+            command, tid, args = message[0], message[1], message[2:]
+            with self.lock:
+                if command == "attached":
+                    if tid in self._attaching:
+                        self._attaching[tid][1] = args[0]
+                        self._attaching[tid][0].set()
+                    continue
+                terminal, process = self.terminals.get(tid, (None, None))
+            if not terminal:
+                continue
+            if command in ("frame", "snapshot"):
+                if command == "frame":
+                    frame = decode_frame(args[0])
+                else:
+                    frame = decode_snapshot(args[0])
+                process.mode = frame.mode
+                terminal.on_remote_frame(frame)
+            elif command == "output":
+                terminal.on_remote_output()
+            elif command == "reset":
+                terminal.on_remote_reset()
+            elif command == "error":
+                logger.error("cannot spawn terminal {}: {}".format(tid, args[0]))
+            elif command == "exit":
+                with self.lock:
+                    del self.terminals[tid]
+                process.exitstatus, process.signalstatus = args
+                process.terminated = True
+                terminal.on_remote_exit()
+
+        logger.debug("engine {} is disconnected".format(self.name))
+        with self.lock:
+            # the terminals are left alone if it is closed by `close`
+            closing = self.closed
+            self.closed = True
+            terminals = list(self.terminals.values())
+            self.terminals.clear()
+        if closing:
+            return
+        for terminal, process in terminals:
+            process.terminated = True
+            terminal.on_remote_exit()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        try:
+            if self.socket:
+                # the server keeps the terminals of the connection running
+                self.socket.shutdown(socket.SHUT_RDWR)
+                self.socket.close()
+            else:
+                # the engine process terminates its terminals and exits at the end of its
+                # input
+                self.wfile.close()
+        except OSError:
+            pass
+
+
+class EngineClient:
+    """
+    Run terminals in engine processes, so that parsing the output and updating the screens
+    don't compete with the plugin host for its GIL. The terminals are spread over up to
+    `processes` engine processes, or they are run by the engine server if `server` is set.
+    """
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._engines = []
+        self._server = None
+        # the interpreters which are checked to run the engine
+        self._checked = set()
+
+    def spawn(
+            self, terminal, cmd, cwd, env, size, history, python="python3", processes=1,
+            server=False, attach=None):
+        """
+        Run `cmd` in an engine process and return its `RemoteProcess`. The frames, the first
+        output and the exit of the process are passed to the `on_remote_*` methods of
+        `terminal` from the dispatcher thread. If `attach` is the id of a terminal run by the
+        server, the terminal is attached instead.
+        """
+        if server and not hasattr(socket, "AF_UNIX"):
+            server = False
+        with self.lock:
+            if python not in self._checked:
+                check_engine(python)
+                self._checked.add(python)
+            startt = time.time()
+            if server:
+                if not self._server or self._server.closed:
+                    self._server = EngineProcess(python, server=True)
+                    logger.debug("connecting to the engine server takes {:.3f}s".format(
+                        time.time() - startt))
+                engine = self._server
+            else:
+                self._engines = [engine for engine in self._engines if not engine.closed]
+                if len(self._engines) < max(processes, 1):
+                    engine = EngineProcess(python)
+                    logger.debug("starting engine {} takes {:.3f}s".format(
+                        engine.name, time.time() - startt))
+                    self._engines.append(engine)
+                else:
+                    engine = min(self._engines, key=lambda engine: len(engine.terminals))
+
+        if attach and server:
+            process = engine.attach(terminal, attach, size)
+            if process:
+                logger.debug("terminal {} is attached".format(attach))
+                return process
+        return engine.spawn(terminal, uuid.uuid4().hex, cmd, cwd, env, size, history)
+
+    def shutdown(self):
+        with self.lock:
+            engines = self._engines
+            if self._server:
+                engines.append(self._server)
+            self._engines = []
+            self._server = None
+        for engine in engines:
+            engine.close()
+
+
+def main():
+    if sys.argv[1:2] == ["--check"]:
+        if sys.version_info < (3, 8):
+            sys.exit("Python {}.{} is too old".format(*sys.version_info[:2]))
+        from . import ptty  # noqa: F401
+        return
+    if sys.argv[1:2] == ["--server"]:
+        EngineServer(sys.argv[2]).serve()
+        return
+    # keep the stdout for the messages, anything printed goes to stderr instead
+    wfile = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    Engine(sys.stdin.buffer, wfile).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 import sublime
 import sublime_plugin
 
+import time
 import logging
 import difflib
 from random import random
 
 from .clipboard import g_clipboard_history
+from .reactivation import ReactivationQueue, get_reactivation_args, FOCUSED, VISIBLE
 from .recency import RecencyManager
 from .terminal import Terminal
+from .view import unregister_panel
 
 logger = logging.getLogger('Terminus')
 
@@ -32,25 +35,23 @@ class TerminusCoreEventListener(sublime_plugin.EventListener):
         terminal = Terminal.from_id(view.id())
         if terminal:
             recency_manager.set_recent_terminal(view)
+            terminal.last_viewed = time.time()
+            terminal.request_resize()
             return
 
-        settings = view.settings()
-        if not settings.has("terminus_view.args"):
-            return
-
-        if settings.get("terminus_view.finished", False):
-            return
-
-        kwargs = settings.get("terminus_view.args")
-        if "cmd" not in kwargs:
+        if not get_reactivation_args(view):
             return
 
         settings = sublime.load_settings("Terminus.sublime-settings")
         if settings.get("reactivate_terminals", True) is not True:
             return
 
-        if view.settings().get("terminus_view.reactivable", False):
-            sublime.set_timeout(lambda: view.run_command("terminus_activate", kwargs), 100)
+        window = view.window()
+        if window and window.active_view() == view:
+            priority = FOCUSED
+        else:
+            priority = VISIBLE
+        sublime.set_timeout(lambda: ReactivationQueue.instance().push(view, priority), 100)
 
     def on_pre_close(self, view):
         # panel doesn't trigger on_pre_close
@@ -58,10 +59,45 @@ class TerminusCoreEventListener(sublime_plugin.EventListener):
         if terminal:
             terminal.kill()
 
-    def on_modified(self, view):
+    def on_close(self, view):
+        # forget whether the view is a panel
+        unregister_panel(view)
+
+    def on_window_command(self, window, command_name, args):
+        if command_name == "show_panel":
+            panel = args["panel"].replace("output.", "")
+            view = window.find_output_panel(panel)
+            if view:
+                terminal = Terminal.from_id(view.id())
+                if terminal and terminal.show_in_panel:
+                    recency_manager = RecencyManager.from_view(view)
+                    if recency_manager:
+                        recency_manager.set_recent_terminal(view)
+
+    def on_post_window_command(self, window, command_name, args):
+        # the command may have changed the layout of the window
+        Terminal.request_resize_all(window)
+
+
+class TerminusViewEventListener(sublime_plugin.ViewEventListener):
+    """
+    The events of the terminal views, the other views don't pay for them.
+    """
+
+    @classmethod
+    def is_applicable(cls, settings):
+        return settings.get("terminus_view", False)
+
+    def __init__(self, view):
+        super().__init__(view)
+        self._cursor = 0
+        self._pre_paste = ""
+
+    def on_modified(self):
+        view = self.view
         # to catch unicode input
         terminal = Terminal.from_id(view.id())
-        if not terminal or not terminal.process.isalive():
+        if not terminal or not terminal.alive:
             return
         command, args, _ = view.command_history(0)
         if command.startswith("terminus"):
@@ -80,17 +116,17 @@ class TerminusCoreEventListener(sublime_plugin.EventListener):
             logger.debug("undo {}".format(command))
             view.run_command("soft_undo")
 
-    def on_selection_modified(self, view):
+    def on_selection_modified(self):
+        view = self.view
         terminal = Terminal.from_id(view.id())
-        if not terminal or not terminal.process.isalive():
+        if not terminal or not terminal.alive:
             return
         if len(view.sel()) != 1 or not view.sel()[0].empty():
             return
         self._cursor = view.sel()[0].end()
 
-    def on_text_command(self, view, name, args):
-        if not view.settings().get('terminus_view'):
-            return
+    def on_text_command(self, name, args):
+        view = self.view
         if name == "copy":
             return ("terminus_copy", None)
         elif name == "paste":
@@ -104,9 +140,8 @@ class TerminusCoreEventListener(sublime_plugin.EventListener):
         elif name == "undo":
             return ("noop", None)
 
-    def on_post_text_command(self, view, name, args):
-        if not view.settings().get('terminus_view'):
-            return
+    def on_post_text_command(self, name, args):
+        view = self.view
         if name == 'terminus_copy':
             g_clipboard_history.push_text(sublime.get_clipboard())
         elif name == "paste_selection_clipboard":
@@ -114,14 +149,3 @@ class TerminusCoreEventListener(sublime_plugin.EventListener):
                 df[2:] for df in difflib.ndiff(self._pre_paste, view.substr(view.visible_region()))
                 if df[0] == '+']
             view.run_command("terminus_paste_text", {"text": "".join(added)})
-
-    def on_window_command(self, window, command_name, args):
-        if command_name == "show_panel":
-            panel = args["panel"].replace("output.", "")
-            view = window.find_output_panel(panel)
-            if view:
-                terminal = Terminal.from_id(view.id())
-                if terminal and terminal.show_in_panel:
-                    recency_manager = RecencyManager.from_view(view)
-                    if recency_manager:
-                        recency_manager.set_recent_terminal(view)
@@ -0,0 +1,117 @@
+import os
+import re
+import time
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger('Terminus')
+
+
+# the files sourced by login shells, the cached environments are invalidated when any of
+# them is changed
+RC_FILES = [
+    "/etc/profile",
+    "/etc/zprofile",
+    "/etc/zshenv",
+    "~/.profile",
+    "~/.bash_profile",
+    "~/.bash_login",
+    "~/.bashrc",
+    "~/.zprofile",
+    "~/.zshenv",
+    "~/.zshrc",
+    "~/.zlogin"
+]
+
+# variables which belong to the shell which captures the environment
+IGNORED_VARIABLES = ["_", "PWD", "OLDPWD", "SHLVL", "TERM"]
+
+ENV_LINE = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)=(.*)$")
+
+
+def rc_files_fingerprint():
+    fingerprint = []
+    for path in RC_FILES:
+        try:
+            fingerprint.append(os.stat(os.path.expanduser(path)).st_mtime)
+        except OSError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+
+def parse_env(output):
+    """
+    Parse the output of `env -0`, or of `env` where it is not supported.
+    """
+    env = {}
+    if "\0" in output:
+        for entry in output.split("\0"):
+            key, sep, value = entry.partition("=")
+            if sep and key:
+                env[key] = value
+    else:
+        key = None
+        for line in output.splitlines():
+            m = ENV_LINE.match(line)
+            if m:
+                key = m.group(1)
+                env[key] = m.group(2)
+            elif key:
+                # a value with new lines
+                env[key] += "\n" + line
+    for key in IGNORED_VARIABLES:
+        env.pop(key, None)
+    return env
+
+
+class LoginEnvironment:
+    """
+    Cache the environment of the login shells so that commands can be run by non-login shells
+    with the same environment. An environment is captured in the background the first time
+    it is requested, it expires after `ttl` seconds or when the rc files are changed.
+    """
+    _cache = {}
+    _capturing = set()
+    lock = threading.Lock()
+
+    @classmethod
+    def get(cls, shell, ttl=3600):
+        """
+        Return the cached login environment of `shell`, or None if it is not available yet.
+        """
+        fingerprint = rc_files_fingerprint()
+        with cls.lock:
+            if shell in cls._cache:
+                env, captured_at, captured_fingerprint = cls._cache[shell]
+                if time.time() - captured_at < ttl and captured_fingerprint == fingerprint:
+                    return env
+                del cls._cache[shell]
+            if shell in cls._capturing:
+                return None
+            cls._capturing.add(shell)
+
+        threading.Thread(target=lambda: cls.capture(shell, fingerprint)).start()
+        return None
+
+    @classmethod
+    def capture(cls, shell, fingerprint):
+        try:
+            startt = time.time()
+            # the values may contain new lines, they are separated by NUL where `env -0`
+            # is supported
+            output = subprocess.check_output(
+                ["/usr/bin/env", shell, "-l", "-c", "/usr/bin/env -0 || /usr/bin/env"],
+                stdin=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=30).decode("utf-8", "replace")
+            env = parse_env(output)
+            logger.debug("capturing the login environment of {} takes {:.3f}s".format(
+                shell, time.time() - startt))
+            with cls.lock:
+                cls._cache[shell] = (env, time.time(), fingerprint)
+        except Exception as e:
+            logger.debug("cannot capture the login environment of {}: {}".format(shell, e))
+        finally:
+            with cls.lock:
+                cls._capturing.discard(shell)
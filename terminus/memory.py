@@ -0,0 +1,188 @@
+import sublime
+import sublime_plugin
+
+import math
+import time
+import logging
+
+from .terminal import Terminal
+
+logger = logging.getLogger('Terminus')
+
+# rough sizes in bytes, measured with tracemalloc
+CELL_SIZE = 200  # a char in the screen buffer
+HISTORY_LINE_SIZE = 100  # a history line without its text and its runs
+HISTORY_RUN_SIZE = 40  # a style run of a history line
+VIEW_CHAR_SIZE = 2  # a char of the rendered text
+REGION_SIZE = 200  # a colored region of a view
+
+# seconds between the checks of the budget
+CHECK_PERIOD = 5
+
+MB = 1024 * 1024
+
+
+def history_size(lines):
+    return sum(
+        HISTORY_LINE_SIZE + len(line.text) + HISTORY_RUN_SIZE * len(line.runs)
+        for line in lines)
+
+
+def memory_usage(terminal):
+    """
+    Estimate the memory in bytes held for a terminal by the screen of the emulator as of
+    its last frame, by the history lines which are not rendered yet, by the rendered text
+    and by the colored regions.
+    """
+    usage = {"screen": 0, "history": 0, "text": 0, "regions": 0}
+    # the lock is not taken, the history is handed over to the frames and the size of the
+    # screen is published with them
+    usage["screen"] = CELL_SIZE * terminal.screen_cells
+    for frame in tuple(terminal.frames):
+        usage["history"] += history_size(frame.history)
+    view = terminal.view
+    if view:
+        usage["text"] = VIEW_CHAR_SIZE * view.size()
+        usage["regions"] = REGION_SIZE * terminal.region_count
+    return usage
+
+
+def scrollback_lines_over(terminal, excess):
+    """
+    Return the number of the oldest scrollback lines to be erased to free `excess` bytes.
+    """
+    offset = terminal.offset
+    size = VIEW_CHAR_SIZE * terminal.view.text_point(offset, 0)
+    if size <= 0:
+        return offset
+    return min(offset, math.ceil(excess * offset / size))
+
+
+def visible_views():
+    vids = set()
+    for window in sublime.windows():
+        for group in range(window.num_groups()):
+            view = window.active_view_in_group(group)
+            if view:
+                vids.add(view.id())
+        panel = window.active_panel()
+        if panel and panel.startswith("output."):
+            view = window.find_output_panel(panel[len("output."):])
+            if view:
+                vids.add(view.id())
+    return vids
+
+
+def all_terminals():
+    return list(Terminal._terminals.values()) + list(Terminal._detached_terminals)
+
+
+class MemoryBudget:
+    """
+    Keep the estimated memory of all the terminals under `scrollback_memory_budget`. Once
+    it is exceeded, the scrollback of the least recently viewed terminals is decolorized
+    first, and then its oldest lines are erased until the budget is met.
+    """
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._scheduled = False
+        self._last_check = 0
+
+    def request_check(self):
+        if self._scheduled or time.time() - self._last_check < CHECK_PERIOD:
+            return
+        self._scheduled = True
+        sublime.set_timeout(self.check)
+
+    def check(self):
+        self._scheduled = False
+        self._last_check = time.time()
+        settings = sublime.load_settings("Terminus.sublime-settings")
+        budget = settings.get("scrollback_memory_budget", 0) * MB
+        if budget <= 0:
+            return
+
+        visible = visible_views()
+        now = time.time()
+        usages = {}
+        for terminal in all_terminals():
+            if terminal.view and terminal.view.id() in visible:
+                terminal.last_viewed = now
+            usages[terminal] = sum(memory_usage(terminal).values())
+        total = sum(usages.values())
+        if total <= budget:
+            return
+
+        logger.debug("terminals use {:.1f}MB, over the budget of {:.1f}MB".format(
+            total / MB, budget / MB))
+        candidates = sorted(
+            (terminal for terminal in usages
+                if terminal.view and terminal.view.id() not in visible and terminal.offset > 0),
+            key=lambda terminal: terminal.last_viewed)
+        for evict in ("colors", "lines"):
+            for terminal in candidates:
+                if total <= budget:
+                    return
+                view = terminal.view
+                if not view:
+                    continue
+                if evict == "lines":
+                    lines = scrollback_lines_over(terminal, total - budget)
+                else:
+                    lines = None
+                logger.debug("evicting the scrollback {} of view {}".format(evict, view.id()))
+                view.run_command(
+                    "terminus_render", {"evict_scrollback": evict, "evict_lines": lines})
+                usage = sum(memory_usage(terminal).values())
+                total += usage - usages[terminal]
+                usages[terminal] = usage
+
+
+class TerminusShowMemoryUsageCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        settings = sublime.load_settings("Terminus.sublime-settings")
+        budget = settings.get("scrollback_memory_budget", 0)
+        columns = ("screen", "history", "text", "regions")
+        lines = ["Terminus memory usage (estimated)", ""]
+        lines.append(
+            "".join("{:>10}".format(c) for c in columns + ("total", "viewed")) + "  terminal")
+
+        now = time.time()
+        totals = dict.fromkeys(columns, 0)
+        terminals = sorted(all_terminals(), key=lambda t: t.last_viewed, reverse=True)
+        for terminal in terminals:
+            usage = memory_usage(terminal)
+            for c in columns:
+                totals[c] += usage[c]
+            if terminal.view:
+                title = terminal.view.name()
+            else:
+                title = "{} (detached)".format(terminal.default_title)
+            lines.append(
+                "".join("{:>8.1f}MB".format(usage[c] / MB) for c in columns) +
+                "{:>8.1f}MB".format(sum(usage.values()) / MB) +
+                "{:>9.0f}s".format(now - terminal.last_viewed) +
+                "  " + title)
+
+        lines.append(
+            "".join("{:>8.1f}MB".format(totals[c] / MB) for c in columns) +
+            "{:>8.1f}MB".format(sum(totals.values()) / MB) +
+            "{:>10}".format("") + "  total")
+        lines.append("")
+        if budget > 0:
+            lines.append("budget: {}MB".format(budget))
+        else:
+            lines.append("budget: disabled")
+
+        view = self.window.new_file()
+        view.set_name("Terminus Memory Usage")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": "\n".join(lines) + "\n"})
+        view.set_read_only(True)
@@ -88,17 +88,22 @@ def find_url_region(view, event=None, pt=None):
     return None
 
 
-class TerminusMouseEventListener(sublime_plugin.EventListener):
+class TerminusMouseEventListener(sublime_plugin.ViewEventListener):
 
-    def on_text_command(self, view, command_name, args):
-        terminal = Terminal.from_id(view.id())
+    @classmethod
+    def is_applicable(cls, settings):
+        return settings.get("terminus_view", False)
+
+    def on_text_command(self, command_name, args):
+        terminal = Terminal.from_id(self.view.id())
         if not terminal:
             return
         if command_name == "drag_select":
             if len(args) == 1 and args["event"]["button"] == 1:  # simple click
                 return ("terminus_click", args)
 
-    def on_hover(self, view, point, hover_zone):
+    def on_hover(self, point, hover_zone):
+        view = self.view
         terminal = Terminal.from_id(view.id())
         if not terminal:
             return
@@ -0,0 +1,148 @@
+import sublime
+
+import os
+import sys
+import time
+import shlex
+import logging
+import threading
+
+from .reaper import Reaper
+
+logger = logging.getLogger('Terminus')
+
+
+# shells which can be handed over to a different working directory by `cd`
+POOLABLE_SHELLS = ["bash", "zsh", "sh", "dash", "ksh", "fish"]
+
+
+class ShellPool:
+    """
+    Keep pre-spawned interactive shells for the shell commands which have been opened, so
+    that a new terminal doesn't wait for the shell startup. A pooled shell is resized and
+    `cd`'d to the working directory of the terminal when it is taken. The pool is refilled
+    in the background and the shells which are idle for too long are terminated.
+    """
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # list of (key, cwd, size, process, spawn time), the oldest first
+        self._shells = []
+        self._replenishing = set()
+        self._expiring = False
+
+    @staticmethod
+    def is_poolable(cmd):
+        if sys.platform.startswith("win"):
+            return False
+        if not cmd or "-c" in cmd[1:]:
+            return False
+        return os.path.basename(cmd[0]) in POOLABLE_SHELLS
+
+    def take(self, cmd, cwd, env, size):
+        """
+        Return a pooled shell process of `cmd` and `env`, or None if there is none. The pool
+        is refilled afterwards.
+        """
+        settings = sublime.load_settings("Terminus.sublime-settings")
+        pool_size = settings.get("shell_pool_size", 0)
+        if not pool_size or not self.is_poolable(cmd):
+            return None
+
+        key = (tuple(cmd), frozenset(env.items()))
+        process = None
+        with self.lock:
+            for shell in list(self._shells):
+                if shell[0] != key:
+                    continue
+                self._shells.remove(shell)
+                if shell[3].isalive():
+                    _, shell_cwd, shell_size, process, _ = shell
+                    break
+
+        threading.Thread(target=lambda: self.replenish(key, cwd, size, pool_size)).start()
+
+        if not process:
+            return None
+
+        logger.debug("take pooled shell {}".format(cmd))
+        if tuple(shell_size) != tuple(size):
+            process.setwinsize(*size)
+        if shell_cwd != cwd:
+            process.write(" cd {}; clear\r".format(shlex.quote(cwd)))
+        return process
+
+    def replenish(self, key, cwd, size, pool_size):
+        from .ptty import TerminalPtyProcess
+
+        settings = sublime.load_settings("Terminus.sublime-settings")
+        max_size = settings.get("shell_pool_max_size", 4)
+
+        with self.lock:
+            if key in self._replenishing:
+                return
+            self._replenishing.add(key)
+
+        try:
+            while True:
+                with self.lock:
+                    count = sum(1 for shell in self._shells if shell[0] == key)
+                    if count >= pool_size:
+                        break
+                    if len(self._shells) >= max_size:
+                        # make room by the oldest shell of the other commands
+                        others = [shell for shell in self._shells if shell[0] != key]
+                        if not others:
+                            break
+                        self._shells.remove(others[0])
+                        Reaper.instance().terminate(others[0][3])
+
+                cmd, env = list(key[0]), dict(key[1])
+                startt = time.time()
+                process = TerminalPtyProcess.spawn(cmd, cwd=cwd, env=env, dimensions=size)
+                logger.debug("pooled shell {} spawned in {:.3f}s".format(
+                    cmd, time.time() - startt))
+                with self.lock:
+                    self._shells.append((key, cwd, size, process, time.time()))
+        finally:
+            with self.lock:
+                self._replenishing.discard(key)
+
+        self._schedule_expire()
+
+    def _schedule_expire(self):
+        with self.lock:
+            if self._expiring or not self._shells:
+                return
+            self._expiring = True
+        sublime.set_timeout_async(self.expire, 60000)
+
+    def expire(self):
+        settings = sublime.load_settings("Terminus.sublime-settings")
+        timeout = settings.get("shell_pool_idle_timeout", 600)
+        now = time.time()
+        with self.lock:
+            self._expiring = False
+            expired = [
+                shell for shell in self._shells
+                if now - shell[4] > timeout or not shell[3].isalive()]
+            for shell in expired:
+                self._shells.remove(shell)
+        for shell in expired:
+            logger.debug("pooled shell {} expired".format(list(shell[0][0])))
+            Reaper.instance().terminate(shell[3])
+        self._schedule_expire()
+
+    def clear(self):
+        with self.lock:
+            shells = self._shells
+            self._shells = []
+        for shell in shells:
+            Reaper.instance().terminate(shell[3])
@@ -1,11 +1,14 @@
+import os
 import re
 import sys
 import logging
 import unicodedata
 from copy import copy
+from bisect import bisect_right
 from collections import defaultdict, deque, namedtuple
 from wcwidth import wcwidth, wcswidth
 from functools import lru_cache
+from itertools import accumulate
 
 import pyte
 from pyte.screens import StaticDefaultDict, Margins
@@ -18,9 +21,19 @@ if sys.platform.startswith("win"):
     from winpty import PtyProcess
     is_windows = True
 else:
+    import pty
+    import fcntl
+    import shutil
+    import signal
+    import struct
+    import termios
     from ptyprocess import PtyProcess
     is_windows = False
 
+# spawn processes by posix_spawn instead of forking the plugin host, the slave pty becomes
+# the controlling terminal when it is opened by a session leader only on Linux
+use_posix_spawn = sys.platform.startswith("linux") and hasattr(os, "posix_spawn")
+
 
 logger = logging.getLogger('Terminus')
 
@@ -95,6 +108,456 @@ class Char(namedtuple("Char", [
                                         underscore, strikethrough, reverse, linefeed)
 
 
+def reverse_fg_bg(fg, bg):
+    fg, bg = bg, fg
+    if fg == "default":
+        fg = "reverse_default"
+    if bg == "default":
+        bg = "reverse_default"
+    return fg, bg
+
+
+def segment_buffer_line(buffer_line, begin=0, end=None):
+    """
+    segment a buffer line based on bg and fg colors
+    `begin` and `end` restrict the columns of a line without double width chars
+    """
+    if isinstance(buffer_line, HistoryLine):
+        yield from buffer_line.segments()
+        return
+
+    is_wide_char = False
+    text = ""
+    start = begin
+    counter = begin
+    fg = "default"
+    bg = "default"
+    bold = False
+    reverse = False
+
+    if isinstance(buffer_line, TerminalLine):
+        last_index = buffer_line.extent
+    elif buffer_line:
+        last_index = max(buffer_line.keys()) + 1
+    else:
+        last_index = 0
+    if end is not None:
+        last_index = min(last_index, end)
+
+    for i in range(begin, last_index):
+        if is_wide_char:
+            is_wide_char = False
+            continue
+        char = buffer_line[i]
+        is_wide_char = wcswidth(char.data) >= 2
+
+        if counter == 0:
+            counter = i
+            text = " " * i
+
+        if fg != char.fg or bg != char.bg or bold != char.bold or reverse != char.reverse:
+            if reverse:
+                fg, bg = reverse_fg_bg(fg, bg)
+            yield text, start, counter, fg, bg, bold
+            fg = char.fg
+            bg = char.bg
+            bold = char.bold
+            reverse = char.reverse
+            text = char.data
+            start = counter
+        else:
+            text += char.data
+
+        counter += 1
+
+    if reverse:
+        fg, bg = reverse_fg_bg(fg, bg)
+    yield text, start, counter, fg, bg, bold
+
+
+# styles are shared between history lines to keep them small
+_history_styles = {}
+
+
+class HistoryLine(namedtuple("HistoryLine", ["text", "runs", "linefeed"])):
+    """
+    An immutable run-length encoded line which is pushed into the history.
+    `runs` is a tuple of `(start, length, style)` and `style` is a tuple of
+    `(fg, bg, bold)` with reverse video already applied.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_buffer_line(cls, buffer_line, columns):
+        text = ""
+        runs = []
+        for s in segment_buffer_line(buffer_line):
+            # the runs are positions in the text, a cell may hold combining chars
+            length = len(s[0])
+            if length <= 0:
+                continue
+            style = s[3:]
+            if len(_history_styles) > 4096:
+                _history_styles.clear()
+            style = _history_styles.setdefault(style, style)
+            runs.append((len(text), length, style))
+            text += s[0]
+
+        linefeed = buffer_line[columns - 1].linefeed if buffer_line else False
+
+        # trailing blanks of default colors are not rendered anyway, except for wrapped
+        # lines where they are followed by the continuation marker
+        while runs and not linefeed:
+            start, length, style = runs[-1]
+            if style[0] != "default" or style[1] != "default":
+                break
+            stripped = text[start:].rstrip()
+            if stripped:
+                runs[-1] = (start, len(stripped), style)
+                text = text[:start] + stripped
+                break
+            runs.pop()
+            text = text[:start]
+
+        return cls(text, tuple(runs), linefeed)
+
+    def segments(self):
+        text = self.text
+        for start, length, (fg, bg, bold) in self.runs:
+            yield text[start:start + length], start, start + length, fg, bg, bold
+
+
+class CharWidths(dict):
+    """
+    The widths of the chars looked up so far, the combining chars are zero wide.
+    """
+
+    def __missing__(self, c):
+        width = self[c] = max(wcwidth(c), 0)
+        return width
+
+
+char_widths = CharWidths()
+
+
+def text_width(text):
+    if text.isascii():
+        return len(text)
+    return sum(map(char_widths.__getitem__, text))
+
+
+def wrap_bounds(text, columns):
+    """
+    Return the positions where the rows of `columns` wide start and the rows which are
+    narrower as a double width char didn't fit. Double width chars are not split and
+    the combining chars stay with the char before.
+    """
+    if text.isascii():
+        return list(range(0, len(text), columns)) or [0], ()
+    n = len(text)
+    # the width of the text up to and including each char
+    widths = list(accumulate(map(char_widths.__getitem__, text)))
+    bounds = [0]
+    short = []
+    a = 0
+    width = 0
+    while True:
+        b = bisect_right(widths, width + columns, a)
+        if b >= n:
+            break
+        if b == a:
+            # a char wider than the row
+            b += 1
+        elif widths[b - 1] - width < columns:
+            short.append(len(bounds) - 1)
+        bounds.append(b)
+        width = widths[b - 1]
+        a = b
+    return bounds, short
+
+
+def wrap_history_text(text, runs, columns, linefeed=False):
+    """
+    Wrap the text and the runs of a logical line into history lines of `columns` wide.
+    The last history line gets `linefeed` if the logical line continues on the screen.
+    A row is padded with a blank if the double width char after it didn't fit, as the
+    screen does.
+    """
+    # bypass the argument parsing of the namedtuple constructor, it is called per row
+    new = tuple.__new__
+    n = len(text)
+    if len(runs) == 1 and runs[0][0] == 0 and runs[0][1] == n and text.isascii():
+        # a single run covers the whole text
+        style = runs[0][2]
+        return [
+            new(HistoryLine, (
+                text[a:a + columns],
+                ((0, columns if a + columns < n else n - a, style),),
+                a + columns < n or linefeed))
+            for a in range(0, n, columns)] or [new(HistoryLine, (text, (), linefeed))]
+
+    bounds, short = wrap_bounds(text, columns)
+    bounds.append(n)
+    last = len(bounds) - 2
+    rows = [text[bounds[i]:bounds[i + 1]] for i in range(last + 1)]
+    for i in short:
+        rows[i] += " "
+    lines = []
+    row_runs = []
+    i = 0
+    a = 0
+    b = bounds[1]
+    # a single pass over the runs and the rows, a run may span several rows
+    for start, length, style in runs:
+        end = start + length
+        while start >= b and i < last:
+            lines.append(new(HistoryLine, (rows[i], tuple(row_runs), True)))
+            row_runs = []
+            i += 1
+            a = b
+            b = bounds[i + 1]
+        while end > b and i < last:
+            row_runs.append((start - a, b - start, style))
+            lines.append(new(HistoryLine, (rows[i], tuple(row_runs), True)))
+            row_runs = []
+            i += 1
+            start = a = b
+            b = bounds[i + 1]
+        row_runs.append((start - a, end - start, style))
+    while True:
+        lines.append(new(HistoryLine, (rows[i], tuple(row_runs), i < last or linefeed)))
+        if i == last:
+            return lines
+        row_runs = []
+        i += 1
+        b = bounds[i + 1]
+
+
+def join_wrapped_lines(lines):
+    """
+    Join the texts and the runs of the rows of a logical line. The blank left by a double
+    width char which didn't fit is dropped and the runs split by the rows are merged.
+    """
+    parts = []
+    runs = []
+    size = 0
+    for text, line_runs in lines:
+        if parts and text and parts[-1].endswith(" ") and char_widths[text[0]] == 2:
+            parts[-1] = parts[-1][:-1]
+            size -= 1
+            while runs and runs[-1][0] >= size:
+                runs.pop()
+            if runs and runs[-1][0] + runs[-1][1] > size:
+                start, _, style = runs[-1]
+                runs[-1] = (start, size - start, style)
+        for start, length, style in line_runs:
+            if start == 0 and runs and runs[-1][0] + runs[-1][1] == size and \
+                    runs[-1][2] == style:
+                runs[-1] = (runs[-1][0], runs[-1][1] + length, style)
+            else:
+                runs.append((start + size, length, style))
+        parts.append(text)
+        size += len(text)
+    return "".join(parts), runs
+
+
+def reflow_history(history, columns):
+    """
+    Rewrap a sequence of history lines to `columns`. Lines which are neither wrapped
+    nor too long are kept as they are. It takes a time linear in the number of the
+    lines and of their runs.
+    """
+    result = []
+    append = result.append
+    logical_line = []
+    for line in history:
+        if not logical_line and not line.linefeed:
+            t = line.text
+            if len(t) <= columns and (t.isascii() or text_width(t) <= columns):
+                append(line)
+                continue
+        logical_line.append((line.text, line.runs))
+        if line.linefeed:
+            continue
+        result.extend(wrap_history_text(*join_wrapped_lines(logical_line), columns))
+        logical_line = []
+    if logical_line:
+        # the last logical line continues on the screen
+        result.extend(wrap_history_text(
+            *join_wrapped_lines(logical_line), columns, linefeed=True))
+    return result
+
+
+def wrap_cells(cells, columns, default):
+    """
+    Wrap a logical line of cells into rows of `columns` cells. Double width chars are
+    not split, the last cell of each wrapped row gets the linefeed marker.
+    Return the rows and the (row, column) of each cell.
+    """
+    rows = []
+    positions = []
+    row = []
+    i = 0
+    n = len(cells)
+    while i < n:
+        char = cells[i]
+        stub = i + 1 < n and cells[i + 1].data == ""
+        width = 2 if stub else 1
+        if row and len(row) + width > columns:
+            row.extend([default] * (columns - len(row)))
+            row[-1] = row[-1]._replace(linefeed=True)
+            rows.append(row)
+            row = []
+        positions.append((len(rows), len(row)))
+        row.append(char)
+        if stub:
+            positions.append((len(rows), len(row)))
+            row.append(cells[i + 1])
+        i += width
+    rows.append(row)
+    return rows, positions
+
+
+def is_blank_char(data):
+    return data == " " or not data or data.isspace()
+
+
+class TerminalLine(StaticDefaultDict):
+    """
+    A buffer line which keeps track of its extent (one plus the largest column in use)
+    and of its rightmost non-blank column. Both are updated as cells are written, they
+    are only recomputed lazily after the trailing cell is removed or blanked.
+    `version` increases on every change of the line. `wide` is set once a cell which
+    does not hold exactly one char (e.g. the stub of a double width char) is written,
+    until then the columns of the line are the same as the text positions.
+    """
+
+    def __init__(self, default):
+        super().__init__(default)
+        self.version = 0
+        self.wide = False
+        self._extent = 0
+        self._right = 0
+        self._stale = False
+
+    def __setitem__(self, x, char):
+        dict.__setitem__(self, x, char)
+        self.version += 1
+        if x >= self._extent:
+            self._extent = x + 1
+        data = char.data
+        if len(data) != 1:
+            self.wide = True
+        if not is_blank_char(data):
+            if x >= self._right:
+                self._right = x + 1
+        elif x == self._right - 1:
+            self._stale = True
+
+    def __delitem__(self, x):
+        dict.__delitem__(self, x)
+        self._removed(x)
+
+    def pop(self, x, *args):
+        if x in self:
+            char = dict.pop(self, x)
+            self._removed(x)
+            return char
+        return dict.pop(self, x, *args)
+
+    def _removed(self, x):
+        self.version += 1
+        if x == self._extent - 1 or x == self._right - 1:
+            self._stale = True
+
+    def clear(self):
+        dict.clear(self)
+        self.version += 1
+        self.wide = False
+        self._extent = 0
+        self._right = 0
+        self._stale = False
+
+    def __copy__(self):
+        line = TerminalLine(self.default)
+        dict.update(line, self)
+        line.wide = self.wide
+        line._extent = self._extent
+        line._right = self._right
+        line._stale = self._stale
+        return line
+
+    def _refresh(self):
+        extent = 0
+        right = 0
+        for x, char in self.items():
+            if x >= extent:
+                extent = x + 1
+            if x >= right and not is_blank_char(char.data):
+                right = x + 1
+        self._extent = extent
+        self._right = right
+        self._stale = False
+
+    @property
+    def extent(self):
+        if self._stale:
+            self._refresh()
+        return self._extent
+
+    @property
+    def right(self):
+        """
+        one plus the rightmost non-blank column
+        """
+        if self._stale:
+            self._refresh()
+        return self._right
+
+    def is_blank(self):
+        return self.right == 0
+
+
+class Damage(set):
+    """
+    The set of dirty rows. In addition, it remembers the dirty column span of the rows
+    which are only partially changed, rows added via `add` or `update` are entirely dirty.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.spans = {}
+
+    def add(self, y):
+        super().add(y)
+        self.spans[y] = None
+
+    def update(self, rows):
+        rows = list(rows)
+        super().update(rows)
+        self.spans.update(dict.fromkeys(rows))
+
+    def mark(self, y, start, end):
+        if y not in self:
+            super().add(y)
+            self.spans[y] = (start, end)
+            return
+        span = self.spans.get(y)
+        if span is not None:
+            self.spans[y] = (min(span[0], start), max(span[1], end))
+
+    def span(self, y):
+        """
+        the dirty (start, end) columns of a row or None if the whole row is dirty
+        """
+        return self.spans.get(y)
+
+    def clear(self):
+        super().clear()
+        self.spans.clear()
+
+
 class Cursor(object):
     __slots__ = ("x", "y", "attrs", "hidden")
 
@@ -115,6 +578,65 @@ else:
 
     class TerminalPtyProcess(PtyProcess):
 
+        @classmethod
+        def spawn(cls, argv, cwd=None, env=None, dimensions=(24, 80), **kwargs):
+            if not use_posix_spawn or kwargs:
+                return super().spawn(argv, cwd=cwd, env=env, dimensions=dimensions, **kwargs)
+            try:
+                return cls.posix_spawn(argv, cwd=cwd, env=env, dimensions=dimensions)
+            except FileNotFoundError:
+                raise
+            except Exception as e:
+                logger.debug("posix_spawn failed: {}, fall back to fork".format(e))
+                return super().spawn(argv, cwd=cwd, env=env, dimensions=dimensions)
+
+        @classmethod
+        def posix_spawn(cls, argv, cwd=None, env=None, dimensions=(24, 80)):
+            """
+            Spawn a process in a pseudo terminal without forking the current process.
+            """
+            argv = list(argv)
+            if env is None:
+                env = os.environ
+            command = shutil.which(argv[0], path=env.get("PATH", os.defpath))
+            if command is None:
+                raise FileNotFoundError(
+                    "The command was not found or was not executable: {}.".format(argv[0]))
+            argv[0] = command
+
+            master_fd, slave_fd = pty.openpty()
+            try:
+                fcntl.ioctl(
+                    master_fd, termios.TIOCSWINSZ, struct.pack("HHHH", *dimensions, 0, 0))
+                slave_name = os.ttyname(slave_fd)
+                # the child is a session leader and the slave pty becomes its controlling
+                # terminal when it is opened as the stdin
+                file_actions = [
+                    (os.POSIX_SPAWN_OPEN, 0, slave_name, os.O_RDWR, 0),
+                    (os.POSIX_SPAWN_DUP2, 0, 1),
+                    (os.POSIX_SPAWN_DUP2, 0, 2)
+                ]
+                if cwd is not None:
+                    # posix_spawn cannot change the working directory
+                    argv = ["/bin/sh", "-c", 'cd -- "$0" && exec "$@"', cwd] + argv
+                pid = os.posix_spawn(
+                    argv[0], argv, env,
+                    file_actions=file_actions,
+                    setsid=True,
+                    setsigdef=(signal.SIGPIPE, signal.SIGXFSZ))
+            except Exception:
+                os.close(master_fd)
+                raise
+            finally:
+                os.close(slave_fd)
+
+            inst = cls(pid, master_fd)
+            inst.argv = argv if cwd is None else argv[4:]
+            inst.env = env
+            if cwd is not None:
+                inst.launch_dir = cwd
+            return inst
+
         def read(self, size):
             b = super().read(size)
             return b.decode("utf-8", "ignore")
@@ -124,6 +646,87 @@ else:
             return super().write(b)
 
 
+class Frame(namedtuple("Frame", [
+    "lines",
+    "columns",
+    "history",
+    "dirty",
+    "cursor",
+    "title",
+    "mode",
+    "alternate_buffer_mode",
+    "alternate_screen_entered",
+    "primary_screen_restored",
+    "clear_scrollback",
+    "images"
+])):
+    """
+    An immutable snapshot of the changes of a screen to be rendered. `history` is a tuple of
+    the lines pushed into the history, the oldest first. `dirty` maps the dirty rows to
+    `(buffer_line, linefeed, span)` where `buffer_line` is a copy of the row and `span` is
+    the dirty column span of the row or None. `cursor` is `(x, y, hidden)`. `images` are
+    shown after the rows are rendered.
+    """
+
+    __slots__ = ()
+
+    def merge(self, frame):
+        """
+        Return a frame which is equivalent to rendering this frame and then `frame`, or
+        None if they cannot be merged.
+        """
+        if frame.history or frame.clear_scrollback or frame.images or self.images:
+            return None
+        if frame.alternate_screen_entered or frame.primary_screen_restored:
+            return None
+        if (frame.lines, frame.columns) != (self.lines, self.columns):
+            return None
+        dirty = dict(self.dirty)
+        for y, (buffer_line, linefeed, span) in frame.dirty.items():
+            if y in dirty and span is not None:
+                old_span = dirty[y][2]
+                if old_span is None:
+                    span = None
+                else:
+                    span = (min(old_span[0], span[0]), max(old_span[1], span[1]))
+            dirty[y] = (buffer_line, linefeed, span)
+        return frame._replace(
+            history=self.history,
+            dirty=dirty,
+            alternate_screen_entered=self.alternate_screen_entered,
+            primary_screen_restored=self.primary_screen_restored,
+            clear_scrollback=self.clear_scrollback)
+
+    def fold(self, frames, max_history=None):
+        """
+        Return this frame with the history, the images and the clearing of the scrollback
+        of the earlier `frames` which are not rendered. This frame should redraw the whole
+        screen as the dirty rows of `frames` are dropped.
+        """
+        history = []
+        images = []
+        clear_scrollback = False
+        restored = False
+        for frame in list(frames) + [self]:
+            if frame.clear_scrollback:
+                history = []
+                images = []
+                clear_scrollback = True
+            history.extend(frame.history)
+            images.extend(frame.images)
+            restored = restored or frame.alternate_screen_entered or \
+                frame.primary_screen_restored
+        if max_history is not None:
+            history = history[-max_history:]
+        return self._replace(
+            history=tuple(history),
+            images=tuple(images),
+            clear_scrollback=clear_scrollback,
+            # the snapshot of the primary screen, if any, is outdated
+            alternate_screen_entered=False,
+            primary_screen_restored=restored)
+
+
 class TerminalScreen(pyte.Screen):
 
     @property
@@ -159,7 +762,19 @@ class TerminalScreen(pyte.Screen):
         self.primary_buffer = {}
         self.history = deque(maxlen=history)
         self._alternate_buffer_mode = False
+        # the alternate screen is kept and reused once it is created
+        self._alternate_buffer = None
+        self._alternate_history = deque(maxlen=0)
+        # flags for the renderer to snapshot and restore the primary screen
+        self.alternate_screen_entered = False
+        self.primary_screen_restored = False
         super().__init__(*args, **kwargs)
+        self.buffer = defaultdict(self.new_line)
+        self.dirty = Damage()
+        self.dirty.update(range(self.lines))
+
+    def new_line(self):
+        return TerminalLine(self.default_char)
 
     # @property
     # def display(self):
@@ -178,11 +793,19 @@ class TerminalScreen(pyte.Screen):
         if lines == self.lines and columns == self.columns:
             return  # No changes.
 
-        self.dirty.update(range(lines))
+        if columns != self.columns:
+            if self.alternate_buffer_mode:
+                # full screen applications redraw themselves
+                for line in self.buffer.values():
+                    for x in range(columns, self.columns):
+                        line.pop(x, None)
+                self.dirty.update(range(lines))
+            else:
+                self.reflow(columns)
 
         line_diff = self.lines - lines
         if line_diff > 0:
-            bottom = self.first_non_empty_line_from_bottom()
+            bottom = max(self.first_non_empty_line_from_bottom(), self.cursor.y)
             num_empty_lines = self.lines - 1 - bottom
             if line_diff > num_empty_lines:
                 line_diff = line_diff - num_empty_lines
@@ -190,15 +813,105 @@ class TerminalScreen(pyte.Screen):
                 self.scroll_up(line_diff)
                 self.cursor.y -= line_diff
 
-        # if columns < self.columns:
-        #     for line in self.buffer.values():
-        #         for x in range(columns, self.columns):
-        #             line.pop(x, None)
+        if lines < self.lines:
+            # so that the renderer trims the rows below the screen
+            self.dirty.add(lines - 1)
 
         self.lines, self.columns = lines, columns
         self.set_margins()
         self.tabstops = set(range(8, self.columns, 8))
 
+    def reflow(self, columns):
+        """
+        Rewrap the screen and the history to `columns` using the linefeed markers.
+        Only the rows which change are marked dirty.
+        """
+        old_columns = self.columns
+        cursor = self.cursor
+        default = self.default_char
+
+        if self.history:
+            history = reflow_history(self.history, columns)
+            self.history.clear()
+            self.history.extend(history)
+
+        # collect the logical lines, a row continues if it ends with a linefeed marker
+        logical_lines = []
+        cursor_at = (0, 0)
+        cells = []
+        bottom = max(self.first_non_empty_line_from_bottom(), cursor.y)
+        for y in range(bottom + 1):
+            line = self.buffer.get(y)
+            if y == cursor.y:
+                cursor_at = (len(logical_lines), len(cells) + cursor.x)
+            if line and line[old_columns - 1].linefeed:
+                row = [line[x] for x in range(old_columns)]
+                row[-1] = row[-1]._replace(linefeed=False)
+                next_line = self.buffer.get(y + 1)
+                if next_line and row[-1].data == " " and wcwidth(next_line[0].data) == 2 and \
+                        not (len(row) > 1 and wcwidth(row[-2].data) == 2):
+                    # the blank left by a double width char which didn't fit, not the stub
+                    # of a double width char
+                    row.pop()
+                cells.extend(row)
+            else:
+                if line:
+                    row = [line[x] for x in range(line.extent)]
+                    while row and row[-1] == default:
+                        row.pop()
+                    cells.extend(row)
+                logical_lines.append(cells)
+                cells = []
+        if cells:
+            logical_lines.append(cells)
+
+        rows = []
+        cursor_row, cursor_col = 0, 0
+        for i, cells in enumerate(logical_lines):
+            wrapped, positions = wrap_cells(cells, columns, default)
+            if i == cursor_at[0]:
+                k = cursor_at[1]
+                if k < len(positions):
+                    cursor_row, cursor_col = positions[k]
+                else:
+                    cursor_row = len(wrapped) - 1
+                    cursor_col = min(len(wrapped[-1]) + k - len(cells), columns)
+                cursor_row += len(rows)
+            rows.extend(wrapped)
+
+        # rows which don't fit are pushed into the history
+        excess = min(max(len(rows) - self.lines, 0), cursor_row)
+        if excess:
+            self.history.extend(
+                HistoryLine.from_buffer_line(self._make_line(row), columns)
+                for row in rows[:excess])
+            rows = rows[excess:]
+            # all rows are shifted
+            self.dirty.update(range(self.lines))
+
+        for y in range(self.lines):
+            old_line = self.buffer.get(y)
+            if y < len(rows) and rows[y]:
+                line = self._make_line(rows[y])
+                if line == old_line:
+                    continue
+                self.buffer[y] = line
+                self.dirty.add(y)
+            elif old_line:
+                self.buffer.pop(y)
+                self.dirty.add(y)
+
+        cursor.y = cursor_row - excess
+        cursor.x = cursor_col
+
+    def _make_line(self, row):
+        line = self.new_line()
+        default = line.default
+        for x, char in enumerate(row):
+            if char != default:
+                line[x] = char
+        return line
+
     def set_margins(self, top=None, bottom=None):
         if (top is None or top == 0) and bottom is None:
             # https://github.com/selectel/pyte/commit/676610b43954b644c05823371df6daf87caafdad
@@ -234,6 +947,9 @@ class TerminalScreen(pyte.Screen):
         data = data.translate(
             self.g1_charset if self.charset else self.g0_charset)
 
+        # the first column which is touched on the current row
+        start = self.cursor.x
+
         for char in data:
             char_width = wcwidth(char)
             if (self.cursor.x == self.columns and char_width >= 1)  \
@@ -242,11 +958,13 @@ class TerminalScreen(pyte.Screen):
                     last = self.buffer[self.cursor.y][self.columns - 1]
                     self.buffer[self.cursor.y][self.columns - 1] = \
                         last._replace(linefeed=True)
-                    self.dirty.add(self.cursor.y)
+                    self.dirty.mark(self.cursor.y, min(start, self.columns - 1), self.columns)
                     self.carriage_return()
                     self.linefeed()
+                    start = 0
                 elif char_width > 0:
                     self.cursor.x -= char_width
+                    start = min(start, self.cursor.x)
 
             if mo.IRM in self.mode and char_width > 0:
                 self.insert_characters(char_width)
@@ -295,7 +1013,7 @@ class TerminalScreen(pyte.Screen):
             if char_width > 0:
                 self.cursor.x = min(self.cursor.x + char_width, self.columns)
 
-        self.dirty.add(self.cursor.y)
+        self.dirty.mark(self.cursor.y, start, self.cursor.x)
 
     # def set_title(self, param):
     #     pass
@@ -335,17 +1053,52 @@ class TerminalScreen(pyte.Screen):
     # def delete_lines(self, count=None):
     #     pass
 
-    # def insert_characters(self, count=None):
-    #     pass
-
-    # def delete_characters(self, count=None):
-    #     pass
+    # the following methods are the same as pyte's except that only the touched columns
+    # are marked as dirty
+
+    def insert_characters(self, count=None):
+        count = count or 1
+        line = self.buffer[self.cursor.y]
+        for x in range(self.columns, self.cursor.x - 1, -1):
+            # the chars pushed past the last column are dropped
+            if x + count < self.columns:
+                line[x + count] = line[x]
+            line.pop(x, None)
+        self.dirty.mark(self.cursor.y, self.cursor.x, self.columns)
+
+    def delete_characters(self, count=None):
+        count = count or 1
+        line = self.buffer[self.cursor.y]
+        for x in range(self.cursor.x, self.columns):
+            if x + count <= self.columns:
+                line[x] = line.pop(x + count, self.default_char)
+            else:
+                line.pop(x, None)
+        self.dirty.mark(self.cursor.y, self.cursor.x, self.columns)
+
+    def erase_characters(self, count=None):
+        count = count or 1
+        line = self.buffer[self.cursor.y]
+        end = min(self.cursor.x + count, self.columns)
+        for x in range(self.cursor.x, end):
+            line[x] = self.cursor.attrs
+        self.dirty.mark(self.cursor.y, self.cursor.x, end)
+
+    def erase_in_line(self, how=0, private=False):
+        if how == 0:
+            interval = range(self.cursor.x, self.columns)
+        elif how == 1:
+            interval = range(self.cursor.x + 1)
+        elif how == 2:
+            interval = range(self.columns)
+        else:
+            return
 
-    # def erase_characters(self, count=None):
-    #     pass
-
-    # def erase_in_line(self, how=0, private=False):
-    #     pass
+        line = self.buffer[self.cursor.y]
+        for x in interval:
+            line[x] = self.cursor.attrs
+        if interval:
+            self.dirty.mark(self.cursor.y, interval[0], interval[-1] + 1)
 
     def erase_in_display(self, how=0, *args, **kwargs):
         # dump the screen to history
@@ -363,11 +1116,18 @@ class TerminalScreen(pyte.Screen):
             interval = range(self.lines)
 
         self.dirty.update(interval)
+        attrs = self.cursor.attrs
         for y in interval:
-            line = self.buffer[y]
+            line = self.buffer.get(y)
+            if not line:
+                continue
+            if attrs == line.default:
+                # missing cells fall back to the default char
+                line.clear()
+                continue
             for i, x in list(enumerate(line)):
                 if i < self.columns:
-                    line[x] = self.cursor.attrs
+                    line[x] = attrs
                 else:
                     line.pop(x, None)
 
@@ -535,24 +1295,77 @@ class TerminalScreen(pyte.Screen):
             self.primary_buffer["buffer"] = self.buffer
             self.primary_buffer["history"] = self.history
             self.primary_buffer["cursor"] = self.cursor
-            self.buffer = defaultdict(lambda: StaticDefaultDict(self.default_char))
-            self.history = deque(maxlen=0)
+            self.primary_buffer["size"] = (self.lines, self.columns)
+            # the damage of the primary screen which is not rendered yet
+            self.primary_buffer["dirty"] = dict(self.dirty.spans)
+            if self._alternate_buffer is None:
+                self._alternate_buffer = defaultdict(self.new_line)
+            else:
+                default = self.default_char
+                for line in self._alternate_buffer.values():
+                    line.clear()
+                    line.default = default
+            self.buffer = self._alternate_buffer
+            self.history = self._alternate_history
             self.cursor = Cursor(0, 0)
+            self.dirty.update(range(self.lines))
+            self.alternate_screen_entered = True
         else:
             self.buffer = self.primary_buffer["buffer"]
             self.history = self.primary_buffer["history"]
             self.cursor = self.primary_buffer["cursor"]
-
-        self.dirty.update(range(self.lines))
+            self.dirty.clear()
+            for y, span in self.primary_buffer["dirty"].items():
+                if span is None:
+                    self.dirty.add(y)
+                else:
+                    self.dirty.mark(y, *span)
+            lines, columns = self.lines, self.columns
+            if self.primary_buffer["size"] != (lines, columns):
+                # the screen was resized in the alternate screen
+                self.lines, self.columns = self.primary_buffer["size"]
+                self.resize(lines, columns)
+                self.dirty.update(range(self.lines))
+            # the renderer either restores the view from a snapshot or repaints
+            self.primary_screen_restored = True
+
+    def take_frame(self, clear_scrollback=False, images=()):
+        """
+        Return a frame of the changes since the last frame. The damage and the history
+        lines are handed over to the frame.
+        """
+        columns = self.columns
+        dirty = {}
+        for y in self.dirty:
+            buffer_line = self.buffer[y]
+            dirty[y] = (copy(buffer_line), buffer_line[columns - 1].linefeed, self.dirty.span(y))
+        history = tuple(self.history)
+        self.history.clear()
+        cursor = self.cursor
+        frame = Frame(
+            self.lines,
+            columns,
+            history,
+            dirty,
+            (cursor.x, cursor.y, cursor.hidden),
+            self.title,
+            frozenset(self.mode),
+            self.alternate_buffer_mode,
+            self.alternate_screen_entered,
+            self.primary_screen_restored,
+            clear_scrollback,
+            tuple(images))
+        self.dirty.clear()
+        self.alternate_screen_entered = False
+        self.primary_screen_restored = False
+        return frame
 
     def first_non_empty_line_from_bottom(self):
-        found = -1
-        for nz_line in reversed(range(self.lines)):
-            text = "".join([c.data for c in self.buffer[nz_line].values()])
-            if text and not text.isspace():
-                found = nz_line
-                break
-        return found
+        for y in reversed(range(self.lines)):
+            line = self.buffer.get(y)
+            if line and not line.is_blank():
+                return y
+        return -1
 
     def push_lines_into_history(self, count=None):
         if self.alternate_buffer_mode:
@@ -560,7 +1373,9 @@ class TerminalScreen(pyte.Screen):
         if count is None:
             # find the first non-empty line from the botton
             count = self.first_non_empty_line_from_bottom() + 1
-        self.history.extend(copy(self.buffer[y]) for y in range(count))
+        columns = self.columns
+        self.history.extend(
+            HistoryLine.from_buffer_line(self.buffer[y], columns) for y in range(count))
 
 
 PLAIN_TEXT = "plain_text"
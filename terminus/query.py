@@ -12,6 +12,8 @@ class TerminusQueryContextListener(sublime_plugin.EventListener):
     """
 
     def on_query_context(self, view, key, operator, operand, match_all):
+        if not key.startswith("terminus_view"):
+            return
         if key == "terminus_view.exec_panel_exists":
             if not view.window():
                 return
@@ -28,7 +30,7 @@ class TerminusQueryContextListener(sublime_plugin.EventListener):
                 return True
             elif visible != operand and operator == sublime.OP_NOT_EQUAL:
                 return True
-        elif key.startswith("terminus_view"):
+        else:
             tag = view.settings().get(key, None)
             if tag == operand and operator == sublime.OP_EQUAL:
                 return True
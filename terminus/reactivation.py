@@ -0,0 +1,147 @@
+import sublime
+
+import time
+import heapq
+import logging
+import itertools
+
+from .terminal import Terminal
+
+logger = logging.getLogger('Terminus')
+
+
+# priorities of the terminals waiting to be reactivated
+FOCUSED = 0
+VISIBLE = 1
+BACKGROUND = 2
+
+
+def get_reactivation_args(view):
+    """
+    Return the arguments of `terminus_activate` if the view is a terminal which should be
+    reactivated, otherwise None.
+    """
+    settings = view.settings()
+    if not settings.get("terminus_view", False):
+        return None
+    if Terminal.from_id(view.id()):
+        return None
+    if not settings.has("terminus_view.args"):
+        return None
+    if settings.get("terminus_view.finished", False):
+        return None
+    if not settings.get("terminus_view.reactivable", False):
+        return None
+    kwargs = settings.get("terminus_view.args")
+    if "cmd" not in kwargs:
+        return None
+    return kwargs
+
+
+class ReactivationQueue:
+    """
+    Reactivate the terminals of restored windows a few at a time, the focused terminal
+    first. A reactivation is complete when the terminal prints its first output or when it
+    times out. The terminals which are not viewed are reactivated after an idle period if
+    `reactivation_idle_delay` is set.
+    """
+    # maximum time in seconds to wait for the first output of a terminal
+    timeout = 5
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._queue = []
+        self._counter = itertools.count()
+        # view id -> priority of the queued terminals
+        self._queued = {}
+        # view id -> (terminal, start time) of the terminals being reactivated
+        self._running = {}
+        self._idle_token = None
+
+    def push(self, view, priority):
+        """
+        Queue a terminal view for reactivation. It should be called in the main thread.
+        """
+        vid = view.id()
+        if vid in self._running:
+            return
+        if vid in self._queued and self._queued[vid] <= priority:
+            return
+        self._queued[vid] = priority
+        heapq.heappush(self._queue, (priority, next(self._counter), vid))
+        self._pump()
+
+    def _pump(self):
+        settings = sublime.load_settings("Terminus.sublime-settings")
+        concurrency = max(settings.get("reactivation_concurrency", 2), 1)
+        while self._queue and len(self._running) < concurrency:
+            priority, _, vid = heapq.heappop(self._queue)
+            if self._queued.get(vid) != priority:
+                # it was queued again with a higher priority
+                continue
+            del self._queued[vid]
+            view = sublime.View(vid)
+            if not view.is_valid():
+                continue
+            kwargs = get_reactivation_args(view)
+            if not kwargs:
+                continue
+            self._reactivate(view, kwargs)
+
+        if not self._queue and not self._running:
+            self._schedule_idle_reactivation()
+
+    def _reactivate(self, view, kwargs):
+        vid = view.id()
+        startt = time.time()
+        engine_tid = view.settings().get("terminus_view.engine_tid")
+        if engine_tid:
+            # attach the terminal if it is still run by the engine server
+            kwargs = dict(kwargs, engine_tid=engine_tid)
+        view.run_command("terminus_activate", kwargs)
+        terminal = Terminal.from_id(vid)
+        if not terminal:
+            return
+        logger.debug("reactivating {}, spawned in {:.3f}s".format(
+            view.name(), time.time() - startt))
+        self._running[vid] = (terminal, startt)
+        sublime.set_timeout(lambda: self._check(vid), 50)
+
+    def _check(self, vid):
+        terminal, startt = self._running[vid]
+        elapsed = time.time() - startt
+        if terminal.first_output.is_set():
+            logger.debug("terminal {} reactivated, first output after {:.3f}s".format(
+                terminal.default_title, elapsed))
+        elif elapsed > self.timeout or not terminal.alive:
+            logger.debug("terminal {} has no output after {:.3f}s".format(
+                terminal.default_title, elapsed))
+        else:
+            sublime.set_timeout(lambda: self._check(vid), 50)
+            return
+        del self._running[vid]
+        self._pump()
+
+    def _schedule_idle_reactivation(self):
+        settings = sublime.load_settings("Terminus.sublime-settings")
+        delay = settings.get("reactivation_idle_delay", 0)
+        if not delay:
+            return
+        token = object()
+        self._idle_token = token
+
+        def _reactivate_all():
+            if self._idle_token is not token:
+                return
+            for window in sublime.windows():
+                for view in window.views():
+                    if get_reactivation_args(view):
+                        self.push(view, BACKGROUND)
+
+        sublime.set_timeout(_reactivate_all, delay * 1000)
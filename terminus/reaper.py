@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import ctypes
+import select
+import signal
+import logging
+import threading
+
+logger = logging.getLogger('Terminus')
+
+
+if sys.platform.startswith("win"):
+    ESCALATION = []
+else:
+    # the signals sent to a process in turn and the time in seconds given to the process to
+    # exit after each of them
+    ESCALATION = [
+        (signal.SIGHUP, 0.5),
+        (signal.SIGTERM, 1),
+        (signal.SIGKILL, 1)
+    ]
+
+# the syscall number of pidfd_open, it is shared by all the architectures except alpha
+SYS_PIDFD_OPEN = 434
+
+
+def pidfd_open(pid):
+    """
+    Return a file descriptor which becomes readable when the process exits, or None if it is
+    not supported. It raises ProcessLookupError if the process doesn't exist.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    if hasattr(os, "pidfd_open"):
+        try:
+            return os.pidfd_open(pid)
+        except ProcessLookupError:
+            raise
+        except OSError:
+            return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.syscall(SYS_PIDFD_OPEN, pid, 0)
+    except Exception:
+        return None
+    if fd < 0:
+        errno = ctypes.get_errno()
+        if errno == 3:  # ESRCH
+            raise ProcessLookupError(errno, os.strerror(errno))
+        return None
+    return fd
+
+
+def poll(process):
+    """
+    Return True if the process is alive. Unlike `process.isalive()`, it never blocks.
+    """
+    if sys.platform.startswith("win"):
+        return process.isalive()
+    if process.terminated:
+        return False
+    try:
+        pid, status = os.waitpid(process.pid, os.WNOHANG)
+    except ChildProcessError:
+        process.terminated = True
+        return False
+    if pid == 0:
+        return True
+    process.status = status
+    if os.WIFEXITED(status):
+        process.exitstatus = os.WEXITSTATUS(status)
+        process.signalstatus = None
+    elif os.WIFSIGNALED(status):
+        process.exitstatus = None
+        process.signalstatus = os.WTERMSIG(status)
+    process.terminated = True
+    return False
+
+
+def wait(process, timeout):
+    """
+    Wait up to `timeout` seconds for the process to exit. Return True if it has exited.
+    """
+    deadline = time.time() + timeout
+    while poll(process):
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Reaper:
+    """
+    Terminate processes in a background thread so that the main thread is not blocked by the
+    processes which are slow to exit. The signals in `ESCALATION` are sent until the process
+    exits, all the processes being terminated are signaled in parallel.
+    """
+    # the period in seconds to check the processes being terminated
+    period = 0.05
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.cv = threading.Condition()
+        # list of [process, index of the next signal, deadline of the next signal]
+        self._processes = []
+        self._thread = None
+
+    def terminate(self, process):
+        if not poll(process):
+            return
+
+        if sys.platform.startswith("win"):
+            threading.Thread(target=lambda: process.terminate(force=True)).start()
+            return
+
+        with self.cv:
+            if any(entry[0] is process for entry in self._processes):
+                return
+            self._processes.append([process, 0, 0])
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self.cv.notify()
+
+    def _run(self):
+        while True:
+            with self.cv:
+                if not self._processes:
+                    self._thread = None
+                    return
+                processes = list(self._processes)
+
+            now = time.time()
+            finished = []
+            for entry in processes:
+                process, stage, deadline = entry
+                if not poll(process):
+                    logger.debug("process {} is terminated".format(process.pid))
+                    finished.append(entry)
+                    continue
+                if now < deadline:
+                    continue
+                if stage >= len(ESCALATION):
+                    logger.debug("process {} cannot be terminated".format(process.pid))
+                    finished.append(entry)
+                    continue
+                sig, delay = ESCALATION[stage]
+                try:
+                    os.kill(process.pid, sig)
+                    if sig == signal.SIGHUP:
+                        # wake up the process if it is stopped
+                        os.kill(process.pid, signal.SIGCONT)
+                except ProcessLookupError:
+                    pass
+                entry[1] = stage + 1
+                entry[2] = now + delay
+
+            with self.cv:
+                for entry in finished:
+                    self._processes.remove(entry)
+                if self._processes:
+                    self.cv.wait(self.period)
+
+
+class ExitWatcher:
+    """
+    Notify when the watched processes exit, so that the liveness of the processes can be
+    cached instead of being checked by `waitpid` calls. The exits are detected by polling
+    pidfds on Linux and by polling `waitpid` periodically otherwise.
+    """
+    # the period in seconds to check the processes without pidfds
+    period = 0.1
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # pidfd -> (process, callback)
+        self._pidfds = {}
+        # list of (process, callback) of the processes without pidfds
+        self._polled = []
+        self._thread = None
+        self._wakeup = None
+
+    def watch(self, process, callback):
+        """
+        Call `callback` in the watcher thread when the process exits. The exit status of the
+        process is collected before the callback is called.
+        """
+        pidfd = None
+        if not sys.platform.startswith("win"):
+            try:
+                pidfd = pidfd_open(process.pid)
+            except ProcessLookupError:
+                poll(process)
+                callback()
+                return
+
+        with self.lock:
+            if pidfd is not None:
+                self._pidfds[pidfd] = (process, callback)
+            else:
+                self._polled.append((process, callback))
+            if not self._thread:
+                if self._wakeup is None and hasattr(select, "poll"):
+                    self._wakeup = os.pipe()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            elif self._wakeup:
+                os.write(self._wakeup[1], b"x")
+
+    def _run(self):
+        if self._wakeup:
+            poller = select.poll()
+            poller.register(self._wakeup[0], select.POLLIN)
+        else:
+            # there are no pidfds without select.poll
+            poller = None
+        registered = set()
+        while True:
+            with self.lock:
+                if not self._pidfds and not self._polled:
+                    self._thread = None
+                    return
+                for pidfd in self._pidfds.keys() - registered:
+                    poller.register(pidfd, select.POLLIN)
+                    registered.add(pidfd)
+                timeout = self.period * 1000 if self._polled else None
+
+            exited = []
+            if poller:
+                events = poller.poll(timeout)
+            else:
+                time.sleep(self.period)
+                events = []
+            for fd, _ in events:
+                if fd == self._wakeup[0]:
+                    os.read(fd, 1024)
+                    continue
+                poller.unregister(fd)
+                registered.discard(fd)
+                with self.lock:
+                    exited.append(self._pidfds.pop(fd))
+                os.close(fd)
+
+            with self.lock:
+                for entry in list(self._polled):
+                    if not poll(entry[0]):
+                        self._polled.remove(entry)
+                        exited.append(entry)
+
+            for process, callback in exited:
+                # collect the exit status, the process is a zombie if it is not reaped yet
+                wait(process, 1)
+                try:
+                    callback()
+                except Exception as e:
+                    logger.debug("exit callback of process {} fails: {}".format(
+                        process.pid, e))
@@ -4,101 +4,53 @@ import sublime_plugin
 import time
 import math
 import logging
-import pyte
 from functools import lru_cache
-from wcwidth import wcswidth
 
 
+from Terminus.tools.theme_generator import ANSI_COLORS
 from .const import CONTINUATION
-from .ptty import XTERM_256_COLORS
+from .scheme import ANSI_SCOPES, color256_rules, truecolor_rules
+from .snapshot import encode_scrollback, decode_scrollback
+from .memory import MemoryBudget
 from .terminal import Terminal
-from .utils import rev_wcwidth, get_highlight_key
+from .tick import RenderTick
+from .utils import rev_wcwidth, get_highlight_key, set_settings_on_change
 
 logger = logging.getLogger('Terminus')
 
+# the number of the unchanged lines between two rewrapped lines which are replaced together
+MAX_REFLOW_TAIL = 100
 
-@lru_cache(maxsize=10000)
-def is_supported_color(c):
-    return c in ['default', 'reverse_default'] or c in XTERM_256_COLORS
+# the settings of the renderers and their defaults
+RENDER_SETTINGS = {
+    "scrollback_history_size": 10000,
+    "brighten_bold_text": False,
+    "truecolor": False,
+    "256color": False,
+    "lazy_color_scheme": False
+}
 
+# the settings of the renderers, they are cached because they are read on every render
+_render_settings = {}
 
-RGB256 = {}
-for c in pyte.graphics.FG_BG_256:
-    RGB256[c] = tuple(int(c[i:i+2], 16) for i in (0, 2, 4))
 
+def get_render_settings():
+    if not _render_settings:
+        settings = sublime.load_settings("Terminus.sublime-settings")
 
-# https://en.wikipedia.org/wiki/Color_difference#sRGB
-@lru_cache(maxsize=10000)
-def get_closest_color(c):
-    r, g, b = tuple(int(c[i:i+2], 16) for i in (0, 2, 4))
-    dmin = 1000000
-    closest_color = "000000"
-    for c, (r2, g2, b2) in RGB256.items():
-        redmean = (r + r2) / 2
-        d = (2 + redmean / 256) * (r - r2) ** 2 + 4 * \
-            (g - g2)**2 + (2 + (255-redmean) / 256) * (b - b2)**2
-        if d < dmin:
-            dmin = d
-            closest_color = c
-    return closest_color
-
-
-def reverse_fg_bg(fg, bg):
-    fg, bg = bg, fg
-    if fg == "default":
-        fg = "reverse_default"
-    if bg == "default":
-        bg = "reverse_default"
-    return fg, bg
-
-
-def segment_buffer_line(buffer_line):
-    """
-    segment a buffer line based on bg and fg colors
-    """
-    is_wide_char = False
-    text = ""
-    start = 0
-    counter = 0
-    fg = "default"
-    bg = "default"
-    bold = False
-    reverse = False
-
-    if buffer_line:
-        last_index = max(buffer_line.keys()) + 1
-    else:
-        last_index = 0
-
-    for i in range(last_index):
-        if is_wide_char:
-            is_wide_char = False
-            continue
-        char = buffer_line[i]
-        is_wide_char = wcswidth(char.data) >= 2
-
-        if counter == 0:
-            counter = i
-            text = " " * i
-
-        if fg != char.fg or bg != char.bg or bold != char.bold or reverse != char.reverse:
-            if reverse:
-                fg, bg = reverse_fg_bg(fg, bg)
-            yield text, start, counter, fg, bg, bold
-            fg = char.fg
-            bg = char.bg
-            bold = char.bold
-            reverse = char.reverse
-            text = char.data
-            start = counter
-        else:
-            text += char.data
+        def update(_=None):
+            for key, default in RENDER_SETTINGS.items():
+                _render_settings[key] = settings.get(key, default)
 
-        counter += 1
+        update()
+        set_settings_on_change(settings, list(RENDER_SETTINGS), update)
+    return _render_settings
 
-    if reverse:
-        fg, bg = reverse_fg_bg(fg, bg)
-    yield text, start, counter, fg, bg, bold
+
+@lru_cache(maxsize=10000)
+def is_supported_color(c):
+    from .ptty import XTERM_256_COLORS
+    return c in ['default', 'reverse_default'] or c in XTERM_256_COLORS
 
 
 class TerminusViewMixin:
@@ -119,24 +71,47 @@ class TerminusRenderCommand(sublime_plugin.TextCommand, TerminusViewMixin):
         super().__init__(*args, **kwargs)
         # it keeps all the highlight keys
         self.colored_lines = {}
-        settings = sublime.load_settings("Terminus.sublime-settings")
-        self.scrollback_history_size = settings.get("scrollback_history_size", 10000)
-        self.brighten_bold_text = settings.get("brighten_bold_text", False)
+        self.region_count = 0
+        # the rendered primary screen while the alternate screen is shown
+        self.primary_snapshot = None
+        self.load_settings()
 
-    def run(self, edit):
+    def load_settings(self):
+        """
+        The settings are loaded on every render, so that the views follow the changes of the
+        color settings.
+        """
+        settings = get_render_settings()
+        self.scrollback_history_size = settings["scrollback_history_size"]
+        self.brighten_bold_text = settings["brighten_bold_text"]
+        self.truecolor = settings["truecolor"]
+        self.color256 = settings["256color"]
+        self.lazy_color_scheme = self.color256 and settings["lazy_color_scheme"]
+
+    def run(self, edit, detach=False, evict_scrollback=None, evict_lines=None):
         view = self.view
         startt = time.time()
         terminal = Terminal.from_id(view.id())
         if not terminal:
             return
+        self.load_settings()
+
+        if detach:
+            # the scrollback is moved to the next view of the terminal, the frames which are
+            # not rendered yet are rendered to the next view
+            with terminal.lock:
+                terminal.scrollback_snapshot = self.take_scrollback_snapshot(terminal)
+                terminal._detach_view()
+            return
 
-        screen = terminal.screen
+        if evict_scrollback:
+            self.evict_scrollback(edit, terminal, evict_scrollback, evict_lines)
+            terminal.region_count = self.region_count
+            return
 
-        if terminal._pending_to_clear_scrollback[0]:
-            view.replace(edit, sublime.Region(0, view.size()), "")  # nuke everything
-            terminal.offset = 0
-            terminal.clean_images()
-            terminal._pending_to_clear_scrollback[0] = False
+        if terminal.scrollback_snapshot:
+            self.restore_scrollback_snapshot(edit, terminal.scrollback_snapshot)
+            terminal.scrollback_snapshot = None
 
         if terminal._pending_to_reset[0]:
             def _reset():
@@ -146,11 +121,19 @@ class TerminusRenderCommand(sublime_plugin.TextCommand, TerminusViewMixin):
 
             sublime.set_timeout(_reset)
 
-        self.update_lines(edit, terminal)
+        for frame in terminal.take_frames():
+            self.render_frame(edit, terminal, frame)
+        terminal.region_count = self.region_count
+        MemoryBudget.instance().request_check()
+
+        frame = terminal.frame
+        if not frame:
+            return
+
         viewport_y = view.settings().get("terminus_view.viewport_y", 0)
         if viewport_y < view.viewport_position()[1] + view.line_height():
-            self.trim_trailing_spaces(edit, terminal)
-            self.trim_history(edit, terminal)
+            self.trim_trailing_spaces(edit, terminal, frame)
+            self.trim_history(edit, terminal, frame)
             view.run_command("terminus_show_cursor")
 
         current_title = view.name()
@@ -158,44 +141,258 @@ class TerminusRenderCommand(sublime_plugin.TextCommand, TerminusViewMixin):
             if current_title != terminal.title:
                 view.set_name(terminal.title)
         else:
-            if screen.title:
-                if current_title != screen.title:
-                    view.set_name(screen.title)
+            if frame.title:
+                if current_title != frame.title:
+                    view.set_name(frame.title)
             else:
                 if current_title != terminal.default_title:
                     view.set_name(terminal.default_title)
 
-        # we should not clear dirty lines here, it shoud be done in the eventloop
-        # screen.dirty.clear()
         logger.debug("updating lines takes {}s".format(str(time.time() - startt)))
         logger.debug("mode: {}, cursor: {}.{}".format(
-            [m >> 5 for m in screen.mode], screen.cursor.x, screen.cursor.y))
-
-    def update_lines(self, edit, terminal):
-        # cursor = screen.cursor
-        screen = terminal.screen
-        columns = screen.columns
-        dirty_lines = sorted(screen.dirty)
-        if dirty_lines:
+            [m >> 5 for m in frame.mode], frame.cursor[0], frame.cursor[1]))
+
+    def render_frame(self, edit, terminal, frame):
+        view = self.view
+        if frame.clear_scrollback:
+            view.replace(edit, sublime.Region(0, view.size()), "")  # nuke everything
+            terminal.offset = 0
+            terminal.clean_images()
+            self.colored_lines = {}
+            self.region_count = 0
+            self.primary_snapshot = None
+            if self.truecolor:
+                truecolor_rules().release_view(view.id())
+            if self.lazy_color_scheme:
+                color256_rules().release_view(view.id())
+
+        self.switch_screen(edit, terminal, frame)
+        self.update_lines(edit, terminal, frame)
+        if terminal.frame and terminal.frame.columns != frame.columns:
+            self.reflow_scrollback(edit, terminal, frame.columns)
+        for data, args, row, col in frame.images:
+            terminal.insert_image(data, args, row, col)
+        terminal.frame = frame
+
+    def switch_screen(self, edit, terminal, frame):
+        """
+        Take a snapshot of the rendered primary screen when the alternate screen is
+        entered, and put it back when the alternate screen is left, so the primary screen
+        doesn't need to be rendered again.
+        """
+        entered = frame.alternate_screen_entered
+        restored = frame.primary_screen_restored
+
+        if entered and restored:
+            # the alternate screen was never rendered
+            if not frame.alternate_buffer_mode:
+                return
+            restored = False
+        elif restored:
+            snapshot = self.primary_snapshot
+            self.primary_snapshot = None
+            if snapshot and snapshot["offset"] == terminal.offset and \
+                    snapshot["size"] == (frame.lines, frame.columns):
+                self.restore_primary_snapshot(edit, snapshot)
+            else:
+                terminal.request_full_frame()
+
+        if entered:
+            self.primary_snapshot = self.take_primary_snapshot(terminal, frame)
+
+    def take_primary_snapshot(self, terminal, frame):
+        view = self.view
+        offset = terminal.offset
+        if view.rowcol(view.size())[0] < offset:
+            text = ""
+        else:
+            text = view.substr(sublime.Region(view.text_point(offset, 0), view.size()))
+        regions = []
+        for line, colored in self.colored_lines.items():
+            if line >= offset:
+                for _, start, end, scope in colored:
+                    regions.append((line - offset, start, end, scope))
+        return {
+            "offset": offset,
+            "size": (frame.lines, frame.columns),
+            "text": text,
+            "regions": regions
+        }
+
+    def restore_primary_snapshot(self, edit, snapshot):
+        view = self.view
+        offset = snapshot["offset"]
+        for line in [line for line in self.colored_lines if line >= offset]:
+            self.decolorize_line(line)
+        self.ensure_position(edit, offset)
+        view.replace(
+            edit, sublime.Region(view.text_point(offset, 0), view.size()), snapshot["text"])
+        for row, start, end, scope in snapshot["regions"]:
+            line = offset + row
+            self.add_colored_region(line, start, end, scope)
+
+    def take_scrollback_snapshot(self, terminal):
+        """
+        Encode the rendered scrollback, the lines above the screen, with their colors.
+        """
+        view = self.view
+        offset = terminal.offset
+        if offset == 0:
+            return None
+        text = view.substr(sublime.Region(0, view.text_point(offset, 0)))
+        texts = text.split("\n")[:offset]
+        texts.extend([""] * (offset - len(texts)))
+        lines = [(t, []) for t in texts]
+        for line, colored in self.colored_lines.items():
+            if line < offset:
+                lines[line][1].extend((start, end, scope) for _, start, end, scope in colored)
+        return encode_scrollback(lines)
+
+    def restore_scrollback_snapshot(self, edit, snapshot):
+        view = self.view
+        lines = decode_scrollback(snapshot)
+        view.insert(edit, 0, "".join(text + "\n" for text, _ in lines))
+        for line, (_, regions) in enumerate(lines):
+            for start, end, scope in regions:
+                self.add_colored_region(line, start, end, scope)
+
+    def reflow_scrollback(self, edit, terminal, columns):
+        """
+        Rewrap the rendered scrollback, the lines above the screen, to `columns`. A line
+        which ends with the continuation marker is joined with the next line and the colored
+        regions are carried over. Only the logical lines whose wrapping changes are
+        rewritten, nearby ones are replaced at once.
+        """
+        from .ptty import join_wrapped_lines, text_width, wrap_history_text
+
+        view = self.view
+        offset = terminal.offset
+        if offset == 0:
+            return
+        text = view.substr(sublime.Region(0, view.text_point(offset, 0)))
+        texts = text.split("\n")[:offset]
+        texts.extend([""] * (offset - len(texts)))
+        wrapped = [t.endswith(CONTINUATION) for t in texts]
+        # the last line of the scrollback may continue on the screen
+        wrapped.append(False)
+
+        colored_lines = self.colored_lines
+        self.colored_lines = {}
+        # the change of the number of the lines above the current line
+        delta = 0
+        # the first row, the new lines and the colors of the old lines to be replaced
+        block = None
+        # the unchanged lines without colors after the block, they join the block if it is
+        # continued by another rewritten line
+        tail = []
+
+        def replace_block():
+            nonlocal delta
+            row, new_lines, old_colored = block
+            begin = view.text_point(row + delta, 0)
+            end = view.line(view.text_point(row + delta + len(old_colored) - 1, 0)).end()
+            view.replace(edit, sublime.Region(begin, end), "\n".join(t for t, _ in new_lines))
+            for i, (_, runs) in enumerate(new_lines):
+                for start, length, scope in runs:
+                    self.add_colored_region(row + delta + i, start, start + length, scope)
+            # the scopes are acquired again before they are released
+            for colored in old_colored:
+                for key, _, _, scope in colored:
+                    view.erase_regions(key)
+                    self.release_scope(scope)
+                    self.region_count -= 1
+            delta += len(new_lines) - len(old_colored)
+
+        def rewrap(row, end):
+            """
+            Return the logical line of the rows `row` to `end` rewrapped, or None if its
+            wrapping is unchanged.
+            """
+            lines = []
+            for r in range(row, end + 1):
+                t = texts[r]
+                if wrapped[r]:
+                    t = t[:-len(CONTINUATION)]
+                runs = sorted(
+                    (start, stop - start, scope)
+                    for _, start, stop, scope in colored_lines.get(r, ()))
+                lines.append((t, runs))
+            new_lines = [
+                (line.text + CONTINUATION if line.linefeed else line.text, line.runs)
+                for line in wrap_history_text(
+                    *join_wrapped_lines(lines), columns, linefeed=wrapped[end])]
+            if len(new_lines) == end + 1 - row and \
+                    all(t == texts[row + i] for i, (t, _) in enumerate(new_lines)):
+                return None
+            return new_lines
+
+        row = 0
+        while row < offset:
+            t = texts[row]
+            if not wrapped[row] and len(t) <= columns and \
+                    (t.isascii() or text_width(t) <= columns):
+                # a line which fits is kept
+                end = row
+                new_lines = None
+            else:
+                end = row
+                while end < offset - 1 and wrapped[end]:
+                    end += 1
+                new_lines = rewrap(row, end)
+            if new_lines is not None:
+                old_colored = [colored_lines.get(r, ()) for r in range(row, end + 1)]
+                if block:
+                    block[1].extend((t, ()) for t in tail)
+                    block[2].extend(() for t in tail)
+                    block[1].extend(new_lines)
+                    block[2].extend(old_colored)
+                else:
+                    block = (row, new_lines, old_colored)
+                tail = []
+            elif any(r in colored_lines for r in range(row, end + 1)) or \
+                    (block and len(tail) > MAX_REFLOW_TAIL):
+                if block:
+                    replace_block()
+                    block = None
+                    tail = []
+                for r in range(row, end + 1):
+                    if r in colored_lines:
+                        self.colored_lines[r + delta] = colored_lines[r]
+            elif block:
+                tail.extend(texts[row:end + 1])
+            row = end + 1
+        if block:
+            replace_block()
+
+        # the lines of the screen
+        for line, colored in colored_lines.items():
+            if line >= offset:
+                self.colored_lines[line + delta] = colored
+        terminal.offset += delta
+
+    def update_lines(self, edit, terminal, frame):
+        dirty_lines = sorted(frame.dirty)
+        if dirty_lines or frame.history:
             # replay history
-            history = screen.history
+            history = frame.history
             terminal.offset += len(history)
             offset = terminal.offset
             logger.debug("add {} line(s) to scroll back history".format(len(history)))
 
-            for line in range(len(history)):
-                buffer_line = history.pop()
-                lf = buffer_line[columns - 1].linefeed
-                self.update_line(edit, offset - line - 1, buffer_line, lf)
+            for line, history_line in enumerate(reversed(history)):
+                self.update_line(edit, offset - line - 1, history_line, history_line.linefeed)
 
             # update dirty line¡s
             logger.debug("screen is dirty: {}".format(str(dirty_lines)))
             for line in dirty_lines:
-                buffer_line = screen.buffer[line]
-                lf = buffer_line[columns - 1].linefeed
+                buffer_line, lf, span = frame.dirty[line]
+                if span and self.update_line_span(edit, line + offset, buffer_line, lf, span):
+                    continue
                 self.update_line(edit, line + offset, buffer_line, lf)
 
     def update_line(self, edit, line, buffer_line, lf):
+        from .ptty import segment_buffer_line
+
         view = self.view
         # make sure the view has enough lines
         self.ensure_position(edit, line)
@@ -214,45 +411,138 @@ class TerminusRenderCommand(sublime_plugin.TextCommand, TerminusViewMixin):
         view.replace(edit, line_region, text)
         self.colorize_line(edit, line, segments)
 
-    def colorize_line(self, edit, line, segments):
+    def update_line_span(self, edit, line, buffer_line, lf, span):
+        """
+        Only replace the dirty columns `span` of a line and the regions overlapping them.
+        It works for lines without double width chars and continuation markers, where
+        the columns are the same as the text positions. Return False if the whole line
+        has to be updated.
+        """
+        from .ptty import segment_buffer_line
+
         view = self.view
+        start, end = span
+        if lf or getattr(buffer_line, "wide", True):
+            return False
+        if view.rowcol(view.size())[0] < line:
+            return False
+        line_region = view.line(view.text_point(line, 0))
+        text = view.substr(line_region)
+        if CONTINUATION in text:
+            return False
+        if start >= end:
+            return True
+
+        size = len(text)
+        extent = buffer_line.extent
+        if end < size and end <= extent:
+            # in place replacement of the same length
+            a = start
+            b = end
+            new_text = "".join(buffer_line[x].data for x in range(start, end))
+            replaced = sublime.Region(line_region.begin() + a, line_region.begin() + b)
+        else:
+            # the tail of the line is changed
+            tail = "".join(buffer_line[x].data for x in range(start, extent))
+            full_text = (text[:start] + " " * (start - size) + tail).rstrip()
+            a = min(start, size, len(full_text))
+            b = len(full_text)
+            new_text = full_text[a:]
+            replaced = sublime.Region(line_region.begin() + a, line_region.end())
+
+        # erase the regions overlapping the changed text and recolorize them afterwards
+        low, high = a, max(b, replaced.size() + a)
+        kept = []
+        for colored in self.colored_lines.get(line, []):
+            key, c_start, c_end, _ = colored
+            if c_start < high and c_end > low:
+                view.erase_regions(key)
+                self.release_scope(colored[3])
+                self.region_count -= 1
+                low = min(low, c_start)
+                high = max(high, c_end)
+            else:
+                kept.append(colored)
+        if line in self.colored_lines:
+            self.colored_lines[line] = kept
+
+        view.replace(edit, replaced, new_text)
+        self.colorize_line(edit, line, list(segment_buffer_line(buffer_line, low, high)))
+        return True
+
+    def colorize_line(self, edit, line, segments):
+        from .colors import get_closest_color
+
         if segments:
             # ensure the last segement's position exists
             self.ensure_position(edit, line, segments[-1][2])
-            if line not in self.colored_lines:
-                self.colored_lines[line] = []
         for s in segments:
             fg, bg, bold = s[3:]
-            if not is_supported_color(fg):
-                fg = get_closest_color(fg)
-            if not is_supported_color(bg):
-                bg = get_closest_color(bg)
+            # 24-bit colors get their own scopes in the truecolor mode
+            if not self.truecolor:
+                if not is_supported_color(fg):
+                    fg = get_closest_color(fg)
+                if not is_supported_color(bg):
+                    bg = get_closest_color(bg)
             if fg != "default" or bg != "default":
                 if bold and self.brighten_bold_text:
-                    if fg != "default" and fg != "reverse_default" and not fg.startswith("light_"):
+                    if fg in ANSI_COLORS and not fg.startswith("light_"):
                         fg = "light_" + fg
-                    if bg != "default" and bg != "reverse_default" and not bg.startswith("light_"):
+                    if bg in ANSI_COLORS and not bg.startswith("light_"):
                         bg = "light_" + bg
-                a = view.text_point(line, s[1])
-                b = view.text_point(line, s[2])
-                key = get_highlight_key(view)
-                view.add_regions(
-                    key,
-                    [sublime.Region(a, b)],
-                    "terminus.{}.{}".format(fg, bg))
-                self.colored_lines[line].append(key)
+                self.add_colored_region(line, s[1], s[2], "terminus.{}.{}".format(fg, bg))
+
+    def add_colored_region(self, line, start, end, scope):
+        view = self.view
+        a = view.text_point(line, start)
+        b = view.text_point(line, end)
+        key = get_highlight_key(view)
+        rules = self.scope_rules(scope)
+        if rules:
+            rules.acquire(view.id(), scope)
+        view.add_regions(key, [sublime.Region(a, b)], scope)
+        # keep the columns of the region to find the ones touched by partial updates
+        if line not in self.colored_lines:
+            self.colored_lines[line] = []
+        self.colored_lines[line].append((key, start, end, scope))
+        self.region_count += 1
 
     def decolorize_line(self, line):
         if line in self.colored_lines:
-            for key in self.colored_lines[line]:
+            for key, _, _, scope in self.colored_lines[line]:
                 self.view.erase_regions(key)
+                self.release_scope(scope)
+            self.region_count -= len(self.colored_lines[line])
             del self.colored_lines[line]
 
-    def trim_trailing_spaces(self, edit, terminal):
+    def scope_rules(self, scope):
+        """
+        Return the generated color scheme rules which provide the scope, if any.
+        """
+        if not self.truecolor and not self.lazy_color_scheme:
+            return None
+        _, fg, bg = scope.split(".")
+        if fg in ANSI_SCOPES and bg in ANSI_SCOPES:
+            return None
+        # the 24-bit colors which are in the palette are only provided by the 256 color
+        # schemes if they are installed
+        if self.color256 and is_supported_color(fg) and is_supported_color(bg):
+            if self.lazy_color_scheme:
+                return color256_rules()
+            return None
+        if self.truecolor:
+            return truecolor_rules()
+        return None
+
+    def release_scope(self, scope):
+        rules = self.scope_rules(scope)
+        if rules:
+            rules.release(self.view.id(), scope)
+
+    def trim_trailing_spaces(self, edit, terminal, frame):
         view = self.view
-        screen = terminal.screen
-        cursor = screen.cursor
-        cursor_row = terminal.offset + screen.cursor.y
+        cursor_x, cursor_y, _ = frame.cursor
+        cursor_row = terminal.offset + cursor_y
         lastrow = view.rowcol(view.size())[0]
         row = lastrow
         while row > cursor_row:
@@ -269,38 +559,56 @@ class TerminusRenderCommand(sublime_plugin.TextCommand, TerminusViewMixin):
             line_region = view.line(view.text_point(row, 0))
             text = view.substr(line_region)
             trailing_region = sublime.Region(
-                line_region.begin() + rev_wcwidth(text, cursor.x) + 1,
+                line_region.begin() + rev_wcwidth(text, cursor_x) + 1,
                 line_region.end())
             if not trailing_region.empty() and len(view.substr(trailing_region).strip()) == 0:
                 view.erase(edit, trailing_region)
 
-    def trim_history(self, edit, terminal):
+    def erase_top_lines(self, edit, terminal, m):
+        view = self.view
+        logger.debug("removing {} lines from the top".format(m))
+        for line in range(m):
+            self.decolorize_line(line)
+        # shift colored_lines indexes
+        self.colored_lines = {k - m: v for (k, v) in self.colored_lines.items()}
+        top_region = sublime.Region(0, view.line(view.text_point(m - 1, 0)).end() + 1)
+        view.erase(edit, top_region)
+        terminal.offset -= m
+
+        # delete outdated images
+        terminal.clean_images()
+
+    def evict_scrollback(self, edit, terminal, evict, lines=None):
+        """
+        Free the scrollback, the lines above the screen, to keep the memory budget. The
+        colors are removed for "colors" and the oldest `lines` lines, or all of them, are
+        erased for "lines".
+        """
+        offset = terminal.offset
+        if evict == "colors":
+            for line in [line for line in self.colored_lines if line < offset]:
+                self.decolorize_line(line)
+        elif evict == "lines":
+            m = offset if lines is None else min(lines, offset)
+            if m > 0:
+                self.erase_top_lines(edit, terminal, m)
+
+    def trim_history(self, edit, terminal, frame):
         """
         If number of lines in view > n, remove n / 10 lines from the top
         """
         view = self.view
 
-        screen = terminal.screen
         lastrow = view.rowcol(view.size())[0]
         n = self.scrollback_history_size
         if lastrow + 1 > n:
             m = max(lastrow + 1 - n, math.ceil(n / 10))
-            logger.debug("removing {} lines from the top".format(m))
-            for line in range(m):
-                self.decolorize_line(line)
-            # shift colored_lines indexes
-            self.colored_lines = {k - m: v for (k, v) in self.colored_lines.items()}
-            top_region = sublime.Region(0, view.line(view.text_point(m - 1, 0)).end() + 1)
-            view.erase(edit, top_region)
-            terminal.offset -= m
+            self.erase_top_lines(edit, terminal, m)
             lastrow -= m
 
-            # delete outdated images
-            terminal.clean_images()
-
-        if lastrow > terminal.offset + screen.lines:
+        if lastrow > terminal.offset + frame.lines:
             tail_region = sublime.Region(
-                view.text_point(terminal.offset + screen.lines, 0),
+                view.text_point(terminal.offset + frame.lines, 0),
                 view.size()
             )
             for line in view.lines(tail_region):
@@ -319,7 +627,8 @@ class TerminusShowCursorCommand(sublime_plugin.TextCommand, TerminusViewMixin):
         if focus:
             self.focus_cursor(edit, terminal)
         if scroll:
-            sublime.set_timeout(lambda: self.scroll_to_cursor(terminal))
+            # the views are scrolled at the end of the render tick
+            RenderTick.instance().schedule_scroll(terminal)
 
     def focus_cursor(self, edit, terminal):
         view = self.view
@@ -327,39 +636,32 @@ class TerminusShowCursorCommand(sublime_plugin.TextCommand, TerminusViewMixin):
         sel = view.sel()
         sel.clear()
 
-        screen = terminal.screen
-        if screen.cursor.hidden:
+        if not terminal.frame:
+            return
+        # the cursor of the rendered frame
+        cursor_x, cursor_y, hidden = terminal.frame.cursor
+        if hidden:
             return
 
-        cursor = screen.cursor
         offset = terminal.offset
 
         if len(view.sel()) > 0 and view.sel()[0].empty():
             row, col = view.rowcol(view.sel()[0].end())
-            if row == offset + cursor.y and col == cursor.x:
+            if row == offset + cursor_y and col == cursor_x:
                 return
 
         # make sure the view has enough lines
-        self.ensure_position(edit, cursor.y + offset)
+        self.ensure_position(edit, cursor_y + offset)
 
-        line_region = view.line(view.text_point(cursor.y + offset, 0))
+        line_region = view.line(view.text_point(cursor_y + offset, 0))
         text = view.substr(line_region)
-        col = rev_wcwidth(text, cursor.x) + 1
+        col = rev_wcwidth(text, cursor_x) + 1
 
-        self.ensure_position(edit, cursor.y + offset, col)
-        pt = view.text_point(cursor.y + offset, col)
+        self.ensure_position(edit, cursor_y + offset, col)
+        pt = view.text_point(cursor_y + offset, col)
 
         sel.add(sublime.Region(pt, pt))
 
-    def scroll_to_cursor(self, terminal):
-        view = self.view
-        last_y = view.text_to_layout(view.size())[1]
-        viewport_y = last_y - view.viewport_extent()[1] + view.line_height()
-        offset_y = view.text_to_layout(view.text_point(terminal.offset, 0))[1]
-        y = max(offset_y, viewport_y)
-        view.settings().set("terminus_view.viewport_y", y)
-        view.set_viewport_position((0, y), False)
-
 
 class TerminusCleanupCommand(sublime_plugin.TextCommand):
     def run(self, edit, by_user=False):
@@ -0,0 +1,196 @@
+import sublime
+
+import os
+import time
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+from Terminus.tools.theme_generator import generate_theme_file, ANSI_COLORS, DEFAULT_BACKGROUND
+
+logger = logging.getLogger('Terminus')
+
+ANSI_SCOPES = set(ANSI_COLORS + ["default", "reverse_default"])
+
+
+class ColorSchemeRules:
+    """
+    Maintain a generated color scheme which only contains the rules of the `terminus.{fg}.{bg}`
+    scopes in use. New rules are written in batches and the rules which are no longer used
+    by any view are evicted, the least recently used first.
+    """
+    _instances = {}
+
+    @classmethod
+    def from_path(cls, path, **kwargs):
+        if path in cls._instances:
+            return cls._instances[path]
+        instance = cls(path, **kwargs)
+        cls._instances[path] = instance
+        return instance
+
+    def __init__(self, path, ansi_scopes=False, flush_delay=500, max_unused_rules=1024):
+        self.path = path
+        # whether the rules of the ansi colors are always included
+        self.ansi_scopes = ansi_scopes
+        # delay in ms to collect new scopes before the scheme is rewritten
+        self.flush_delay = flush_delay
+        # number of unused rules to be kept
+        self.max_unused_rules = max_unused_rules
+        self.background = DEFAULT_BACKGROUND
+        self.lock = threading.Lock()
+        # scope -> (fg, bg) of the scopes "terminus.{fg}.{bg}", the least recently used first
+        self.rules = OrderedDict()
+        # view id -> Counter of the scopes of the colored regions
+        self.views = {}
+        self._pending = False
+        self._scheduled = False
+        # the scheme is not written while it is disabled, e.g. when it is removed or when
+        # the full scheme is used instead
+        self.enabled = True
+
+    def enable(self):
+        with self.lock:
+            self.enabled = True
+
+    def disable(self):
+        with self.lock:
+            self.enabled = False
+            self._pending = False
+
+    def acquire(self, view_id, scope):
+        with self.lock:
+            if not self.enabled:
+                return
+            if view_id not in self.views:
+                self.views[view_id] = Counter()
+            self.views[view_id][scope] += 1
+            if scope in self.rules:
+                self.rules.move_to_end(scope)
+            else:
+                self.rules[scope] = tuple(scope.split(".")[1:])
+                self._pending = True
+                self._schedule_flush()
+
+    def release(self, view_id, scope):
+        with self.lock:
+            counter = self.views.get(view_id)
+            if counter and scope in counter:
+                counter[scope] -= 1
+                if counter[scope] <= 0:
+                    del counter[scope]
+
+    def release_view(self, view_id):
+        with self.lock:
+            if view_id in self.views:
+                del self.views[view_id]
+
+    def set_background(self, background):
+        with self.lock:
+            if background == self.background:
+                return
+            self.background = background
+            if self.rules:
+                self._pending = True
+                self._schedule_flush()
+
+    def load(self):
+        """
+        Load the rules of a previously generated scheme as unused rules.
+        """
+        try:
+            with open(self.path, "r") as f:
+                scheme = sublime.decode_value(f.read())
+        except Exception:
+            return
+        with self.lock:
+            for rule in scheme.get("rules", []):
+                scope = rule.get("scope", "")
+                pair = tuple(scope.split(".")[1:])
+                if len(pair) != 2 or scope in self.rules:
+                    continue
+                if self.ansi_scopes and pair[0] in ANSI_SCOPES and pair[1] in ANSI_SCOPES:
+                    continue
+                self.rules[scope] = pair
+            if len(self.rules) > self.max_unused_rules:
+                # evict the excess rules, e.g. of a scheme with all the 256 color rules
+                self._schedule_flush()
+        logger.debug("{} rule(s) loaded from {}".format(len(self.rules), self.path))
+
+    def save(self):
+        """
+        Write the scheme even if no rules are changed.
+        """
+        with self.lock:
+            self.enabled = True
+            self._pending = True
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if not self._scheduled:
+            self._scheduled = True
+            sublime.set_timeout_async(self.flush, self.flush_delay)
+
+    def flush(self):
+        with self.lock:
+            self._scheduled = False
+            if not self.enabled:
+                return
+            for view_id in list(self.views.keys()):
+                if not sublime.View(view_id).is_valid():
+                    del self.views[view_id]
+            used = set()
+            for counter in self.views.values():
+                used.update(counter)
+            unused = [scope for scope in self.rules if scope not in used]
+            for scope in unused[:max(0, len(unused) - self.max_unused_rules)]:
+                del self.rules[scope]
+                self._pending = True
+            if not self._pending:
+                return
+            self._pending = False
+            pairs = list(self.rules.values())
+            background = self.background
+
+        startt = time.time()
+        generate_theme_file(
+            self.path, ansi_scopes=self.ansi_scopes, color256_scopes=False, background=background,
+            pretty=False, pairs=pairs)
+        logger.debug("writing {} rule(s) to {} takes {}s".format(
+            len(pairs), self.path, time.time() - startt))
+
+    def remove(self):
+        with self.lock:
+            self.rules.clear()
+            self.views.clear()
+            self.enabled = False
+            self._pending = False
+        if os.path.isfile(self.path):
+            os.unlink(self.path)
+
+
+def truecolor_rules():
+    """
+    The rules of the 24-bit colors, they are generated for each session.
+    """
+    path = os.path.join(
+        sublime.packages_path(),
+        "User",
+        "Terminus",
+        "TrueColor",
+        "Terminus.hidden-color-scheme"
+    )
+    return ColorSchemeRules.from_path(path)
+
+
+def color256_rules():
+    """
+    The rules of the 256 colors which have been used, they are kept across sessions.
+    """
+    path = os.path.join(
+        sublime.packages_path(),
+        "User",
+        "Terminus.hidden-color-scheme"
+    )
+    return ColorSchemeRules.from_path(
+        path, ansi_scopes=True, flush_delay=100, max_unused_rules=4096)
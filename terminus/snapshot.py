@@ -0,0 +1,250 @@
+import zlib
+import struct
+
+# a snapshot is the header followed by the zlib compressed body
+HEADER = struct.Struct(">4sBB")
+MAGIC = b"TMSS"
+VERSION = 1
+
+# kinds of snapshots
+SCROLLBACK = 1
+SCREEN = 2
+
+UINT = struct.Struct(">I")
+
+# the fields of a `Char` except `data`
+CHAR_STYLE_FIELDS = 8
+
+# the private mode 1049 as it is kept by pyte
+ALTERNATE_SCREEN_MODE = 1049 << 5
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Writer:
+    """
+    Write the body of a snapshot. The strings and the styles are written once in the string
+    table at the end of the body and they are referred by their indices.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.strings = {}
+
+    def uint(self, n):
+        self.chunks.append(UINT.pack(n))
+
+    def uints(self, ns):
+        self.uint(len(ns))
+        self.chunks.append(struct.pack(">{}I".format(len(ns)), *ns))
+
+    def text(self, s):
+        data = s.encode("utf-8", "surrogatepass")
+        self.uint(len(data))
+        self.chunks.append(data)
+
+    def string(self, s):
+        """
+        Write the index of `s` in the string table, `s` is a str, a bool or None.
+        """
+        if s not in self.strings:
+            self.strings[s] = len(self.strings)
+        self.uint(self.strings[s])
+
+    def getvalue(self, kind):
+        body = b"".join(self.chunks)
+        table = Writer()
+        table.uint(len(self.strings))
+        for s in self.strings:
+            if s is None or isinstance(s, bool):
+                table.uint({None: 0, False: 1, True: 2}[s])
+            else:
+                table.uint(3)
+                table.text(s)
+        table = b"".join(table.chunks)
+        data = UINT.pack(len(body)) + body + table
+        return HEADER.pack(MAGIC, VERSION, kind) + zlib.compress(data, 1)
+
+
+class Reader:
+
+    def __init__(self, data, kind):
+        if len(data) < HEADER.size:
+            raise SnapshotError("snapshot is truncated")
+        magic, version, _kind = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or _kind != kind:
+            raise SnapshotError("unknown snapshot format")
+        try:
+            self.data = zlib.decompress(data[HEADER.size:])
+        except zlib.error as e:
+            raise SnapshotError(str(e))
+        self.pos = 0
+        size = self.uint()
+        end = self.pos + size
+        self.pos = end
+        self.strings = []
+        for _ in range(self.uint()):
+            tag = self.uint()
+            self.strings.append((None, False, True)[tag] if tag < 3 else self.text())
+        self.pos = UINT.size
+
+    def uint(self):
+        n, = UINT.unpack_from(self.data, self.pos)
+        self.pos += UINT.size
+        return n
+
+    def uints(self):
+        count = self.uint()
+        ns = struct.unpack_from(">{}I".format(count), self.data, self.pos)
+        self.pos += UINT.size * count
+        return ns
+
+    def text(self):
+        size = self.uint()
+        s = self.data[self.pos:self.pos + size].decode("utf-8", "surrogatepass")
+        self.pos += size
+        return s
+
+    def string(self):
+        return self.strings[self.uint()]
+
+
+def encode_scrollback(lines):
+    """
+    Encode the rendered lines of a view. `lines` is a list of `(text, regions)` where
+    `regions` is a list of `(start, end, scope)` of the colored text positions.
+    """
+    w = Writer()
+    w.uint(len(lines))
+    for text, regions in lines:
+        w.text(text)
+        w.uint(len(regions))
+        for start, end, scope in regions:
+            w.uint(start)
+            w.uint(end)
+            w.string(scope)
+    return w.getvalue(SCROLLBACK)
+
+
+def decode_scrollback(data):
+    r = Reader(data, SCROLLBACK)
+    lines = []
+    for _ in range(r.uint()):
+        text = r.text()
+        regions = [(r.uint(), r.uint(), r.string()) for _ in range(r.uint())]
+        lines.append((text, regions))
+    return lines
+
+
+def _write_history_line(w, line):
+    w.text(line.text)
+    w.string(line.linefeed)
+    w.uint(len(line.runs))
+    for start, length, (fg, bg, bold) in line.runs:
+        w.uint(start)
+        w.uint(length)
+        w.string(fg)
+        w.string(bg)
+        w.string(bold)
+
+
+def _read_history_line(r):
+    from .ptty import HistoryLine
+
+    text = r.text()
+    linefeed = r.string()
+    runs = tuple(
+        (r.uint(), r.uint(), (r.string(), r.string(), r.string())) for _ in range(r.uint()))
+    return HistoryLine(text, runs, linefeed)
+
+
+def encode_screen(screen, history=None):
+    """
+    Encode the state of a `TerminalScreen`: the buffer, the cursor, the modes, the margins,
+    the title and the history, or `history` instead if it is given. The alternate screen
+    is not kept, it is redrawn by the full screen applications.
+    """
+    w = Writer()
+    buffer = screen.buffer
+    if screen.alternate_buffer_mode and "buffer" in screen.primary_buffer:
+        buffer = screen.primary_buffer["buffer"]
+        cursor = screen.primary_buffer["cursor"]
+        lines, columns = screen.primary_buffer["size"]
+        if history is None:
+            history = screen.primary_buffer["history"]
+    else:
+        cursor = screen.cursor
+        lines, columns = screen.lines, screen.columns
+        if history is None:
+            history = screen.history
+
+    w.uint(lines)
+    w.uint(columns)
+    w.uint(cursor.x)
+    w.uint(cursor.y)
+    w.string(cursor.hidden)
+    for field in cursor.attrs[1:]:
+        w.string(field)
+    # the primary screen is encoded, it is not in the alternate screen mode
+    w.uints(sorted(m for m in screen.mode if m != ALTERNATE_SCREEN_MODE))
+    margins = screen.margins
+    w.uints(tuple(margins) if margins else ())
+    w.string(screen.title)
+    w.string(screen.icon_name)
+
+    w.uint(len(buffer))
+    for y, line in sorted(buffer.items()):
+        w.uint(y)
+        xs = sorted(line)
+        w.uints(xs)
+        w.text("\x00".join(line[x].data for x in xs))
+        for x in xs:
+            for field in line[x][1:]:
+                w.string(field)
+
+    w.uint(len(history))
+    for line in history:
+        _write_history_line(w, line)
+    return w.getvalue(SCREEN)
+
+
+def decode_screen(data, screen):
+    """
+    Restore the state of `screen` from a snapshot of `encode_screen`.
+    """
+    from .ptty import Char, Cursor, TerminalLine
+    from pyte.screens import Margins
+
+    r = Reader(data, SCREEN)
+    lines = r.uint()
+    columns = r.uint()
+    if screen.alternate_buffer_mode:
+        screen.reset_mode(ALTERNATE_SCREEN_MODE)
+    screen.resize(lines, columns)
+
+    cursor = Cursor(r.uint(), r.uint())
+    cursor.hidden = r.string()
+    cursor.attrs = Char(" ", *(r.string() for _ in range(CHAR_STYLE_FIELDS)))
+    screen.mode = set(r.uints())
+    margins = r.uints()
+    screen.margins = Margins(*margins) if margins else None
+    screen.title = r.string()
+    screen.icon_name = r.string()
+
+    screen.buffer.clear()
+    for _ in range(r.uint()):
+        y = r.uint()
+        xs = r.uints()
+        datas = r.text().split("\x00")
+        line = TerminalLine(screen.default_char)
+        for x, d in zip(xs, datas):
+            line[x] = Char(d, *(r.string() for _ in range(CHAR_STYLE_FIELDS)))
+        screen.buffer[y] = line
+    screen.cursor = cursor
+
+    screen.history.clear()
+    for _ in range(r.uint()):
+        screen.history.append(_read_history_line(r))
+    screen.dirty.update(range(screen.lines))
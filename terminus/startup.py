@@ -0,0 +1,102 @@
+import sublime_plugin
+
+import sys
+import time
+import builtins
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from importlib.util import resolve_name
+
+
+# module name -> (total, self) time of its first import within `timed_imports`
+_import_timings = OrderedDict()
+# label -> time of the steps recorded by `timed`
+_timings = OrderedDict()
+# `builtins.__import__` is patched by one `timed_imports` at a time
+_patch_lock = threading.RLock()
+
+
+@contextmanager
+def timed(label):
+    """
+    Record the time taken by the context.
+    """
+    startt = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[label] = time.perf_counter() - startt
+
+
+@contextmanager
+def timed_imports(module=None):
+    """
+    Record the time taken to import each module which is imported for the first time
+    within the context. Imports from the other threads are not recorded. Nothing is
+    recorded if `module` is given and it is already imported.
+    """
+    if module and module in sys.modules:
+        yield
+        return
+    with _patch_lock:
+        if module and module in sys.modules:
+            yield
+            return
+        with _patched_import():
+            yield
+
+
+@contextmanager
+def _patched_import():
+    original_import = builtins.__import__
+    thread = threading.current_thread()
+    # the time taken by the imports of the modules being imported
+    stack = []
+
+    def _import(name, globals=None, locals=None, fromlist=(), level=0):
+        if threading.current_thread() is not thread:
+            return original_import(name, globals, locals, fromlist, level)
+        fullname = name
+        if level > 0 and globals:
+            try:
+                fullname = resolve_name("." * level + name, globals.get("__package__"))
+            except (ImportError, ValueError):
+                pass
+        if not fullname or fullname in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+
+        stack.append(0)
+        startt = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - startt
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            _import_timings[fullname] = (elapsed, elapsed - children)
+
+    builtins.__import__ = _import
+    try:
+        yield
+    finally:
+        builtins.__import__ = original_import
+
+
+class TerminusShowStartupTimingsCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        lines = ["Terminus startup timings", ""]
+        for label, elapsed in _timings.items():
+            lines.append("{:>10.1f}ms  {}".format(elapsed * 1000, label))
+        lines.append("")
+        lines.append("{:>10}  {:>10}  {}".format("total", "self", "module"))
+        for name, (total, own) in sorted(
+                _import_timings.items(), key=lambda x: x[1][1], reverse=True):
+            lines.append("{:>8.1f}ms  {:>8.1f}ms  {}".format(total * 1000, own * 1000, name))
+
+        view = self.window.new_file()
+        view.set_name("Terminus Startup Timings")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": "\n".join(lines) + "\n"})
+        view.set_read_only(True)
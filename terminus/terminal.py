@@ -6,13 +6,16 @@ import base64
 import logging
 import tempfile
 import threading
+from collections import deque
 from queue import Queue, Empty
 
-from .ptty import TerminalPtyProcess, TerminalScreen, TerminalStream
+from .pool import ShellPool
+from .reaper import ExitWatcher, Reaper, wait
 from .utils import responsive, intermission
 from .view import get_panel_window, view_size
 from .key import get_key_code
-from .image import get_image_info, image_resize
+from .startup import timed_imports
+from .tick import RenderTick
 
 
 IMAGE = """
@@ -26,16 +29,26 @@ body {{
 
 logger = logging.getLogger('Terminus')
 
+# the time in seconds for a resizing view to settle before the terminal is resized
+RESIZE_DELAY = 0.2
+# the period in seconds to check the size of the views when there are no resize events
+RESIZE_POLL_PERIOD = 1
+# the number of frames which are not rendered before they are folded into one
+MAX_PENDING_FRAMES = 100
+
 
 class Terminal:
     _terminals = {}
     _detached_terminals = []
+    # tag -> terminals with the tag, including the detached terminals
+    _tags = {}
 
     def __init__(self, view=None):
         self.view = view
         self._cached_cursor = [0, 0]
         self._size = sublime.load_settings('Terminus.sublime-settings').get('size', (None, None))
         self._cached_cursor_is_hidden = [True]
+        self._cached_title = ""
         self.image_count = 0
         self.images = {}
         self._strings = Queue()
@@ -43,6 +56,34 @@ class Terminal:
         self._pending_to_clear_scrollback = [False]
         self._pending_to_reset = [None]
         self.lock = threading.Lock()
+        # it is set when the process prints for the first time
+        self.first_output = threading.Event()
+        # the liveness of the process, it is updated by the exit watcher
+        self.alive = False
+        # the time of the last request to check the size of the view
+        self._resize_requested = 0
+        # the frames handed over from the renderer thread to `terminus_render`
+        self.frames = deque()
+        # the last rendered frame
+        self.frame = None
+        self._pending_full_frame = False
+        # the rows to be rendered again by the next frame, e.g. the rows of the inserted
+        # images, they are taken by the renderer thread
+        self._pending_rows = deque()
+        # the number of the cells of the screen, it is published with every frame so that
+        # the memory budget doesn't take the lock
+        self.screen_cells = 0
+        # whether the terminal is run by an engine process
+        self.remote = False
+        # it is set when the plugin is unloaded, the exits of the remote terminals are not
+        # reported after the engines are shut down
+        self.stopped = False
+        # the encoded scrollback of the previous view, restored by the next render
+        self.scrollback_snapshot = None
+        # the number of colored regions of the view and the time it was last viewed, they
+        # are used by the memory budget
+        self.region_count = 0
+        self.last_viewed = time.time()
 
     @classmethod
     def from_id(cls, vid):
@@ -53,8 +94,8 @@ class Terminal:
     @classmethod
     def from_tag(cls, tag, current_window_only=True):
         # restrict to only current window
-        for terminal in cls._terminals.values():
-            if terminal.tag == tag:
+        for terminal in cls._tags.get(tag, []):
+            if terminal.view and cls._terminals.get(terminal.view.id()) is terminal:
                 if current_window_only:
                     active_window = sublime.active_window()
                     if terminal.window and active_window:
@@ -74,6 +115,22 @@ class Terminal:
         for terminal in terminals_to_kill:
             terminal.kill()
 
+    @classmethod
+    def stop_remote_terminals(cls):
+        """
+        Stop following the terminals run by the engine processes, e.g. the persistent
+        terminals which are left running when the plugin is unloaded.
+        """
+        for terminal in list(cls._terminals.values()) + cls._detached_terminals:
+            if terminal.remote:
+                terminal.stopped = True
+
+    @classmethod
+    def request_resize_all(cls, window):
+        for terminal in cls._terminals.values():
+            if terminal.show_in_panel or terminal.view.window() == window:
+                terminal.request_resize()
+
     @property
     def window(self):
         if self.detached:
@@ -90,17 +147,31 @@ class Terminal:
             Terminal._terminals[view.id()] = self
             if self in Terminal._detached_terminals:
                 Terminal._detached_terminals.remove(self)
-            # allow screen to be rerendered
-            self.screen.dirty.update(range(self.screen.lines))
+            if self.remote:
+                # the engine process sends the whole screen again
+                self.process.resume()
+            else:
+                # the frames which were not rendered by the previous view are folded into a
+                # frame which renders the whole screen again
+                self.screen.dirty.update(range(self.screen.lines))
+                self.push_frame(fold=True)
             self.set_offset(offset)
 
     def detach_view(self):
         with self.lock:
-            self.detached = True
-            Terminal._detached_terminals.append(self)
-            if self.view.id() in Terminal._terminals:
-                del Terminal._terminals[self.view.id()]
-            self.view = None
+            self._detach_view()
+
+    def _detach_view(self):
+        """
+        Detach the view, it should be called with the lock held.
+        """
+        self.detached = True
+        Terminal._detached_terminals.append(self)
+        if self.view.id() in Terminal._terminals:
+            del Terminal._terminals[self.view.id()]
+        self.view = None
+        if self.remote:
+            self.process.pause()
 
     @responsive(period=1, default=True)
     def is_hosted(self):
@@ -111,28 +182,123 @@ class Terminal:
 
     def _need_to_render(self):
         flag = False
-        if self.screen.dirty:
+        if self.screen.dirty or self._pending_to_clear_scrollback[0]:
             flag = True
         elif self.screen.cursor.x != self._cached_cursor[0] or \
                 self.screen.cursor.y != self._cached_cursor[1]:
             flag = True
         elif self.screen.cursor.hidden != self._cached_cursor_is_hidden[0]:
             flag = True
+        elif self.screen.title != self._cached_title:
+            flag = True
 
         if flag:
             self._cached_cursor[0] = self.screen.cursor.x
             self._cached_cursor[1] = self.screen.cursor.y
             self._cached_cursor_is_hidden[0] = self.screen.cursor.hidden
+            self._cached_title = self.screen.title
         return flag
 
+    def push_frame(self, images=(), fold=False):
+        """
+        Hand over the changes of the screen to `terminus_render`. It should be called with
+        the lock held. The pending frames are folded into one if `fold` is set or if too many
+        of them are not rendered, e.g. when the view is not valid anymore.
+        """
+        if len(self.frames) >= MAX_PENDING_FRAMES:
+            fold = True
+        if fold:
+            self.screen.dirty.update(range(self.screen.lines))
+        frame = self.screen.take_frame(
+            clear_scrollback=self._pending_to_clear_scrollback[0], images=images)
+        self._pending_to_clear_scrollback[0] = False
+        self.screen_cells = sum(map(len, self.screen.buffer.values()))
+        if fold and self.frames:
+            frame = frame.fold(self.frames, max_history=self.screen.history.maxlen)
+            self.frames.clear()
+        self.frames.append(frame)
+        RenderTick.instance().schedule_render(self)
+
+    def take_frames(self):
+        """
+        Return the frames to be rendered, the consecutive frames are merged if possible.
+        """
+        frames = []
+        while self.frames:
+            frame = self.frames.popleft()
+            if frames:
+                merged = frames[-1].merge(frame)
+                if merged:
+                    frames[-1] = merged
+                    continue
+            frames.append(frame)
+        return frames
+
+    def scroll_to_cursor(self):
+        view = self.view
+        last_y = view.text_to_layout(view.size())[1]
+        viewport_y = last_y - view.viewport_extent()[1] + view.line_height()
+        offset_y = view.text_to_layout(view.text_point(self.offset, 0))[1]
+        y = max(offset_y, viewport_y)
+        view.settings().set("terminus_view.viewport_y", y)
+        view.set_viewport_position((0, y), False)
+
+    def request_full_frame(self):
+        """
+        Render all the rows of the screen in the next frame.
+        """
+        self._pending_full_frame = True
+
+    def request_rows(self, rows):
+        """
+        Render the rows of the screen again in the next frame.
+        """
+        self._pending_rows.extend(rows)
+
+    def _take_pending_rows(self):
+        rows = []
+        while self._pending_rows:
+            rows.append(self._pending_rows.popleft())
+        return rows
+
+    def _resize_checker(self):
+        # the size which the view is being resized to
+        pending_size = [None]
+
+        @responsive(period=RESIZE_POLL_PERIOD, default=False)
+        def poll_resize():
+            return True
+
+        def check_resize():
+            """
+            Return the new size of the view once it settles, otherwise None.
+            """
+            requested = self._resize_requested
+            if requested:
+                if time.time() - requested < RESIZE_DELAY:
+                    return None
+            elif not poll_resize():
+                return None
+            size = view_size(self.view, force=self._size)
+            if size == self.screen_size():
+                pending_size[0] = None
+                self._resize_requested = 0
+                return None
+            if size != pending_size[0]:
+                # check it again after the resizing settles
+                pending_size[0] = size
+                self._resize_requested = time.time()
+                return None
+            pending_size[0] = None
+            self._resize_requested = 0
+            return size
+
+        return check_resize
+
     def _start_rendering(self):
         data = [""]
         done = [False]
-
-        @responsive(period=1, default=False)
-        def was_resized():
-            size = view_size(self.view, force=self._size)
-            return self.screen.lines != size[0] or self.screen.columns != size[1]
+        check_resize = self._resize_checker()
 
         def reader():
             while True:
@@ -141,6 +307,11 @@ class Terminal:
                 except EOFError:
                     break
 
+                if not self.first_output.is_set() and temp:
+                    self.first_output.set()
+                    logger.debug("first output after {:.3f}s".format(
+                        time.time() - self.spawn_time))
+
                 with self.lock:
                     data[0] += temp
 
@@ -152,6 +323,19 @@ class Terminal:
 
         threading.Thread(target=reader).start()
 
+        def on_exit():
+            self.alive = False
+            logger.debug("process exited with status {}".format(self.process.exitstatus))
+
+            def finish():
+                done[0] = True
+
+            # give the reader a moment to drain the output, the pty may be kept open by the
+            # background processes after the process exits
+            sublime.set_timeout_async(finish, 100)
+
+        ExitWatcher.instance().watch(self.process, on_exit)
+
         def renderer():
 
             def feed_data():
@@ -164,13 +348,19 @@ class Terminal:
                 with intermission(period=0.03), self.lock:
                     feed_data()
                     if not self.detached:
-                        if was_resized():
-                            self.handle_resize()
-                            self.view.run_command("terminus_show_cursor")
+                        size = check_resize()
+                        if size:
+                            self.handle_resize(size)
 
-                        if self._need_to_render():
-                            self.view.run_command("terminus_render")
-                            self.screen.dirty.clear()
+                        if self._pending_full_frame:
+                            self._pending_full_frame = False
+                            self.screen.dirty.update(range(self.screen.lines))
+                        if self._pending_rows:
+                            self.screen.dirty.update(self._take_pending_rows())
+
+                        # the cursor is shown again after a resize
+                        if self._need_to_render() or size:
+                            self.push_frame()
 
                     if done[0] or not self.is_hosted():
                         logger.debug("renderer breaks")
@@ -179,14 +369,67 @@ class Terminal:
             feed_data()
             done[0] = True
 
-            def _cleanup():
-                if self.view:
-                    self.view.run_command("terminus_cleanup")
-
-            sublime.set_timeout(_cleanup)
+            # the process usually exits right after closing the pty, wait for it so that
+            # its exit status is known by `terminus_cleanup`
+            wait(self.process, 0.2)
+            self._schedule_cleanup()
 
         threading.Thread(target=renderer).start()
 
+    def _start_remote(self):
+        """
+        Follow the view of a terminal run by an engine process. The engine process does the
+        reading and the emulation, only the resizes and the full frames are requested here.
+        """
+        check_resize = self._resize_checker()
+
+        def follower():
+            while True:
+                with intermission(period=0.03), self.lock:
+                    if not self.detached:
+                        size = check_resize()
+                        if size:
+                            self.handle_resize(size)
+
+                        if self._pending_full_frame:
+                            self._pending_full_frame = False
+                            self.process.refresh()
+                        if self._pending_rows:
+                            self.process.refresh(self._take_pending_rows())
+
+                    if self.stopped:
+                        logger.debug("follower is stopped")
+                        return
+                    if not self.alive or not self.is_hosted():
+                        logger.debug("follower breaks")
+                        break
+
+            self._schedule_cleanup()
+
+        threading.Thread(target=follower).start()
+
+    def _schedule_cleanup(self):
+        def _cleanup():
+            if self.view:
+                self.view.run_command("terminus_cleanup")
+
+        sublime.set_timeout(_cleanup)
+
+    def on_remote_output(self):
+        self.first_output.set()
+        logger.debug("first output after {:.3f}s".format(time.time() - self.spawn_time))
+
+    def on_remote_frame(self, frame):
+        self.frames.append(frame)
+        RenderTick.instance().schedule_render(self)
+
+    def on_remote_reset(self):
+        self.reset_callback()
+
+    def on_remote_exit(self):
+        self.alive = False
+        logger.debug("process exited with status {}".format(self.process.exitstatus))
+
     def set_offset(self, offset=None):
         if offset is not None:
             self.offset = offset
@@ -201,7 +444,7 @@ class Terminal:
     def start(
             self, cmd, cwd=None, env=None, default_title=None, title=None,
             show_in_panel=None, panel_name=None, tag=None, auto_close=True, cancellable=False,
-            timeit=False):
+            timeit=False, engine_tid=None):
 
         view = self.view
         if view:
@@ -214,6 +457,8 @@ class Terminal:
         self.show_in_panel = show_in_panel
         self.panel_name = panel_name
         self.tag = tag
+        if tag:
+            Terminal._tags.setdefault(tag, []).append(self)
         self.auto_close = auto_close
         self.cancellable = cancellable
         self.timeit = timeit
@@ -230,9 +475,46 @@ class Terminal:
         logger.debug("view size: {}".format(str(size)))
         _env = os.environ.copy()
         _env.update(env)
-        self.process = TerminalPtyProcess.spawn(cmd, cwd=cwd, env=_env, dimensions=size)
+        settings = sublime.load_settings('Terminus.sublime-settings')
+        engine = settings.get("engine", "inline")
+        # the history lines which are not rendered yet are kept up to the scrollback size
+        history = settings.get("scrollback_history_size", 10000)
+        if engine in ("process", "server"):
+            from .engine import EngineClient, EngineError
+            self.remote = True
+            self.spawn_time = time.time()
+            # the exit may be reported before the process is returned
+            self.alive = True
+            try:
+                self.process = EngineClient.instance().spawn(
+                    self, cmd, cwd, _env, size, history=history,
+                    python=settings.get("engine_python", "python3"),
+                    processes=settings.get("engine_processes", 1),
+                    server=engine == "server", attach=engine_tid)
+            except EngineError as e:
+                self.alive = False
+                sublime.error_message("Terminus: {}".format(e))
+                raise
+            if view and self.process.persistent:
+                # the terminal is attached again after the plugin is reloaded
+                view.settings().set("terminus_view.engine_tid", self.process.tid)
+            self.screen = None
+            self.stream = None
+            self._start_remote()
+            return
+
+        # the emulator is imported when the first terminal is started, only that import is
+        # timed
+        with timed_imports(__package__ + ".ptty"):
+            from .ptty import TerminalPtyProcess, TerminalScreen, TerminalStream
+        self.spawn_time = time.time()
+        self.process = ShellPool.instance().take(cmd, cwd, _env, size)
+        if not self.process:
+            self.process = TerminalPtyProcess.spawn(cmd, cwd=cwd, env=_env, dimensions=size)
+        logger.debug("spawning {} takes {:.3f}s".format(cmd, time.time() - self.spawn_time))
+        self.alive = True
         self.screen = TerminalScreen(
-            size[1], size[0], process=self.process, history=10000,
+            size[1], size[0], process=self.process, history=history,
             clear_callback=self.clear_callback, reset_callback=self.reset_callback)
         self.stream = TerminalStream(self.screen)
 
@@ -243,19 +525,52 @@ class Terminal:
     def kill(self):
         logger.debug("kill")
 
-        self.process.terminate()
-        vid = self.view.id()
-        if vid in self._terminals:
-            del self._terminals[vid]
+        self.terminate_process()
+        if self.view:
+            vid = self.view.id()
+            if vid in self._terminals:
+                del self._terminals[vid]
+        if self in self._detached_terminals:
+            self._detached_terminals.remove(self)
+        if self in self._tags.get(self.tag, []):
+            self._tags[self.tag].remove(self)
+            if not self._tags[self.tag]:
+                del self._tags[self.tag]
+
+    @property
+    def persistent(self):
+        """
+        Whether the terminal is kept running by the engine server when the plugin is
+        unloaded.
+        """
+        return self.remote and self.process.persistent
+
+    def terminate_process(self):
+        if self.remote:
+            self.process.terminate()
+        else:
+            Reaper.instance().terminate(self.process)
+
+    def screen_size(self):
+        if self.remote:
+            return self.process.size
+        return (self.screen.lines, self.screen.columns)
+
+    def request_resize(self):
+        """
+        Check the size of the view once the resizing settles.
+        """
+        self._resize_requested = time.time()
 
-    def handle_resize(self):
-        size = view_size(self.view, force=self._size)
-        logger.debug("handle resize {} {} -> {} {}".format(
-            self.screen.lines, self.screen.columns, size[0], size[1]))
+    def handle_resize(self, size=None):
+        if not size:
+            size = view_size(self.view, force=self._size)
+        logger.debug("handle resize {} {} -> {} {}".format(*self.screen_size(), *size))
         try:
             # pywinpty will rasie an runtime error
             self.process.setwinsize(*size)
-            self.screen.resize(*size)
+            if not self.remote:
+                self.screen.resize(*size)
         except RuntimeError:
             pass
 
@@ -305,14 +620,20 @@ class Terminal:
             else:
                 time.sleep(0.1)
 
+    def screen_mode(self):
+        if self.remote:
+            # the modes of the last received frame
+            return self.process.mode
+        return self.screen.mode
+
     def bracketed_paste_mode_enabled(self):
-        return (2004 << 5) in self.screen.mode
+        return (2004 << 5) in self.screen_mode()
 
     def new_line_mode_enabled(self):
-        return (20 << 5) in self.screen.mode
+        return (20 << 5) in self.screen_mode()
 
     def application_mode_enabled(self):
-        return (1 << 5) in self.screen.mode
+        return (1 << 5) in self.screen_mode()
 
     def find_image(self, pt):
         view = self.view
@@ -323,13 +644,22 @@ class Terminal:
         return None
 
     def show_image(self, data, args, cr=None):
-        view = self.view
-
         if "inline" not in args or not args["inline"]:
             return
 
+        # the image is shown by `terminus_render` after the rows before it are rendered
         cursor = self.screen.cursor
-        pt = view.text_point(self.offset + cursor.y, cursor.x)
+        self.push_frame(images=[(data, args, cursor.y, cursor.x)])
+
+        if cr:
+            self.screen.index()
+
+    def insert_image(self, data, args, row, col):
+        from .image import get_image_info, image_resize
+
+        view = self.view
+
+        pt = view.text_point(self.offset + row, col)
 
         databytes = base64.decodebytes(data.encode())
 
@@ -357,6 +687,8 @@ class Terminal:
         if self.find_image(pt):
             self.view.run_command("terminus_insert", {"point": pt, "character": " "})
             pt += 1
+            # the text positions of the row no longer match the columns
+            self.request_rows([row])
 
         self.image_count += 1
         p = view.add_phantom(
@@ -372,9 +704,6 @@ class Terminal:
         )
         self.images[p] = image_path
 
-        if cr:
-            self.screen.index()
-
     def clean_images(self):
         view = self.view
         for pid in list(self.images.keys()):
@@ -390,7 +719,7 @@ class Terminal:
 
     def __del__(self):
         # make sure the process is terminated
-        self.process.terminate(force=True)
+        self.terminate_process()
 
         # remove images
         for image_path in list(self.images.values()):
@@ -398,8 +727,3 @@ class Terminal:
                 os.remove(image_path)
             except Exception:
                 pass
-
-        if self.process.isalive():
-            logger.debug("process becomes orphaned")
-        else:
-            logger.debug("process is terminated")
@@ -2,12 +2,72 @@ import sublime
 import sublime_plugin
 
 import os
+import json
+import shutil
+import filecmp
+import hashlib
 
 from colorsys import rgb_to_hls
 from Terminus.tools.theme_generator import generate_theme_file, ANSI_COLORS, DEFAULT_BACKGROUND
+from .scheme import color256_rules, truecolor_rules
+from .startup import timed
 from .utils import set_settings_on_change
 
 
+def get_theme_background(path):
+    try:
+        with open(path, "r") as f:
+            return sublime.decode_value(f.read())["globals"]["background"]
+    except Exception:
+        return DEFAULT_BACKGROUND
+
+
+def is_full_256_scheme(path):
+    """
+    Whether the 256 color scheme at `path` has the rules of all the 256 color pairs, it
+    doesn't if it is generated by the lazy mode.
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read().count(b'"scope"') >= 256 * 256
+    except OSError:
+        return False
+
+
+# bump it when the output of the theme generator changes
+THEME_CACHE_VERSION = 1
+THEME_CACHE_SIZE = 200
+
+
+def install_theme_file(path, **kwargs):
+    """
+    Copy the color scheme generated with the arguments `kwargs` to `path`. The generated
+    schemes are cached on disk keyed by a hash of the arguments, so switching between themes
+    doesn't generate them again. It should be run on the async thread.
+    """
+    key = hashlib.sha1(json.dumps(
+        [THEME_CACHE_VERSION, kwargs], sort_keys=True).encode("utf-8")).hexdigest()
+    cache_dir = os.path.join(sublime.cache_path(), "Terminus", "themes")
+    cached_path = os.path.join(cache_dir, key + ".json")
+    if not os.path.isfile(cached_path):
+        generate_theme_file(cached_path, **kwargs)
+        # remove the least recently used schemes
+        cached_paths = sorted(
+            (os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".json")),
+            key=os.path.getmtime)
+        for p in cached_paths[:-THEME_CACHE_SIZE]:
+            os.unlink(p)
+    else:
+        os.utime(cached_path)
+    if os.path.isfile(path) and filecmp.cmp(cached_path, path, shallow=False):
+        # avoid a reload of the color scheme by sublime
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    shutil.copyfile(cached_path, temp_path)
+    os.replace(temp_path, path)
+
+
 class TerminusSelectThemeCommand(sublime_plugin.WindowCommand):
     themefiles = []
 
@@ -33,8 +93,7 @@ class TerminusSelectThemeCommand(sublime_plugin.WindowCommand):
             self.themes,
             self.on_selection,
             selected_index=selected_index,
-            on_highlight=lambda x: sublime.set_timeout_async(
-                lambda: self.on_selection(x, generate_theme=False)))
+            on_highlight=self.on_highlight)
 
     def set_theme(self, theme):
         if theme not in ["default", "adaptive", "user"]:
@@ -44,16 +103,48 @@ class TerminusSelectThemeCommand(sublime_plugin.WindowCommand):
         settings.set("theme", theme)
         sublime.save_settings("Terminus.sublime-settings")
 
-    def on_selection(self, index, generate_theme=True):
+    def on_highlight(self, index):
+        # preview the theme without saving the settings
+        self.window.run_command("terminus_generate_theme", {"theme": self.themes[index]})
+
+    def on_selection(self, index):
         if index == -1:
-            self.set_theme(self.original_theme)
+            self.window.run_command("terminus_generate_theme", {"theme": self.original_theme})
             return
         self.set_theme(self.themes[index])
-        if generate_theme:
-            self.window.run_command("terminus_generate_theme", {'force': True})
+        self.window.run_command("terminus_generate_theme", {'force': True})
 
 
 class TerminusGenerateThemeCommand(sublime_plugin.WindowCommand):
+    # the gray colors of the color schemes used by the adaptive theme
+    _grays = {}
+
+    def get_gray(self):
+        """
+        Use the comment color of the color scheme if it is grayish.
+        """
+        color_scheme = sublime.ui_info()["color_scheme"]
+        color_scheme = color_scheme.get("resolved_value", color_scheme.get("value"))
+        if color_scheme in self._grays:
+            return self._grays[color_scheme]
+
+        gray = "#888888"
+        window = sublime.active_window()
+        if window:
+            _panel = "terminus_color_scheme"
+            view = window.create_output_panel(_panel, True)
+            comment_foreground = view.style_for_scope("comment")["foreground"]
+            r = int(comment_foreground[1:3], 16)
+            g = int(comment_foreground[3:5], 16)
+            b = int(comment_foreground[5:7], 16)
+            _, _, s = rgb_to_hls(r/255, g/255, b/255)
+            if s < 0.2:
+                gray = comment_foreground
+            window.destroy_output_panel(_panel)
+            if color_scheme:
+                self._grays[color_scheme] = gray
+        return gray
+
     def run(self, theme=None, remove=False, force=False):
         settings = sublime.load_settings("Terminus.sublime-settings")
 
@@ -82,19 +173,7 @@ class TerminusGenerateThemeCommand(sublime_plugin.WindowCommand):
             variables = {}
         elif theme == "adaptive":
             palette = sublime.ui_info()["color_scheme"]["palette"]
-            gray = "#888888"
-            window = sublime.active_window()
-            if window:
-                _panel = "terminus_color_scheme"
-                view = window.create_output_panel(_panel, True)
-                comment_foreground = view.style_for_scope("comment")["foreground"]
-                r = int(comment_foreground[1:3], 16)
-                g = int(comment_foreground[3:5], 16)
-                b = int(comment_foreground[5:7], 16)
-                _, _, s = rgb_to_hls(r/255, g/255, b/255)
-                if s < 0.2:
-                    gray = comment_foreground
-                window.destroy_output_panel(_panel)
+            gray = self.get_gray()
             light_color_template = "color({} l(+ 15%))"
             variables = {
                 "background": palette["background"],
@@ -139,31 +218,54 @@ class TerminusGenerateThemeCommand(sublime_plugin.WindowCommand):
                 os.unlink(path)
                 print("Theme removed: {}".format(path))
             if os.path.isfile(path256):
-                os.unlink(path256)
+                color256_rules().remove()
                 print("Theme removed: {}".format(path256))
             sublime.status_message("Theme {} removed".format(theme))
         else:
+            if "background" in variables:
+                background = variables["background"]
+            else:
+                background = DEFAULT_BACKGROUND
+
             if settings.get("256color", False):
-                if force or not os.path.isfile(path256):
-                    if "background" in variables:
-                        background = variables["background"]
-                    else:
-                        background = DEFAULT_BACKGROUND
-                    generate_theme_file(
+                if settings.get("lazy_color_scheme", False):
+                    # only the rules of the colors in use are generated
+                    rules = color256_rules()
+                    rules.enable()
+                    rules.set_background(background)
+                    if force or not os.path.isfile(path256):
+                        rules.save()
+                        print("Theme {} generated: {}".format(theme, path256))
+                    full256 = False
+                else:
+                    # the full scheme is not overwritten by the lazy rules
+                    color256_rules().disable()
+                    full256 = force or not os.path.isfile(path256)
+            else:
+                color256_rules().remove()
+                full256 = False
+
+            truecolor_rules().set_background(background)
+
+            def generate():
+                if full256:
+                    install_theme_file(
                         path256, ansi_scopes=True, color256_scopes=True, background=background,
                         pretty=False)
                     print("Theme {} generated: {}".format(theme, path256))
-            else:
-                if os.path.isfile(path256):
-                    os.unlink(path256)
 
-            generate_theme_file(path, variables=variables, ansi_scopes=False, color256_scopes=False)
-            print("Theme {} generated: {}".format(theme, path))
+                install_theme_file(
+                    path, variables=variables, ansi_scopes=False, color256_scopes=False)
+                print("Theme {} generated: {}".format(theme, path))
 
-            sublime.status_message("Theme generated")
+                sublime.status_message("Theme generated")
 
+            sublime.set_timeout_async(generate)
+
+
+def check_theme_files():
+    settings = sublime.load_settings("Terminus.sublime-settings")
 
-def plugin_loaded():
     # this is a hack to remove the deprecated sublime-color-scheme files
     deprecated_paths = [
         os.path.join(sublime.packages_path(), "User", "Console.sublime-color-scheme"),
@@ -175,9 +277,6 @@ def plugin_loaded():
         if os.path.isfile(deprecated_path):
             os.unlink(deprecated_path)
 
-    settings = sublime.load_settings("Terminus.sublime-settings")
-    preferences = sublime.load_settings("Preferences.sublime-settings")
-
     path = os.path.join(
         sublime.packages_path(),
         "User",
@@ -191,18 +290,54 @@ def plugin_loaded():
         "Terminus.hidden-color-scheme"
     )
 
-    if (not os.path.isfile(path) or
+    # the truecolor rules are generated for each session
+    rules = truecolor_rules()
+    rules.remove()
+    rules.enable()
+    rules.set_background(get_theme_background(path))
+
+    if settings.get("256color", False) and settings.get("lazy_color_scheme", False):
+        rules = color256_rules()
+        rules.enable()
+        rules.load()
+        rules.set_background(get_theme_background(path))
+
+    if settings.get("256color", False) and not settings.get("lazy_color_scheme", False) \
+            and os.path.isfile(path256) and not is_full_256_scheme(path256):
+        # the lazy scheme, e.g. of an earlier session, is replaced by the full scheme
+        sublime.set_timeout(
+            lambda: sublime.active_window().run_command("terminus_generate_theme", {"force": True}),
+            100)
+    elif (not os.path.isfile(path) or
             (settings.get("256color", False) and not os.path.isfile(path256))):
         sublime.set_timeout(
             lambda: sublime.active_window().run_command("terminus_generate_theme"),
             100)
 
+
+def plugin_loaded():
+    settings = sublime.load_settings("Terminus.sublime-settings")
+    preferences = sublime.load_settings("Preferences.sublime-settings")
+
+    def _check_theme_files():
+        with timed("theme checks"):
+            check_theme_files()
+
+    # the color scheme files are checked in the background to not block the plugin load
+    sublime.set_timeout_async(_check_theme_files)
+
     set_settings_on_change(
         settings,
         ["256color", "user_theme_colors",
          "user_light_theme_colors", "user_dark_theme_colors", "theme"],
         lambda _: sublime.active_window().run_command("terminus_generate_theme"))
 
+    # the 256 color scheme has to be regenerated when it is switched to or from the lazy mode
+    set_settings_on_change(
+        settings,
+        "lazy_color_scheme",
+        lambda _: sublime.active_window().run_command("terminus_generate_theme", {"force": True}))
+
     def check_update_theme(value):
         if settings.get("theme", "adaptive") == "adaptive":
             sublime.active_window().run_command("terminus_generate_theme")
@@ -217,4 +352,6 @@ def plugin_unloaded():
         settings,
         ["256color", "user_theme_colors",
          "user_light_theme_colors", "user_dark_theme_colors", "theme"], None)
+    set_settings_on_change(settings, "lazy_color_scheme", None)
     set_settings_on_change(preferences, "color_scheme", None)
+    truecolor_rules().remove()
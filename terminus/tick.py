@@ -0,0 +1,74 @@
+import sublime
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger('Terminus')
+
+
+class RenderTick:
+    """
+    Render the pending frames of all the terminals in one pass on the main thread. The
+    views are scrolled to their cursors at the end of the pass, at most once per view.
+    """
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # the terminals to be rendered and to be scrolled, in the order of the requests
+        self._render = {}
+        self._scroll = {}
+        self._scheduled = False
+        self._ticking = False
+
+    def schedule_render(self, terminal):
+        with self.lock:
+            self._render[terminal] = None
+            self._schedule()
+
+    def schedule_scroll(self, terminal):
+        with self.lock:
+            self._scroll[terminal] = None
+            self._schedule()
+
+    def _schedule(self):
+        if self._scheduled or self._ticking:
+            return
+        self._scheduled = True
+        sublime.set_timeout(self.tick)
+
+    def tick(self):
+        with self.lock:
+            self._scheduled = False
+            self._ticking = True
+            render = list(self._render)
+            self._render.clear()
+
+        startt = time.time()
+        try:
+            for terminal in render:
+                view = terminal.view
+                if view:
+                    view.run_command("terminus_render")
+
+            with self.lock:
+                scroll = list(self._scroll)
+                self._scroll.clear()
+            for terminal in scroll:
+                if terminal.view:
+                    terminal.scroll_to_cursor()
+        finally:
+            with self.lock:
+                self._ticking = False
+                if self._render or self._scroll:
+                    self._schedule()
+
+        logger.debug("render tick of {} terminal(s) takes {:.3f}s".format(
+            len(render), time.time() - startt))
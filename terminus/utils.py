@@ -1,5 +1,4 @@
 import time
-from wcwidth import wcwidth
 from functools import wraps
 from contextlib import contextmanager
 import shlex
@@ -85,6 +84,8 @@ def rev_wcwidth(text, width):
     """
     Given a text, return the location such that the substring has width `width`.
     """
+    from wcwidth import wcwidth
+
     if width == 0:
         return -1
 
@@ -3,23 +3,78 @@ import sublime_plugin
 
 import re
 
+from .utils import set_settings_on_change
+
+
+# the column limits of the terminals, they are cached because `view_size` is called by the
+# renderers periodically
+_column_limits = {}
+
+
+def get_column_limits():
+    if not _column_limits:
+        settings = sublime.load_settings("Terminus.sublime-settings")
+
+        def update(_=None):
+            _column_limits["min"] = settings.get("min_columns", 20)
+            _column_limits["max"] = settings.get("max_columns", 500)
+
+        update()
+        set_settings_on_change(settings, ["min_columns", "max_columns"], update)
+    return _column_limits["min"], _column_limits["max"]
+
+
+# view id -> (window, panel name) of the panel views, or None if the view is not a panel
+_panels = {}
+
+
+def register_panel(window, panel_name, view):
+    _panels[view.id()] = (window, panel_name)
+
+
+def unregister_panel(view):
+    _panels.pop(view.id(), None)
+
+
+def _find_panel(view):
+    """
+    Return (window, panel name) of the panel view, or None if the view is not a panel. The
+    cached entry is validated since the panel may have been destroyed.
+    """
+    vid = view.id()
+    if vid in _panels:
+        entry = _panels[vid]
+        if entry is None:
+            # a view cannot become a panel
+            return None
+        window, panel_name = entry
+        v = window.find_output_panel(panel_name)
+        if v and v.id() == vid:
+            return entry
+        # it may be removed by another thread
+        _panels.pop(vid, None)
 
-def get_panel_window(view):
     for w in sublime.windows():
         for panel in w.panels():
-            v = w.find_output_panel(panel.replace("output.", ""))
-            if v and v.id() == view.id():
-                return w
+            panel_name = panel.replace("output.", "")
+            v = w.find_output_panel(panel_name)
+            if v and v.id() == vid:
+                _panels[vid] = (w, panel_name)
+                return _panels[vid]
+
+    if view.is_valid():
+        _panels[vid] = None
     return None
 
 
+def get_panel_window(view):
+    entry = _find_panel(view)
+    return entry[0] if entry else None
+
+
 def get_panel_name(view):
-    for w in sublime.windows():
-        for panel in w.panels():
-            v = w.find_output_panel(panel.replace("output.", ""))
-            if v and v.id() == view.id():
-                return panel.replace("output.", "")
-    return None
+    entry = _find_panel(view)
+    return entry[1] if entry else None
 
 
 def panel_is_visible(view):
@@ -66,9 +121,7 @@ def view_size(view, default=None, force=None):
     if nb_columns == 1 and default:
         return default
 
-    settings = sublime.load_settings("Terminus.sublime-settings")
-    min_columns = settings.get("min_columns", 20)
-    max_columns = settings.get("max_columns", 500)
+    min_columns, max_columns = get_column_limits()
     if nb_columns < min_columns:
         nb_columns = min_columns
     elif nb_columns > max_columns:
@@ -0,0 +1,275 @@
+"""
+Minimal stand-ins for the `sublime` and `sublime_plugin` modules, so that the modules which
+import them can be tested without Sublime Text. Call `install()` before importing them.
+"""
+import os
+import sys
+import types
+
+
+class Region:
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return "Region({}, {})".format(self.a, self.b)
+
+
+class Settings(dict):
+    def __init__(self):
+        super().__init__()
+        self.callbacks = {}
+
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+    def set(self, key, value):
+        self[key] = value
+        self._changed()
+
+    def erase(self, key):
+        self.pop(key, None)
+        self._changed()
+
+    def has(self, key):
+        return key in self
+
+    def add_on_change(self, tag, callback):
+        self.callbacks.setdefault(tag, []).append(callback)
+
+    def clear_on_change(self, tag):
+        self.callbacks.pop(tag, None)
+
+    def _changed(self):
+        for callbacks in list(self.callbacks.values()):
+            for callback in callbacks:
+                callback()
+
+
+class View:
+    """
+    A view of plain text. The regions follow the edits of the text.
+    """
+    _next_id = 1
+
+    def __init__(self, text=""):
+        self.text = text
+        self.regions = {}
+        self._settings = Settings()
+        self._id = View._next_id
+        View._next_id += 1
+        self._window = None
+        self._valid = True
+
+    def id(self):
+        return self._id
+
+    def window(self):
+        return self._window
+
+    def is_valid(self):
+        return self._valid
+
+    def close(self):
+        if self._window and self in self._window._views:
+            self._window._views.remove(self)
+        self._window = None
+        self._valid = False
+
+    def settings(self):
+        return self._settings
+
+    def size(self):
+        return len(self.text)
+
+    def _line_starts(self):
+        starts = [0]
+        for i, c in enumerate(self.text):
+            if c == "\n":
+                starts.append(i + 1)
+        return starts
+
+    def rowcol(self, pt):
+        row = self.text.count("\n", 0, pt)
+        return row, pt - (self.text.rfind("\n", 0, pt) + 1)
+
+    def text_point(self, row, col):
+        starts = self._line_starts()
+        if row >= len(starts):
+            return len(self.text)
+        return min(starts[row] + col, len(self.text))
+
+    def line(self, x):
+        pt = x.begin() if isinstance(x, Region) else x
+        a = self.text.rfind("\n", 0, pt) + 1
+        b = self.text.find("\n", pt)
+        return Region(a, len(self.text) if b < 0 else b)
+
+    def lines(self, region):
+        lines = []
+        pt = self.line(region.begin()).begin()
+        while pt <= region.end() and pt <= len(self.text):
+            line = self.line(pt)
+            lines.append(line)
+            pt = line.end() + 1
+        return lines
+
+    def substr(self, x):
+        if isinstance(x, int):
+            return self.text[x:x + 1]
+        return self.text[x.begin():x.end()]
+
+    def _edit(self, a, b, s):
+        self.text = self.text[:a] + s + self.text[b:]
+        diff = len(s) - (b - a)
+
+        def move(pt, end):
+            # like Sublime Text, the text inserted at the end of a region is not added to it
+            if pt > b or pt == b and (a != b or not end):
+                return pt + diff
+            return min(pt, a + len(s))
+
+        for key, (regions, scope) in self.regions.items():
+            self.regions[key] = (
+                [Region(move(r.begin(), False), move(r.end(), not r.empty())) for r in regions],
+                scope)
+
+    def insert(self, edit, pt, s):
+        self._edit(pt, pt, s)
+        return len(s)
+
+    def replace(self, edit, region, s):
+        self._edit(region.begin(), region.end(), s)
+
+    def erase(self, edit, region):
+        self._edit(region.begin(), region.end(), "")
+
+    def add_regions(self, key, regions, scope="", *args, **kwargs):
+        self.regions[key] = (list(regions), scope)
+
+    def get_regions(self, key):
+        return self.regions.get(key, ([], ""))[0]
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+
+class Window:
+    """
+    A window of tab views and output panels.
+    """
+
+    def __init__(self):
+        self._views = []
+        self._panels = {}
+
+    def new_file(self):
+        view = View()
+        view._window = self
+        self._views.append(view)
+        return view
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self._views[-1] if self._views else None
+
+    def create_output_panel(self, name, unlisted=False):
+        view = self._panels.get(name)
+        if not view:
+            view = self._panels[name] = View()
+            view._window = self
+        return view
+
+    def find_output_panel(self, name):
+        return self._panels.get(name)
+
+    def destroy_output_panel(self, name):
+        view = self._panels.pop(name, None)
+        if view:
+            view._window = None
+            view._valid = False
+
+    def panels(self):
+        return ["output." + name for name in self._panels]
+
+
+def install():
+    """
+    Install the modules unless the real ones are available.
+    """
+    if "sublime" not in sys.modules:
+        sublime = types.ModuleType("sublime")
+        sublime.Region = Region
+        sublime.View = View
+        sublime.Window = Window
+        sublime.LAYOUT_INLINE = 0
+        sublime.HOVER_TEXT = 1
+        sublime.OP_EQUAL = 0
+        sublime.OP_NOT_EQUAL = 1
+        settings = {}
+        sublime.load_settings = lambda name: settings.setdefault(name, Settings())
+        sublime.set_timeout = lambda callback, delay=0: None
+        sublime.set_timeout_async = lambda callback, delay=0: None
+        sublime.windows = lambda: []
+        sublime.active_window = lambda: None
+        sublime.packages_path = lambda: ""
+        sublime.cache_path = lambda: ""
+        sublime.error_message = lambda message: None
+        sys.modules["sublime"] = sublime
+
+    if "sublime_plugin" not in sys.modules:
+        sublime_plugin = types.ModuleType("sublime_plugin")
+
+        class TextCommand:
+            def __init__(self, view):
+                self.view = view
+
+        class WindowCommand:
+            def __init__(self, window):
+                self.window = window
+
+        class ViewEventListener:
+            def __init__(self, view):
+                self.view = view
+
+        sublime_plugin.TextCommand = TextCommand
+        sublime_plugin.WindowCommand = WindowCommand
+        sublime_plugin.ApplicationCommand = type("ApplicationCommand", (), {})
+        sublime_plugin.EventListener = type("EventListener", (), {})
+        sublime_plugin.ViewEventListener = ViewEventListener
+        sublime_plugin.TextInputHandler = type("TextInputHandler", (), {})
+        sublime_plugin.ListInputHandler = type("ListInputHandler", (), {})
+        sys.modules["sublime_plugin"] = sublime_plugin
+
+    if "Default" not in sys.modules:
+        # the clipboard history of the Default package
+        default = types.ModuleType("Default")
+        paste_from_history = types.ModuleType("Default.paste_from_history")
+        paste_from_history.ClipboardHistory = type("ClipboardHistory", (), {})
+        default.paste_from_history = paste_from_history
+        sys.modules["Default"] = default
+        sys.modules["Default.paste_from_history"] = paste_from_history
+
+    if "Terminus" not in sys.modules:
+        # the package is imported by its name in Sublime Text
+        package = types.ModuleType("Terminus")
+        package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+        sys.modules["Terminus"] = package
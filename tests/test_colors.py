@@ -0,0 +1,112 @@
+import random
+import unittest
+
+from pyte.graphics import FG_BG_256
+
+from terminus.colors import PALETTE, RGB256, get_closest_color
+
+# the levels of the channels of the 6x6x6 color cube of xterm
+CUBE_LEVELS = (0x00, 0x5f, 0x87, 0xaf, 0xd7, 0xff)
+
+# (index, rgb) of the xterm 256 color palette, the corners and the middle of the cube and
+# the ends of the gray ramp
+XTERM_COLORS = [
+    (0, "000000"),
+    (1, "cd0000"),
+    (8, "7f7f7f"),
+    (12, "5c5cff"),
+    (15, "ffffff"),
+    (16, "000000"),
+    (21, "0000ff"),
+    (46, "00ff00"),
+    (67, "5f87af"),
+    (196, "ff0000"),
+    (208, "ff8700"),
+    (226, "ffff00"),
+    (231, "ffffff"),
+    (232, "080808"),
+    (243, "767676"),
+    (244, "808080"),
+    (255, "eeeeee"),
+]
+
+# (color, the closest color of the palette)
+CLOSEST_COLORS = [
+    ("010101", "000000"),
+    ("050505", "080808"),
+    ("7f7f80", "7f7f7f"),
+    ("ff0001", "ff0000"),
+    ("fefefe", "ffffff"),
+    ("5f87b0", "5f87af"),
+    ("c0c0c0", "bcbcbc"),
+    ("0000ee", "0000ee"),
+]
+
+
+def xterm_color(index):
+    """
+    The rgb of a color of the cube or the gray ramp by the xterm formulas.
+    """
+    if index < 232:
+        index -= 16
+        rgb = (CUBE_LEVELS[index // 36], CUBE_LEVELS[index // 6 % 6], CUBE_LEVELS[index % 6])
+    else:
+        rgb = (8 + 10 * (index - 232),) * 3
+    return "{:02x}{:02x}{:02x}".format(*rgb)
+
+
+def linear_closest_color(c):
+    r, g, b = (int(c[i:i + 2], 16) for i in (0, 2, 4))
+    dmin = 1000000
+    closest_color = "000000"
+    for c, (r2, g2, b2) in PALETTE:
+        redmean = (r + r2) / 2
+        d = (2 + redmean / 256) * (r - r2) ** 2 + 4 * \
+            (g - g2)**2 + (2 + (255-redmean) / 256) * (b - b2)**2
+        if d < dmin:
+            dmin = d
+            closest_color = c
+    return closest_color
+
+
+class TestPalette(unittest.TestCase):
+
+    def test_xterm_colors(self):
+        self.assertEqual(len(FG_BG_256), 256)
+        for index, rgb in XTERM_COLORS:
+            self.assertEqual(FG_BG_256[index], rgb, index)
+        for index in range(16, 256):
+            self.assertEqual(FG_BG_256[index], xterm_color(index), index)
+        for c in FG_BG_256:
+            self.assertEqual("{:02x}{:02x}{:02x}".format(*RGB256[c]), c)
+
+    def test_palette_colors(self):
+        for c in RGB256:
+            self.assertEqual(get_closest_color(c), c)
+
+
+class TestClosestColor(unittest.TestCase):
+
+    def test_table(self):
+        for c, closest in CLOSEST_COLORS:
+            self.assertEqual(get_closest_color(c), closest, c)
+            self.assertEqual(linear_closest_color(c), closest, c)
+
+    def test_cube_and_gray_ramp(self):
+        # the colors between the levels of the cube and the gray ramp
+        levels = sorted(set(CUBE_LEVELS + tuple(range(8, 256, 10))))
+        values = sorted(set(levels + [(a + b) // 2 for a, b in zip(levels, levels[1:])]))
+        for v in values:
+            for c in ("{:02x}{:02x}{:02x}".format(v, v, v),
+                      "{:02x}{:02x}{:02x}".format(v, 0x87, 255 - v)):
+                self.assertEqual(get_closest_color(c), linear_closest_color(c), c)
+
+    def test_random_colors(self):
+        rng = random.Random(256)
+        for _ in range(500):
+            c = "{:06x}".format(rng.getrandbits(24))
+            self.assertEqual(get_closest_color(c), linear_closest_color(c), c)
+
+
+if __name__ == "__main__":
+    unittest.main()
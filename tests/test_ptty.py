@@ -0,0 +1,220 @@
+import unittest
+from copy import copy
+
+from wcwidth import wcswidth
+
+from terminus.ptty import (
+    Char, Damage, HistoryLine, TerminalLine, TerminalScreen, TerminalStream, reflow_history)
+
+
+class Process:
+    def write(self, data):
+        pass
+
+
+def make_screen(columns, lines):
+    screen = TerminalScreen(
+        columns, lines, process=Process(), history=100,
+        clear_callback=lambda: None, reset_callback=lambda: None)
+    return screen, TerminalStream(screen)
+
+
+class TestHistoryLine(unittest.TestCase):
+
+    def test_combining_chars(self):
+        screen, stream = make_screen(20, 2)
+        stream.feed("ax́̂b X\x1b[31mred\x1b[0m\r\n\r\n")
+        line = screen.history[-1]
+        self.assertEqual(line.text, "ax́̂b Xred")
+        segments = [(text, fg) for text, _, _, fg, _, _ in line.segments()]
+        self.assertEqual(segments, [("ax́̂b X", "default"), ("red", "red")])
+
+
+def line_bounds(line):
+    """
+    The extent and the right of a line, computed from scratch.
+    """
+    extent = max(line, default=-1) + 1
+    right = max((x + 1 for x, char in line.items() if char.data.strip()), default=0)
+    return extent, right
+
+
+class TestTerminalLine(unittest.TestCase):
+
+    def assertBounds(self, line, extent, right):
+        self.assertEqual((line.extent, line.right), (extent, right))
+        self.assertEqual(line_bounds(line), (extent, right))
+        self.assertEqual(line.is_blank(), right == 0)
+
+    def test_set_and_remove(self):
+        line = TerminalLine(Char(" "))
+        self.assertBounds(line, 0, 0)
+        line[3] = Char("a")
+        line[7] = Char(" ")
+        self.assertBounds(line, 8, 4)
+        line[5] = Char("b")
+        self.assertBounds(line, 8, 6)
+        del line[7]
+        self.assertBounds(line, 6, 6)
+        line[5] = Char(" ")
+        self.assertBounds(line, 6, 4)
+        self.assertEqual(line.pop(5), Char(" "))
+        line.pop(9, None)
+        self.assertBounds(line, 4, 4)
+        line[3] = Char("")
+        self.assertBounds(line, 4, 0)
+        line.clear()
+        self.assertBounds(line, 0, 0)
+
+    def test_copy(self):
+        line = TerminalLine(Char(" "))
+        line[2] = Char("a")
+        line[4] = Char("b")
+        del line[4]
+        other = copy(line)
+        other[6] = Char("c")
+        self.assertBounds(other, 7, 7)
+        self.assertBounds(line, 3, 3)
+
+    def test_draw_past_extent(self):
+        screen, stream = make_screen(10, 2)
+        stream.feed("ab")
+        line = screen.buffer[0]
+        self.assertBounds(line, 2, 2)
+        stream.feed("\x1b[1;6Hc")
+        self.assertBounds(line, 6, 6)
+        stream.feed("\x1b[1;9H  ")
+        self.assertBounds(line, 10, 6)
+        stream.feed("\x1b[1;3H中")
+        self.assertBounds(line, 10, 6)
+        self.assertTrue(line.wide)
+
+    def test_erase_to_blank(self):
+        screen, stream = make_screen(10, 2)
+        stream.feed("abc  def")
+        line = screen.buffer[0]
+        self.assertBounds(line, 8, 8)
+        stream.feed("\x1b[1;8H\x1b[K")
+        self.assertBounds(line, 10, 7)
+        stream.feed("\x1b[1;6H\x1b[2X")
+        self.assertBounds(line, 10, 3)
+        stream.feed("\x1b[1;1H\x1b[3X")
+        self.assertBounds(line, 10, 0)
+        stream.feed("ab\x1b[2K")
+        self.assertBounds(line, 10, 0)
+
+    def test_insert_and_delete_characters(self):
+        screen, stream = make_screen(10, 2)
+        stream.feed("abcdef")
+        line = screen.buffer[0]
+        stream.feed("\x1b[1;2H\x1b[3@")
+        self.assertEqual("".join(line[x].data for x in range(10)), "a   bcdef ")
+        self.assertBounds(line, 10, 9)
+        stream.feed("\x1b[6@")
+        self.assertBounds(line, 10, 1)
+        stream.feed("\x1b[1;1H\x1b[P")
+        self.assertBounds(line, 10, 0)
+        stream.feed("\x1b[1;1Hxyz\x1b[1;2H\x1b[P")
+        self.assertEqual("".join(line[x].data for x in range(10)).rstrip(), "xz")
+        self.assertBounds(line, 10, 2)
+        stream.feed("\x1b[1;1H\x1b[5P")
+        self.assertBounds(line, 6, 0)
+
+
+class TestDamage(unittest.TestCase):
+
+    def test_merge_spans(self):
+        damage = Damage()
+        damage.mark(0, 2, 5)
+        damage.mark(0, 4, 8)
+        damage.mark(1, 2, 5)
+        damage.mark(1, 5, 7)
+        damage.mark(2, 6, 8)
+        damage.mark(2, 0, 2)
+        damage.mark(3, 3, 4)
+        damage.mark(3, 1, 6)
+        self.assertEqual(damage, {0, 1, 2, 3})
+        self.assertEqual(
+            [damage.span(y) for y in range(4)], [(2, 8), (2, 7), (0, 8), (1, 6)])
+
+    def test_whole_rows(self):
+        damage = Damage()
+        damage.mark(0, 2, 5)
+        damage.add(0)
+        damage.mark(0, 1, 3)
+        damage.update([1, 2])
+        damage.mark(2, 0, 1)
+        damage.mark(3, 0, 1)
+        self.assertEqual(damage, {0, 1, 2, 3})
+        self.assertEqual([damage.span(y) for y in range(4)], [None, None, None, (0, 1)])
+        damage.clear()
+        self.assertFalse(damage)
+        damage.mark(0, 4, 6)
+        self.assertEqual(damage.span(0), (4, 6))
+
+    def test_screen_spans(self):
+        screen, stream = make_screen(10, 3)
+        stream.feed("abcdef")
+        screen.take_frame()
+        stream.feed("\x1b[1;2HXY\x1b[1;6HZ\x1b[2;3H\x1b[K")
+        frame = screen.take_frame()
+        self.assertEqual({y: span for y, (_, _, span) in frame.dirty.items()}, {
+            0: (1, 6), 1: (2, 10)})
+
+
+class TestReflow(unittest.TestCase):
+
+    def test_double_width_chars(self):
+        screen, stream = make_screen(6, 4)
+        stream.feed("中文中中x")
+        screen.resize(4, 8)
+        rows = ["".join(screen.buffer[y][x].data for x in range(8)) for y in range(4)]
+        self.assertEqual(rows[0], "中文中中")
+        self.assertEqual(rows[1].rstrip(), "x")
+        self.assertTrue(all(wcswidth(row) == 8 for row in rows))
+
+    def test_history_keeps_continuation(self):
+        style = ("default", "default", False)
+        history = [
+            HistoryLine("abcd", ((0, 4, style),), False),
+            HistoryLine("efgh", ((0, 4, style),), True)]
+        lines = reflow_history(history, 3)
+        self.assertEqual([line.text for line in lines], ["abc", "d", "efg", "h"])
+        self.assertEqual([line.linefeed for line in lines], [True, False, True, True])
+
+    def test_history_double_width_pad(self):
+        red = ("red", "default", False)
+        history = [
+            HistoryLine("ab ", ((1, 2, red),), True),
+            HistoryLine("中x", ((0, 1, red),), False)]
+        lines = reflow_history(history, 6)
+        self.assertEqual([line.text for line in lines], ["ab中x"])
+        # the runs split by the rows are merged
+        self.assertEqual(lines[0].runs, ((1, 2, red),))
+        lines = reflow_history(lines, 3)
+        self.assertEqual([line.text for line in lines], ["ab ", "中x"])
+        self.assertEqual([line.runs for line in lines], [((1, 1, red),), ((0, 1, red),)])
+
+
+class TestFrame(unittest.TestCase):
+
+    def test_fold(self):
+        screen, _ = make_screen(10, 2)
+        style = ("default", "default", False)
+        frame = screen.take_frame()
+
+        def line(text):
+            return HistoryLine(text, ((0, len(text), style),), False)
+
+        frames = [
+            frame._replace(history=(line("a"),), images=(("x", {}, 0, 0),)),
+            frame._replace(history=(line("b"),), clear_scrollback=True),
+            frame._replace(history=(line("c"),), images=(("y", {}, 0, 0),))]
+        folded = frame._replace(history=(line("d"),)).fold(frames)
+        self.assertTrue(folded.clear_scrollback)
+        self.assertEqual([line.text for line in folded.history], ["b", "c", "d"])
+        self.assertEqual([image[0] for image in folded.images], ["y"])
+
+
+if __name__ == "__main__":
+    unittest.main()
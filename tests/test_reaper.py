@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import signal
+import threading
+import unittest
+from unittest import mock
+
+from terminus.reaper import ExitWatcher, Reaper, pidfd_open, poll, wait
+
+
+class Process:
+    """
+    A child process with the attributes of a pty process which are used by the reaper.
+    """
+
+    def __init__(self, script):
+        self.pid = os.posix_spawnp("sh", ["sh", "-c", script], os.environ)
+        self.terminated = False
+        self.exitstatus = None
+        self.signalstatus = None
+
+    def kill(self):
+        if poll(self):
+            os.kill(self.pid, signal.SIGKILL)
+            wait(self, 5)
+
+
+def spawn(test, script):
+    process = Process(script)
+    test.addCleanup(process.kill)
+    return process
+
+
+def has_pidfd():
+    fd = pidfd_open(os.getpid())
+    if fd is None:
+        return False
+    os.close(fd)
+    return True
+
+
+# the escalation with short delays
+ESCALATION = [
+    (signal.SIGHUP, 0.2),
+    (signal.SIGTERM, 0.2),
+    (signal.SIGKILL, 1)
+]
+
+
+@unittest.skipIf(sys.platform.startswith("win"), "the signals are not used on Windows")
+@mock.patch("terminus.reaper.ESCALATION", ESCALATION)
+class TestReaper(unittest.TestCase):
+
+    def terminate(self, process, timeout=5):
+        startt = time.time()
+        Reaper().terminate(process)
+        self.assertTrue(wait(process, timeout))
+        return time.time() - startt
+
+    def test_sighup(self):
+        process = spawn(self, "exec sleep 30")
+        self.terminate(process)
+        self.assertEqual((process.exitstatus, process.signalstatus), (None, signal.SIGHUP))
+        self.assertFalse(poll(process))
+
+    def test_stopped_process(self):
+        process = spawn(self, "exec sleep 30")
+        os.kill(process.pid, signal.SIGSTOP)
+        self.terminate(process)
+        self.assertEqual(process.signalstatus, signal.SIGHUP)
+
+    def test_sigterm(self):
+        process = spawn(self, "trap '' HUP; exec sleep 30")
+        # wait for the trap to be set
+        time.sleep(0.3)
+        elapsed = self.terminate(process)
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertEqual(process.signalstatus, signal.SIGTERM)
+
+    def test_sigkill(self):
+        process = spawn(self, "trap '' HUP TERM; exec sleep 30")
+        time.sleep(0.3)
+        elapsed = self.terminate(process)
+        self.assertGreaterEqual(elapsed, 0.4)
+        self.assertEqual(process.signalstatus, signal.SIGKILL)
+
+    def test_parallel(self):
+        processes = [spawn(self, "trap '' HUP TERM; exec sleep 30") for _ in range(3)]
+        time.sleep(0.3)
+        reaper = Reaper()
+        startt = time.time()
+        for process in processes:
+            reaper.terminate(process)
+            # a process is terminated once
+            reaper.terminate(process)
+        for process in processes:
+            self.assertTrue(wait(process, 5))
+            self.assertEqual(process.signalstatus, signal.SIGKILL)
+        # the processes are signaled at the same time, not one after another
+        self.assertLess(time.time() - startt, 1.2)
+
+    def test_exited_process(self):
+        process = spawn(self, "exit 2")
+        self.assertTrue(wait(process, 5))
+        Reaper().terminate(process)
+        self.assertEqual((process.exitstatus, process.signalstatus), (2, None))
+
+
+@unittest.skipIf(sys.platform.startswith("win"), "the exits are not watched on Windows")
+class TestExitWatcher(unittest.TestCase):
+
+    def watch(self, watcher, process):
+        exited = threading.Event()
+        statuses = []
+
+        def callback():
+            statuses.append((process.exitstatus, process.signalstatus))
+            exited.set()
+
+        watcher.watch(process, callback)
+        return exited, statuses
+
+    def check_exits(self, watcher):
+        first = spawn(self, "sleep 0.2; exit 3")
+        second = spawn(self, "exec sleep 30")
+        first_exited, first_statuses = self.watch(watcher, first)
+        second_exited, second_statuses = self.watch(watcher, second)
+        self.assertTrue(first_exited.wait(5))
+        self.assertEqual(first_statuses, [(3, None)])
+        self.assertFalse(second_exited.is_set())
+
+        Reaper().terminate(second)
+        self.assertTrue(second_exited.wait(5))
+        self.assertEqual(second_statuses, [(None, signal.SIGHUP)])
+
+        # the thread exits once there is nothing to watch
+        deadline = time.time() + 5
+        while watcher._thread and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(watcher._thread)
+
+    @unittest.skipUnless(has_pidfd(), "pidfds are not supported")
+    def test_pidfd(self):
+        watcher = ExitWatcher()
+        self.check_exits(watcher)
+        self.assertFalse(watcher._polled)
+        self.assertFalse(watcher._pidfds)
+
+    def test_polled(self):
+        watcher = ExitWatcher()
+        watcher.period = 0.02
+        with mock.patch("terminus.reaper.pidfd_open", return_value=None):
+            self.check_exits(watcher)
+        self.assertFalse(watcher._pidfds)
+
+    def test_reaped_process(self):
+        process = spawn(self, "exit 4")
+        self.assertTrue(wait(process, 5))
+        exited, statuses = self.watch(ExitWatcher(), process)
+        self.assertTrue(exited.wait(5))
+        self.assertEqual(statuses, [(4, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import types
+import unittest
+
+from . import mock_sublime
+mock_sublime.install()
+
+import sublime  # noqa: E402
+
+from terminus.const import CONTINUATION  # noqa: E402
+from terminus.ptty import TerminalScreen, TerminalStream  # noqa: E402
+from terminus.render import TerminusRenderCommand  # noqa: E402
+from terminus.scheme import color256_rules, truecolor_rules  # noqa: E402
+
+
+def make_render(lines, regions):
+    view = mock_sublime.View("\n".join(lines))
+    render = TerminusRenderCommand(view)
+    for line, start, end, scope in regions:
+        render.add_colored_region(line, start, end, scope)
+    return view, render
+
+
+def colored_text(view, render):
+    return sorted(
+        (line, view.substr(view.get_regions(key)[0]), scope)
+        for line, colored in render.colored_lines.items()
+        for key, _, _, scope in colored)
+
+
+class TestReflowScrollback(unittest.TestCase):
+
+    def test_rewrap(self):
+        view, render = make_render(
+            ["abcdef" + CONTINUATION, "ghij", "xy", "中文中" + CONTINUATION, "文", "screen"],
+            [
+                (0, 4, 6, "terminus.red.default"),
+                (1, 0, 2, "terminus.red.default"),
+                (2, 0, 1, "terminus.blue.default"),
+                (5, 0, 1, "terminus.green.default")])
+        terminal = types.SimpleNamespace(offset=5)
+        render.reflow_scrollback(None, terminal, 4)
+        self.assertEqual(view.text.split("\n"), [
+            "abcd" + CONTINUATION, "efgh" + CONTINUATION, "ij", "xy",
+            "中文" + CONTINUATION, "中文", "screen"])
+        self.assertEqual(terminal.offset, 6)
+        self.assertEqual(colored_text(view, render), [
+            (1, "efgh", "terminus.red.default"),
+            (3, "x", "terminus.blue.default"),
+            (6, "s", "terminus.green.default")])
+        self.assertEqual(render.region_count, 3)
+
+    def test_unchanged(self):
+        lines = ["abc" + CONTINUATION, "d", "ef", "screen"]
+        view, render = make_render(lines, [(2, 0, 1, "terminus.red.default")])
+        terminal = types.SimpleNamespace(offset=3)
+        render.reflow_scrollback(None, terminal, 3)
+        self.assertEqual(view.text.split("\n"), lines)
+        self.assertEqual(colored_text(view, render), [(2, "e", "terminus.red.default")])
+
+    def test_double_width_pad(self):
+        view, render = make_render(["ab " + CONTINUATION, "中x", "screen"], [])
+        terminal = types.SimpleNamespace(offset=2)
+        render.reflow_scrollback(None, terminal, 6)
+        self.assertEqual(view.text.split("\n"), ["ab中x", "screen"])
+        render.reflow_scrollback(None, terminal, 3)
+        self.assertEqual(view.text.split("\n"), ["ab " + CONTINUATION, "中x", "screen"])
+
+
+class Process:
+    def write(self, data):
+        pass
+
+
+class TestUpdateLineSpan(unittest.TestCase):
+
+    def render_screen(self, columns, data):
+        """
+        Render the screen after `data` is fed, return the view, the renderer and the stream.
+        """
+        screen = TerminalScreen(
+            columns, 2, process=Process(), history=100,
+            clear_callback=lambda: None, reset_callback=lambda: None)
+        stream = TerminalStream(screen)
+        stream.feed(data)
+        view, render = make_render([], [])
+        for y, (buffer_line, lf, _) in screen.take_frame().dirty.items():
+            render.update_line(None, y, buffer_line, lf)
+        return view, render, stream
+
+    def assertSpanUpdate(self, columns, data, update, span, updated=True):
+        view, render, stream = self.render_screen(columns, data)
+        stream.feed(update)
+        frame = stream.listener.take_frame()
+        buffer_line, lf, dirty_span = frame.dirty[0]
+        self.assertEqual(dirty_span, span)
+        self.assertEqual(render.update_line_span(None, 0, buffer_line, lf, span), updated)
+        if not updated:
+            return
+        expected_view, expected_render, _ = self.render_screen(columns, data + update)
+        # the trailing blanks without colors are not compared, they are padded differently
+        self.assertEqual(
+            [line.rstrip() for line in view.text.split("\n")],
+            [line.rstrip() for line in expected_view.text.split("\n")])
+        self.assertEqual(
+            colored_text(view, render), colored_text(expected_view, expected_render))
+        self.assertEqual(render.region_count, expected_render.region_count)
+
+    def test_in_place(self):
+        self.assertSpanUpdate(
+            20, "ab\x1b[31mcdef\x1b[0mgh\r\nxy", "\x1b[1;4H\x1b[32mXY", (3, 5))
+
+    def test_tail(self):
+        self.assertSpanUpdate(20, "abc\x1b[31mdef\x1b[0m", "\x1b[1;5H\x1b[K", (4, 20))
+        self.assertSpanUpdate(20, "abc", "\x1b[1;6H\x1b[44mxy", (5, 7))
+
+    def test_overlapping_regions(self):
+        self.assertSpanUpdate(
+            20, "a\x1b[31mbcdefg\x1b[0mh", "\x1b[1;4H\x1b[31;1mX", (3, 4))
+
+    def test_full_line_fallback(self):
+        # the double width chars and the wrapped lines are rendered as whole lines
+        self.assertSpanUpdate(10, "中文ab", "\x1b[1;6HX", (5, 6), updated=False)
+        self.assertSpanUpdate(
+            4, "abcdef", "\x1b[1;2HX", (1, 2), updated=False)
+
+
+class TestScopeRules(unittest.TestCase):
+
+    def make_render(self, **settings):
+        terminus_settings = sublime.load_settings("Terminus.sublime-settings")
+        for key, value in settings.items():
+            terminus_settings.set(key, value)
+            self.addCleanup(terminus_settings.erase, key)
+        return TerminusRenderCommand(mock_sublime.View())
+
+    def test_truecolor(self):
+        render = self.make_render(truecolor=True)
+        # a 24-bit color in the palette has no 256 color rule without the 256 color scheme
+        self.assertIs(render.scope_rules("terminus.ff0000.default"), truecolor_rules())
+        self.assertIs(render.scope_rules("terminus.red.123456"), truecolor_rules())
+        self.assertIsNone(render.scope_rules("terminus.red.default"))
+
+    def test_256color(self):
+        render = self.make_render(truecolor=True, **{"256color": True})
+        self.assertIsNone(render.scope_rules("terminus.ff0000.default"))
+        self.assertIs(render.scope_rules("terminus.123457.default"), truecolor_rules())
+
+    def test_lazy_color_scheme(self):
+        render = self.make_render(lazy_color_scheme=True, **{"256color": True})
+        self.assertIs(render.scope_rules("terminus.ff0000.red"), color256_rules())
+        self.assertIsNone(render.scope_rules("terminus.red.default"))
+        self.assertIsNone(render.scope_rules("terminus.123457.default"))
+
+    def test_settings_change(self):
+        render = self.make_render(**{"256color": True})
+        self.assertIsNone(render.scope_rules("terminus.ff0000.default"))
+        self.make_render(truecolor=True)
+        render.load_settings()
+        self.assertIsNone(render.scope_rules("terminus.ff0000.default"))
+        sublime.load_settings("Terminus.sublime-settings").erase("256color")
+        render.load_settings()
+        self.assertIs(render.scope_rules("terminus.ff0000.default"), truecolor_rules())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import base64
+import unittest
+
+from pyte import modes as mo
+
+from terminus.engine import decode_snapshot
+from terminus.ptty import TerminalScreen, TerminalStream
+from terminus.snapshot import (
+    SnapshotError, decode_screen, decode_scrollback, encode_screen, encode_scrollback)
+
+
+class Process:
+    def write(self, data):
+        pass
+
+
+def make_screen(columns, lines):
+    screen = TerminalScreen(
+        columns, lines, process=Process(), history=100,
+        clear_callback=lambda: None, reset_callback=lambda: None)
+    return screen, TerminalStream(screen)
+
+
+def screen_state(screen):
+    cursor = screen.cursor
+    return (
+        screen.lines, screen.columns,
+        {y: dict(line) for y, line in screen.buffer.items() if line},
+        (cursor.x, cursor.y, cursor.hidden, cursor.attrs),
+        screen.mode, screen.margins, screen.title, screen.icon_name,
+        list(screen.history))
+
+
+class TestScreenSnapshot(unittest.TestCase):
+
+    def test_round_trip(self):
+        screen, stream = make_screen(10, 4)
+        stream.feed("".join("line{}\r\n".format(i) for i in range(6)))
+        stream.feed("\x1b[1;31mred\x1b[0m 中文\r\n\x1b[7mrev\x1b[42m")
+        stream.feed("\x1b]0;title\x07\x1b]01;icon\x07\x1b[?25l\x1b[?7l\x1b[2;3r\x1b[4;5H")
+        self.assertTrue(screen.history)
+
+        restored, _ = make_screen(3, 2)
+        decode_screen(encode_screen(screen), restored)
+        self.assertEqual(screen_state(restored), screen_state(screen))
+        self.assertNotIn(mo.DECAWM, restored.mode)
+        self.assertEqual((restored.title, restored.icon_name), ("title", "icon"))
+        self.assertEqual(restored.dirty, set(range(4)))
+
+    def test_history(self):
+        screen, stream = make_screen(10, 3)
+        stream.feed("abc\r\ndef")
+        other, other_stream = make_screen(10, 3)
+        other_stream.feed("\x1b[32mx\x1b[0m\r\n" * 5)
+        self.assertTrue(other.history)
+        restored, _ = make_screen(10, 3)
+        decode_screen(encode_screen(screen, history=other.history), restored)
+        self.assertEqual(list(restored.history), list(other.history))
+
+    def test_attach_frame(self):
+        screen, stream = make_screen(10, 3)
+        stream.feed("a\r\nb\r\nc\r\n\x1b[31md\x1b]0;title\x07")
+        data = base64.b64encode(encode_screen(screen)).decode("ascii")
+        frame = decode_snapshot(data)
+        self.assertTrue(frame.clear_scrollback)
+        self.assertEqual([line.text for line in frame.history], ["a"])
+        self.assertEqual((frame.lines, frame.columns), (3, 10))
+        self.assertEqual(sorted(frame.dirty), [0, 1, 2])
+        self.assertEqual(frame.dirty[2][0][0], screen.buffer[2][0])
+        self.assertEqual((frame.cursor, frame.title), ((1, 2, False), "title"))
+
+    def test_alternate_screen(self):
+        screen, stream = make_screen(10, 3)
+        stream.feed("primary\r\n")
+        primary = screen_state(screen)
+        stream.feed("\x1b[?1049h\x1b[31malternate")
+        self.assertTrue(screen.alternate_buffer_mode)
+
+        restored, _ = make_screen(10, 3)
+        decode_screen(encode_screen(screen), restored)
+        self.assertFalse(restored.alternate_buffer_mode)
+        self.assertEqual(screen_state(restored)[2:4], primary[2:4])
+
+    def test_unknown_format(self):
+        data = encode_scrollback([])
+        screen, _ = make_screen(10, 3)
+        with self.assertRaises(SnapshotError):
+            decode_screen(data, screen)
+        with self.assertRaises(SnapshotError):
+            decode_screen(data[:4], screen)
+
+
+class TestScrollbackSnapshot(unittest.TestCase):
+
+    def test_round_trip(self):
+        lines = [
+            ("plain", []),
+            ("red 中文", [(0, 3, "terminus.red.default"), (4, 6, "terminus.default.red")]),
+            ("", [])]
+        self.assertEqual(decode_scrollback(encode_scrollback(lines)), lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+from unittest import mock
+
+from . import mock_sublime
+mock_sublime.install()
+
+import sublime  # noqa: E402
+
+from terminus import view as terminus_view  # noqa: E402
+from terminus.commands import TerminusCloseCommand  # noqa: E402
+from terminus.event_listeners import TerminusCoreEventListener  # noqa: E402
+from terminus.terminal import Terminal  # noqa: E402
+
+
+class Process:
+    """
+    An exited pty process, the reaper leaves it alone.
+    """
+    pid = 0
+    terminated = True
+    exitstatus = 0
+    signalstatus = None
+
+    def write(self, data):
+        pass
+
+
+class TestRegistries(unittest.TestCase):
+
+    def setUp(self):
+        for name, value in (
+                ("_terminals", {}), ("_detached_terminals", []), ("_tags", {})):
+            patcher = mock.patch.object(Terminal, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patchers = [
+            mock.patch.object(terminus_view, "_panels", {}),
+            mock.patch("terminus.ptty.TerminalPtyProcess.spawn", return_value=Process()),
+            mock.patch.object(Terminal, "_start_rendering"),
+            mock.patch.object(Terminal, "is_hosted", return_value=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        settings = sublime.load_settings("Terminus.sublime-settings")
+        settings.set("size", [24, 80])
+        self.addCleanup(settings.erase, "size")
+
+        self.window = sublime.Window()
+        patcher = mock.patch("sublime.windows", return_value=[self.window])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start(self, view, tag="build", **kwargs):
+        if view:
+            view.settings().set("terminus_view", True)
+        terminal = Terminal(view)
+        terminal.start(["sh"], env={}, tag=tag, **kwargs)
+        return terminal
+
+    def assertEmpty(self):
+        self.assertEqual(Terminal._terminals, {})
+        self.assertEqual(Terminal._detached_terminals, [])
+        self.assertEqual(Terminal._tags, {})
+
+    def test_kill(self):
+        view = self.window.new_file()
+        terminal = self.start(view)
+        other = self.start(self.window.new_file())
+        self.assertIs(Terminal.from_id(view.id()), terminal)
+        self.assertEqual(Terminal._tags, {"build": [terminal, other]})
+
+        terminal.kill()
+        self.assertIsNone(Terminal.from_id(view.id()))
+        self.assertIs(Terminal.from_tag("build", current_window_only=False), other)
+        other.kill()
+        self.assertEmpty()
+
+    def test_detach(self):
+        view = self.window.new_file()
+        terminal = self.start(view)
+        terminal.detach_view()
+        # the tag is kept for the terminal to be attached again
+        self.assertEqual(Terminal._terminals, {})
+        self.assertEqual(Terminal._detached_terminals, [terminal])
+        self.assertIsNone(Terminal.from_tag("build", current_window_only=False))
+
+        other_view = self.window.new_file()
+        terminal.attach_view(other_view)
+        self.assertIs(Terminal.from_id(other_view.id()), terminal)
+        self.assertEqual(Terminal._detached_terminals, [])
+        self.assertIs(Terminal.from_tag("build", current_window_only=False), terminal)
+
+        terminal.detach_view()
+        terminal.kill()
+        self.assertEmpty()
+
+    def test_detached_start(self):
+        self.window.new_file()
+        with mock.patch("sublime.active_window", return_value=self.window):
+            terminal = self.start(None)
+        self.assertEqual(Terminal._detached_terminals, [terminal])
+        terminal.kill()
+        self.assertEmpty()
+
+    def test_close_view(self):
+        view = self.window.new_file()
+        self.start(view)
+        # a tab view is not a panel
+        self.assertIsNone(terminus_view.get_panel_window(view))
+        self.assertEqual(terminus_view._panels, {view.id(): None})
+
+        listener = TerminusCoreEventListener()
+        TerminusCloseCommand(view).run(None)
+        listener.on_pre_close(view)
+        listener.on_close(view)
+        self.assertFalse(view.is_valid())
+        self.assertEmpty()
+        self.assertEqual(terminus_view._panels, {})
+
+    def test_close_panel(self):
+        view = self.window.create_output_panel("Terminus")
+        terminus_view.register_panel(self.window, "Terminus", view)
+        self.start(view, show_in_panel=True, panel_name="Terminus")
+        self.assertIs(terminus_view.get_panel_window(view), self.window)
+
+        TerminusCloseCommand(view).run(None)
+        self.assertIsNone(self.window.find_output_panel("Terminus"))
+        self.assertEmpty()
+        self.assertEqual(terminus_view._panels, {})
+
+    def test_destroyed_panel(self):
+        view = self.window.create_output_panel("Terminus")
+        terminus_view.register_panel(self.window, "Terminus", view)
+        self.window.destroy_output_panel("Terminus")
+        # the stale entry is dropped when the panel is looked up
+        self.assertIsNone(terminus_view.get_panel_name(view))
+        self.assertEqual(terminus_view._panels, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
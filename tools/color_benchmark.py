@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from terminus.colors import get_closest_color, RGB256  # noqa: E402
+
+
+def linear_closest_color(c):
+    """
+    The full scan over the palette which `get_closest_color` replaces.
+    """
+    r, g, b = tuple(int(c[i:i+2], 16) for i in (0, 2, 4))
+    dmin = 1000000
+    closest_color = "000000"
+    for c, (r2, g2, b2) in RGB256.items():
+        redmean = (r + r2) / 2
+        d = (2 + redmean / 256) * (r - r2) ** 2 + 4 * \
+            (g - g2)**2 + (2 + (255-redmean) / 256) * (b - b2)**2
+        if d < dmin:
+            dmin = d
+            closest_color = c
+    return closest_color
+
+
+def sweep(step):
+    """
+    Maps every `step`-th 24-bit color, returns the number of colors and the time taken.
+    """
+    n = 0
+    startt = time.time()
+    for r in range(0, 256, step):
+        for g in range(0, 256, step):
+            for b in range(0, 256, step):
+                get_closest_color("{:02x}{:02x}{:02x}".format(r, g, b))
+                n += 1
+    return n, time.time() - startt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark 24-bit color approximation")
+    parser.add_argument(
+        "--step", type=int, default=1, help="channel step of the sweep, 1 for all 16M colors")
+    parser.add_argument(
+        "--samples", type=int, default=20000,
+        help="number of random colors compared against a full scan")
+    args = parser.parse_args()
+
+    colors = ["{:06x}".format(random.randrange(1 << 24)) for _ in range(args.samples)]
+
+    startt = time.time()
+    expected = [linear_closest_color(c) for c in colors]
+    linear = time.time() - startt
+
+    startt = time.time()
+    actual = [get_closest_color(c) for c in colors]
+    cold = time.time() - startt
+
+    mismatches = sum(1 for u, v in zip(expected, actual) if u != v)
+    print("random {} colors: full scan {:.3f}s, cube {:.3f}s, {} mismatch(es)".format(
+        args.samples, linear, cold, mismatches))
+
+    n, elapsed = sweep(args.step)
+    print("sweep {} colors: {:.3f}s, {:.3f}us per color".format(n, elapsed, elapsed / n * 1e6))
+
+    n, elapsed = sweep(args.step)
+    print("sweep {} colors again: {:.3f}s, {:.3f}us per color".format(
+        n, elapsed, elapsed / n * 1e6))
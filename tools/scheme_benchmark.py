@@ -0,0 +1,106 @@
+"""
+Benchmark the full and the lazy 256 color schemes.
+
+Run it from the command line to measure the generation of the schemes, or run it in the
+Sublime Text console to measure a terminal view with the current settings, i.e. the time
+until the view is open and until the colors of its first colored frame are resolved:
+
+    exec(open("/path/to/Terminus/tools/scheme_benchmark.py").read())
+
+Toggle "lazy_color_scheme" and run it again to compare.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+try:
+    import sublime
+except ImportError:
+    sublime = None
+
+if sublime:
+    from Terminus.terminus.terminal import Terminal
+    from Terminus.tools.theme_generator import (
+        generate_theme_file, ANSI_COLORS, DEFAULT_BACKGROUND)
+else:
+    sys.path.insert(0, os.path.dirname(__file__))
+    from theme_generator import generate_theme_file, ANSI_COLORS, DEFAULT_BACKGROUND
+import pyte  # noqa: E402
+
+# the time in seconds to wait for the colors of a view to be resolved
+VIEW_TIMEOUT = 20
+
+
+def measure(path, **kwargs):
+    """
+    Generates a color scheme, returns the time taken and the file size.
+    """
+    startt = time.time()
+    generate_theme_file(path, background=DEFAULT_BACKGROUND, pretty=False, **kwargs)
+    return time.time() - startt, os.path.getsize(path)
+
+
+def measure_view(window, pairs=100):
+    """
+    Open a terminal which prints `pairs` random 256 color pairs, reports the time until its
+    view shows the first frame and until the scopes of the pairs are colored.
+    """
+    tag = "scheme_benchmark_{}".format(random.getrandbits(32))
+    indexes = [(random.randrange(16, 256), random.randrange(16, 256)) for _ in range(pairs)]
+    text = "".join("\\033[38;5;{};48;5;{}mX".format(fg, bg) for fg, bg in indexes)
+    colors = pyte.graphics.FG_BG_256
+    scopes = {
+        "terminus.{}.{}".format(colors[fg], colors[bg]): "#" + colors[fg]
+        for fg, bg in indexes}
+    startt = time.time()
+    window.run_command("terminus_open", {
+        "cmd": ["printf", text + "\\033[0m\\n"], "title": "Scheme Benchmark", "tag": tag,
+        "auto_close": False})
+    times = []
+
+    def poll():
+        elapsed = time.time() - startt
+        terminal = Terminal.from_tag(tag, current_window_only=False)
+        view = terminal.view if terminal else None
+        if not times and view and terminal.frame:
+            times.append(elapsed)
+            print("view open: {:.3f}s".format(elapsed))
+        if times:
+            resolved = sum(
+                1 for scope, color in scopes.items()
+                if view.style_for_scope(scope).get("foreground", "").lower() == color)
+            if resolved == len(scopes):
+                print("first colored frame with {} pairs: {:.3f}s".format(len(scopes), elapsed))
+                view.close()
+                return
+        if elapsed > VIEW_TIMEOUT:
+            print("the colors are not resolved after {}s".format(VIEW_TIMEOUT))
+            return
+        sublime.set_timeout(poll, 5)
+
+    sublime.set_timeout(poll, 5)
+
+
+if sublime:
+    measure_view(sublime.active_window())
+elif __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark full and lazy 256 color schemes")
+    parser.add_argument(
+        "--pairs", type=int, default=500, help="number of 256 color pairs in use")
+    args = parser.parse_args()
+
+    colors = ANSI_COLORS + ["default"] + pyte.graphics.FG_BG_256
+    pairs = set()
+    while len(pairs) < args.pairs:
+        pairs.add((random.choice(colors), random.choice(pyte.graphics.FG_BG_256)))
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "Terminus.hidden-color-scheme")
+        elapsed, size = measure(path, ansi_scopes=True, color256_scopes=True)
+        print("full scheme: {:.3f}s, {:.1f}KB".format(elapsed, size / 1024))
+        elapsed, size = measure(path, ansi_scopes=True, color256_scopes=False, pairs=list(pairs))
+        print("lazy scheme with {} pairs: {:.3f}s, {:.1f}KB".format(
+            len(pairs), elapsed, size / 1024))
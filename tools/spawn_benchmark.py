@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ptyprocess import PtyProcess  # noqa: E402
+from terminus.ptty import TerminalPtyProcess  # noqa: E402
+
+
+def wait(process):
+    try:
+        while True:
+            process.read(1024)
+    except EOFError:
+        pass
+    process.wait()
+    # closing takes a while, keep it out of the timings
+    process.close()
+
+
+def benchmark(spawn, n, cmd, cwd):
+    """
+    Returns the average and the maximum time in ms of `spawn`.
+    """
+    timings = []
+    for _ in range(n):
+        startt = time.perf_counter()
+        process = spawn(cmd, cwd=cwd, env=dict(os.environ), dimensions=(24, 80))
+        timings.append(time.perf_counter() - startt)
+        wait(process)
+    return sum(timings) / n * 1000, max(timings) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark pty spawn latency")
+    parser.add_argument("-n", type=int, default=50, help="number of spawns")
+    parser.add_argument(
+        "--memory", type=int, default=500,
+        help="MB of memory allocated by this process to mimic a large plugin host")
+    parser.add_argument("--cwd", default=None, help="working directory of the process")
+    args = parser.parse_args()
+
+    # touch the pages so that they have to be mapped by fork
+    ballast = bytearray(args.memory * 1024 * 1024)
+    for i in range(0, len(ballast), 4096):
+        ballast[i] = 1
+
+    cmd = ["true"]
+    for name, spawn in [
+            ("fork (ptyprocess)", PtyProcess.spawn),
+            ("posix_spawn", TerminalPtyProcess.posix_spawn)]:
+        average, maximum = benchmark(spawn, args.n, cmd, args.cwd)
+        print("{:<20} average {:.2f}ms, max {:.2f}ms".format(name, average, maximum))
@@ -1,6 +1,5 @@
 import os
 import json
-import pyte
 from copy import deepcopy
 from collections import OrderedDict
 
@@ -44,9 +43,41 @@ ANSI_COLORS = [
 ]
 
 
+def color_rule(u, v, background=None):
+    """
+    Returns the rule of the scope "terminus.{u}.{v}". The colors are either the names of the
+    ansi colors, "default", "reverse_default" or hex values without the leading "#".
+    """
+    if u in ANSI_COLORS:
+        ucolor = "var({})".format(u)
+    elif u == "default":
+        ucolor = "var(foreground)"
+    elif u == "reverse_default":
+        ucolor = "var(background)"
+    else:
+        ucolor = "#{}".format(u)
+    if v in ANSI_COLORS:
+        vcolor = "var({})".format(v)
+    elif v == "default":
+        vcolor = "var(background)"
+    elif v == "reverse_default":
+        vcolor = "var(foreground)"
+    else:
+        vcolor = "#{}".format(v)
+        if vcolor == background:
+            vcolor = next_color(vcolor)
+    rule = OrderedDict()
+    rule["scope"] = "terminus.{}.{}".format(u, v)
+    rule["foreground"] = ucolor
+    rule["background"] = vcolor
+    return rule
+
+
 def generate_theme_file(
         path, variables={}, globals={}, ansi_scopes=True, color256_scopes=False,
-        background=None, pretty=True):
+        background=None, pretty=True, pairs=None):
+    import pyte
+
     COLOR_SCHEME = deepcopy(TEMPLATE)
 
     _colors16 = OrderedDict()
@@ -93,35 +124,26 @@ def generate_theme_file(
     if colors:
         COLOR_SCHEME["rules"] = []
 
-    for u, ucolor in colors.items():
-        for v, vcolor in colors.items():
-            if u in ANSI_COLORS:
-                ucolor = "var({})".format(u)
-            elif ucolor == "#default":
-                ucolor = "var(foreground)"
-            elif ucolor == "#reverse_default":
-                ucolor = "var(background)"
-            if v in ANSI_COLORS:
-                vcolor = "var({})".format(v)
-            elif vcolor == "#default":
-                vcolor = "var(background)"
-            elif vcolor == "#reverse_default":
-                vcolor = "var(foreground)"
-            elif vcolor == background:
-                vcolor = next_color(vcolor)
-            rule = {}
-            rule["scope"] = "terminus.{}.{}".format(u, v)
-            rule["foreground"] = ucolor
-            rule["background"] = vcolor
-            COLOR_SCHEME["rules"].append(rule)
+    for u in colors:
+        for v in colors:
+            COLOR_SCHEME["rules"].append(color_rule(u, v, background))
+
+    if pairs:
+        if "rules" not in COLOR_SCHEME:
+            COLOR_SCHEME["rules"] = []
+        for u, v in pairs:
+            COLOR_SCHEME["rules"].append(color_rule(u, v, background))
 
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
+    # write to a temporary file first so that the color scheme is never read half written
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
         if pretty:
             f.write(json.dumps(COLOR_SCHEME, indent=4))
             f.write("\n")
         else:
             f.write(json.dumps(COLOR_SCHEME))
+    os.replace(temp_path, path)
 
 
 if __name__ == "__main__":